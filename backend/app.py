@@ -1,9 +1,11 @@
+import functools
+import json
 import os
 import re
-from flask import Flask, request, jsonify
+from datetime import datetime
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
-from ipo_readiness.services.parser_thai import parse_financial_files
-from ipo_readiness.services.metrics_engine import compute_metrics
+from werkzeug.middleware.proxy_fix import ProxyFix
 from ipo_readiness.services.user_service import (
     init_user_store,
     create_user,
@@ -11,12 +13,28 @@ from ipo_readiness.services.user_service import (
     authenticate_user,
     update_user,
     delete_user,
+    get_user,
+    parse_user_import,
+    import_users,
 )
 from ipo_readiness.services.audit_service import (
     init_audit_store,
-    log_action,
+    enqueue_action,
     list_logs,
+    search_logs,
+    iter_logs,
+    AUDIT_EXPORT_COLUMNS,
 )
+from ipo_readiness.services.audit_archive_service import (
+    init_audit_archive_store,
+    start_audit_maintenance,
+    run_audit_retention,
+    list_archives,
+    read_archived_logs,
+    ArchiveMissing,
+)
+from ipo_readiness.services.facts_service import init_facts_store, screen_facts
+from ipo_readiness.services.db_helper import clamp_page_size, encode_cursor, read_snapshot
 from ipo_readiness.services.dashboard_service import (
     init_dashboard_store,
     list_projects,
@@ -25,9 +43,55 @@ from ipo_readiness.services.dashboard_service import (
     create_project,
     create_assessment_manual,
     save_assessment_and_create_project,
+    backfill_project_owners,
+    start_project_owner_backfill,
+    delete_assessment,
+    get_portfolio_summary,
+    get_assessment,
+    get_assessment_metrics,
+    list_company_history,
+    diff_assessments,
+    iter_assessments,
+    ASSESSMENT_EXPORT_COLUMNS,
+)
+from ipo_readiness.services.export_service import encode_export
+from ipo_readiness.services.session_service import (
+    init_session_store,
+    issue_token,
+    verify_token,
+    SESSION_TTL,
+)
+from ipo_readiness.services.password_service import PasswordHasherBusy
+from ipo_readiness.services.rate_limit_service import init_rate_limit_store, check_rate_limit
+from ipo_readiness.services.analysis_service import (
+    run_analysis,
+    analysis_stats,
+    read_uploads,
+    AnalysisQueueFull,
+    ANALYZE_MAX_UPLOAD_BYTES,
+)
+from ipo_readiness.services.analysis_job_service import (
+    init_analysis_job_store,
+    submit_analysis_job,
+    get_analysis_job,
+    stream_job_events,
+)
+from ipo_readiness.services.job_queue_service import list_dead_jobs, requeue_dead_job
+from ipo_readiness.services.batch_analysis_service import BatchRun
+from ipo_readiness.services.upload_handoff_service import (
+    store_handoff,
+    take_handoff,
+    discard_handoff,
+    HandoffExpired,
+    ANALYZE_HANDOFF_TTL,
 )
 
 app = Flask(__name__)
+# Render ส่งต่อ request ผ่าน proxy 1 ชั้น: request.remote_addr = IP ที่ proxy เห็น (ค่าท้ายของ X-Forwarded-For)
+# ไม่ใช่ค่าแรกที่ client ปลอมมาได้ – ตั้ง TRUSTED_PROXY_HOPS=0 เมื่อรันโดยไม่มี proxy ข้างหน้า
+_trusted_proxy_hops = int(os.environ.get("TRUSTED_PROXY_HOPS", "1"))
+if _trusted_proxy_hops > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=_trusted_proxy_hops)
 
 # CORS: local + Vercel (regex) + FRONTEND_URL หรือ * ถ้าไม่ตั้ง
 _cors_origins = [
@@ -53,9 +117,203 @@ def _safe_init(name, fn):
         traceback.print_exc()
 
 
-_safe_init("user_store", init_user_store)
-_safe_init("audit_store", init_audit_store)
-_safe_init("dashboard_store", init_dashboard_store)
+# python app.py: the analysis pool's spawn children re-import this file as __mp_main__; they only run
+# parse / compute, so they skip the stores and background threads
+if __name__ != "__mp_main__":
+    _safe_init("user_store", init_user_store)
+    _safe_init("session_store", init_session_store)
+    _safe_init("rate_limit_store", init_rate_limit_store)
+    _safe_init("analysis_job_store", init_analysis_job_store)
+    _safe_init("audit_store", init_audit_store)
+    _safe_init("audit_archive_store", init_audit_archive_store)
+    _safe_init("audit_maintenance", start_audit_maintenance)
+    _safe_init("dashboard_store", init_dashboard_store)
+    _safe_init("facts_store", init_facts_store)
+    _safe_init("project_owner_backfill", start_project_owner_backfill)
+
+def _page_args(*filter_names):
+    """Read ?limit=&cursor= and the given filter names from the query string."""
+    limit = clamp_page_size(request.args.get("limit", type=int))
+    cursor = request.args.get("cursor") or None
+    filters = {}
+    for name in filter_names:
+        value = request.args.get(name, type=int) if name == "user_id" else (request.args.get(name) or "").strip()
+        if value not in (None, ""):
+            filters[name] = value
+    return limit, cursor, filters
+
+
+def _page(items, limit):
+    """Items were fetched with limit + 1: trim the probe row and return (dicts, next_cursor or None)."""
+    has_more = len(items) > limit
+    items = items[:limit]
+    next_cursor = None
+    if has_more and items:
+        next_cursor = encode_cursor(items[-1].created_at, items[-1].id)
+    return [item.__dict__ for item in items], next_cursor
+
+
+def _page_response(key, items, limit):
+    rows, next_cursor = _page(items, limit)
+    return jsonify({key: rows, "next_cursor": next_cursor})
+
+
+_DATE_FILTERS = ("date_from", "date_to")
+
+
+# Reachable with a stale token: signing in again is how an expired or revoked session recovers
+_TOKENLESS_ENDPOINTS = {"auth_login", "auth_forgot_password"}
+
+
+@app.before_request
+def _load_session():
+    """Authorization: Bearer <token> → g.session (verified in memory, no users lookup). No header = anonymous."""
+    g.session = None
+    header = request.headers.get("Authorization", "")
+    if request.method == "OPTIONS" or request.endpoint in _TOKENLESS_ENDPOINTS:
+        return None
+    if not header.lower().startswith("bearer "):
+        return None
+    try:
+        g.session = verify_token(header[7:])
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 401
+    return None
+
+
+def _portfolio_owner_filter():
+    """ความเป็นส่วนตัว: user ธรรมดาเห็นเฉพาะของตัวเอง, Admin เห็นทุกคน หรือเลือกดูของคนใดคนหนึ่งจาก Team Pulse
+    สิทธิ์ Admin มาจาก session token เท่านั้น (role ใน query string ไม่มีผล); ไม่มี token ใช้ user_id แบบเดิม"""
+    session = g.get("session")
+    if session is not None:
+        if session.is_admin:
+            return request.args.get("view_user_id", type=int)
+        return session.user_id
+
+    user_id_param = request.args.get("user_id", type=int)
+    return user_id_param if user_id_param is not None else 0  # no identity at all: nobody's rows, not everyone's
+
+
+def _acting_user_id(claimed):
+    """ผู้ใช้ที่ทำรายการ: ถ้ามี session token ใช้ตัวตนจาก token เสมอ (ไม่เชื่อ user_id ที่ client ส่งมา)
+    ไม่มี token ใช้ค่าที่ส่งมาแบบเดิม"""
+    session = g.get("session")
+    return session.user_id if session is not None else claimed
+
+
+def _client_key():
+    """Rate-limit identity: the signed-in user, else the client IP (remote_addr, resolved by ProxyFix)."""
+    session = g.get("session")
+    if session is not None:
+        return f"user:{session.user_id}"
+    return "ip:" + (request.remote_addr or "unknown")
+
+
+def _rate_limited(route):
+    """Token bucket per client for an expensive endpoint (RATE_LIMIT_<ROUTE>); over the limit → 429 + Retry-After."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            retry_after = check_rate_limit(route, _client_key())
+            if retry_after is not None:
+                return jsonify({
+                    "error": f"ส่งคำขอถี่เกินไป กรุณาลองใหม่ในอีก {retry_after} วินาที",
+                    "retry_after": retry_after,
+                }), 429, {"Retry-After": str(retry_after)}
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _uploaded_workbooks():
+    """Files from field "workbooks" (many) or "workbook" (one), else the files /api/analyze/preview kept for
+    the request's handoff_token (HandoffExpired when they are gone)."""
+    workbooks = request.files.getlist("workbooks") or []
+    if not workbooks:
+        single = request.files.get("workbook")
+        if single:
+            workbooks = [single]
+    if not workbooks and _handoff_token():
+        workbooks = take_handoff(_handoff_token(), owner_id=_handoff_owner_id())
+    return workbooks
+
+
+def _required_workbooks():
+    """_uploaded_workbooks for run_analysis / submit_analysis_job: called only once the request is admitted,
+    so a request turned away with 503 never has its multipart body parsed."""
+    workbooks = _uploaded_workbooks()
+    if not workbooks:
+        raise ValueError("กรุณาอัปโหลดไฟล์ข้อมูลทางการเงิน")
+    return workbooks
+
+
+_BATCH_BUNDLE_REQUIRED = "กรุณาอัปโหลดไฟล์ zip (field \"bundle\") ที่มีหนึ่งโฟลเดอร์ต่อบริษัท"
+
+
+def _batch_bundle():
+    """The zip stream for BatchRun, called only once the batch is admitted (like _required_workbooks)."""
+    if request.mimetype != "multipart/form-data":
+        return request.stream  # raw zip body: spooled straight into BatchRun, not buffered here first
+    bundle = request.files.get("bundle")
+    if not bundle:
+        raise ValueError(_BATCH_BUNDLE_REQUIRED)
+    return bundle.stream
+
+
+def _upload_too_large():
+    """413 from Content-Length alone, before the body is read; None when the upload may proceed."""
+    if (request.content_length or 0) > ANALYZE_MAX_UPLOAD_BYTES:
+        return jsonify({"error": f"ไฟล์ที่อัปโหลดรวมกันใหญ่เกิน {ANALYZE_MAX_UPLOAD_BYTES // (1024 * 1024)} MB"}), 413
+    return None
+
+
+def _handoff_token():
+    """handoff_token from the form or a JSON body."""
+    return request.form.get("handoff_token") or (request.get_json(silent=True) or {}).get("handoff_token")
+
+
+def _handoff_owner_id():
+    session = g.get("session")
+    return session.user_id if session is not None else None
+
+
+def _handoff_expired_response(err):
+    return jsonify({"error": str(err), "reupload": True}), 410
+
+
+def _queue_full_response(full):
+    return jsonify({
+        "error": str(full),
+        "queue_length": full.queue_length,
+        "position": full.position,
+        "retry_after": full.retry_after,
+    }), 503, {"Retry-After": str(full.retry_after)}
+
+
+_EXPORT_MIMETYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+def _export_response(rows, columns, basename):
+    """Stream rows as ?format=ndjson|csv (&gzip=1) without materializing the result set."""
+    fmt = (request.args.get("format") or "ndjson").strip().lower()
+    gzip = request.args.get("gzip", "").strip().lower() in ("1", "true", "yes")
+    chunks = encode_export(rows, columns, fmt, gzip=gzip)
+    first = next(chunks, b"")  # open the cursor now so DB errors still become a JSON error response
+
+    def body():
+        try:
+            yield first
+            yield from chunks
+        finally:
+            chunks.close()  # client gone or done: release the cursor / snapshot right away
+    filename = f"{basename}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{fmt}" + (".gz" if gzip else "")
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"', "X-Accel-Buffering": "no"}
+    return Response(
+        body(),
+        mimetype="application/gzip" if gzip else _EXPORT_MIMETYPES[fmt],
+        headers=headers,
+    )
+
 
 @app.route("/api/health", methods=["GET"])
 @app.route("/", methods=["GET"])
@@ -64,6 +322,7 @@ def health_check():
     return jsonify({"status": "ok", "service": "IPO Readiness API"}), 200
 
 @app.route("/api/analyze/preview", methods=["POST"])
+@_rate_limited("analyze_preview")
 def analyze_preview():
     """Preview: ดึงชื่อบริษัทจากไฟล์ที่อัปโหลดก่อนประมวลผลจริง (ตรวจสอบไฟล์ผิด)"""
     try:
@@ -75,56 +334,154 @@ def analyze_preview():
         if not workbooks:
             return jsonify({"error": "กรุณาอัปโหลดไฟล์ข้อมูลทางการเงิน"}), 400
         
-        from ipo_readiness.services.parser_thai import _extract_company_name, _load_workbook_from_upload
+        from ipo_readiness.services.parser_thai import sniff_company_name
         
+        uploads = read_uploads(workbooks)
         companies = []
-        for idx, file in enumerate(workbooks):
-            filename = getattr(file, "filename", "") or getattr(file, "name", f"file_{idx+1}")
+        for upload in uploads:
             try:
-                workbook, _ = _load_workbook_from_upload(file)
-                company_name = _extract_company_name(workbook)
+                company_name = sniff_company_name(upload)  # header rows only, not the whole workbook
                 companies.append({
-                    "file": filename,
+                    "file": upload.filename,
                     "company": company_name or "(ไม่พบชื่อบริษัท)"
                 })
             except Exception as e:
                 companies.append({
-                    "file": filename,
+                    "file": upload.filename,
                     "company": f"(อ่านไฟล์ไม่ได้: {str(e)})"
                 })
         
         unique_companies = set([c["company"] for c in companies if c["company"] and c["company"] != "(ไม่พบชื่อบริษัท)" and not c["company"].startswith("(อ่าน")])
         is_consistent = len(unique_companies) <= 1
         
+        # Keep the checked files so the analyze call can send handoff_token instead of uploading them again
+        handoff_token = None
+        if is_consistent and not any(c["company"].startswith("(อ่าน") for c in companies):
+            handoff_token = store_handoff(uploads, owner_id=_handoff_owner_id())
+        
         return jsonify({
             "companies": companies,
             "is_consistent": is_consistent,
             "unique_companies": list(unique_companies) if unique_companies else [],
-            "message": "ชื่อบริษัทตรงกัน" if is_consistent else "⚠️ พบชื่อบริษัทไม่ตรงกัน - กรุณาตรวจสอบไฟล์"
+            "message": "ชื่อบริษัทตรงกัน" if is_consistent else "⚠️ พบชื่อบริษัทไม่ตรงกัน - กรุณาตรวจสอบไฟล์",
+            "handoff_token": handoff_token,
+            "handoff_expires_in": ANALYZE_HANDOFF_TTL if handoff_token else None,
         })
     except Exception as exc:
         return jsonify({"error": str(exc)}), 500
 
 
 @app.route("/api/analyze", methods=["POST"])
+@_rate_limited("analyze")
 def analyze():
     try:
-        workbooks = request.files.getlist("workbooks") or []
-        if not workbooks:
-            single = request.files.get("workbook")
-            if single:
-                workbooks = [single]
-        if not workbooks:
-            return jsonify({"error": "กรุณาอัปโหลดไฟล์ข้อมูลทางการเงิน"}), 400
-        data = parse_financial_files(workbooks)
-        metrics = compute_metrics(data)
-        return jsonify({"data": data, "metrics": metrics})
+        too_large = _upload_too_large()
+        if too_large:
+            return too_large
+        result = run_analysis(_required_workbooks)
+        discard_handoff(_handoff_token())
+        return jsonify(result)
+    except AnalysisQueueFull as full:
+        return _queue_full_response(full)
+    except HandoffExpired as err:
+        return _handoff_expired_response(err)
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 400
+    except Exception as exc:
+        return jsonify({"error": str(exc)}), 500
+
+
+@app.route("/api/analyze/batch", methods=["POST"])
+@_rate_limited("analyze_batch")
+def analyze_batch():
+    """วิเคราะห์หลายบริษัทจาก zip (หนึ่งโฟลเดอร์ต่อบริษัท) ส่งผลกลับเป็น NDJSON ทีละบรรทัดเมื่อแต่ละบริษัทเสร็จ
+    บรรทัดสุดท้ายเป็น {"status": "summary"}; บริษัทที่ผิดพลาดได้ {"status": "error"} โดยไม่หยุดบริษัทอื่น"""
+    try:
+        too_large = _upload_too_large()
+        if too_large:
+            return too_large
+        if request.mimetype not in ("multipart/form-data", "application/zip", "application/x-zip-compressed"):
+            return jsonify({"error": _BATCH_BUNDLE_REQUIRED}), 400
+        run = BatchRun(_batch_bundle)
+    except AnalysisQueueFull as full:
+        return _queue_full_response(full)
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 400
+    except Exception as exc:
+        return jsonify({"error": str(exc)}), 500
+
+    def lines():
+        for result in run:
+            yield json.dumps(result, ensure_ascii=False, default=str) + "\n"
+    response = Response(
+        lines(),
+        mimetype="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no"},
+    )
+    response.call_on_close(run.close)  # client gone: cancel companies not started
+    return response
+
+
+@app.route("/api/analyze/jobs", methods=["POST"])
+@_rate_limited("analyze")
+def analyze_job_create():
+    """เริ่มงานวิเคราะห์แบบ async: ตอบ job id ทันที แล้วติดตามผลที่ /api/analyze/jobs/<id> หรือ .../events (SSE)"""
+    try:
+        too_large = _upload_too_large()
+        if too_large:
+            return too_large
+        session = g.get("session")
+        job = submit_analysis_job(_required_workbooks, owner_id=session.user_id if session else None)
+        discard_handoff(_handoff_token())
+        return jsonify({
+            "job": job.to_dict(),
+            "status_url": f"/api/analyze/jobs/{job.id}",
+            "events_url": f"/api/analyze/jobs/{job.id}/events",
+        }), 202, {"Location": f"/api/analyze/jobs/{job.id}"}
+    except AnalysisQueueFull as full:
+        return _queue_full_response(full)
+    except HandoffExpired as err:
+        return _handoff_expired_response(err)
     except ValueError as err:
         return jsonify({"error": str(err)}), 400
     except Exception as exc:
         return jsonify({"error": str(exc)}), 500
 
 
+def _job_owner_id():
+    session = g.get("session")
+    return session.user_id if session is not None and not session.is_admin else None
+
+
+@app.route("/api/analyze/jobs/<job_id>", methods=["GET"])
+def analyze_job_status(job_id):
+    """สถานะงานวิเคราะห์ (polling): progress, stage และ result เมื่อเสร็จ"""
+    try:
+        return jsonify({"job": get_analysis_job(job_id, owner_id=_job_owner_id()).to_dict()})
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 404
+
+
+@app.route("/api/analyze/jobs/<job_id>/events", methods=["GET"])
+def analyze_job_events(job_id):
+    """Server-sent events ของงานวิเคราะห์: progress ทุกครั้งที่เปลี่ยน และ result ตอนจบ (เชื่อมต่อใหม่ได้)"""
+    try:
+        job = get_analysis_job(job_id, owner_id=_job_owner_id())
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 404
+    return Response(
+        stream_job_events(job),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/api/analyze/metrics", methods=["GET"])
+def analyze_metrics():
+    """สถานะคิววิเคราะห์ของ worker นี้: จำนวนที่รอ/กำลังทำ และเวลารอ/เวลาประมวลผลล่าสุด"""
+    return jsonify(analysis_stats())
+
+
 @app.route("/api/dashboard/projects", methods=["GET", "POST"])
 def dashboard_projects():
     try:
@@ -136,12 +493,16 @@ def dashboard_projects():
                 readiness=int(payload.get("readiness", 0)),
                 status=payload.get("status"),
                 next_milestone=payload.get("next_milestone"),
-                risk=payload.get("risk", "Low")
+                risk=payload.get("risk", "Low"),
+                user_id=_acting_user_id(payload.get("user_id")),
             )
             return jsonify({"project": project.__dict__}), 201
 
-        projects = [p.__dict__ for p in list_projects()]
-        return jsonify({"projects": projects})
+        limit, cursor, filters = _page_args("user_id", "status", "risk", "phase", *_DATE_FILTERS)
+        projects = list_projects(filters=filters, limit=limit + 1, cursor=cursor)
+        return _page_response("projects", projects, limit)
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 400
     except Exception as exc:
         return jsonify({"error": str(exc)}), 500
 
@@ -153,7 +514,7 @@ def save_assessment():
         payload = request.get_json(force=True)
         data = payload.get("data") or {}
         metrics = payload.get("metrics") or {}
-        user_id = payload.get("user_id")
+        user_id = _acting_user_id(payload.get("user_id"))
         company_name = data.get("company_name") or "บริษัทไม่ระบุชื่อ"
         project = save_assessment_and_create_project(
             company_name=company_name,
@@ -173,7 +534,7 @@ def dashboard_assessments():
             payload = request.get_json(force=True)
             a = create_assessment_manual(
                 company_name=payload.get("company_name") or payload.get("client") or "",
-                user_id=payload.get("user_id"),
+                user_id=_acting_user_id(payload.get("user_id")),
                 phase=payload.get("phase", "Filing Prep"),
                 status=payload.get("status", "On Track"),
                 readiness_score=int(payload.get("readiness_score") or payload.get("readiness", 0)),
@@ -194,32 +555,139 @@ def dashboard_assessments():
                 }
             }), 201
 
-        # ความเป็นส่วนตัว: user ธรรมดาเห็นเฉพาะของตัวเอง, Admin เห็นทุกคน หรือเลือกดูของคนใดคนหนึ่งจาก Team Pulse
-        user_id_param = request.args.get("user_id", type=int)
-        role_param = request.args.get("role", "").strip().lower()
-        view_user_id_param = request.args.get("view_user_id", type=int)
+        filter_by = _portfolio_owner_filter()
+        limit, cursor, filters = _page_args("status", "risk", "phase", *_DATE_FILTERS)
+        items = list_assessments(filter_by_user_id=filter_by, filters=filters, limit=limit + 1, cursor=cursor)
+        return _page_response("assessments", items, limit)
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 400
+    except Exception as exc:
+        return jsonify({"error": str(exc)}), 500
 
-        if role_param == "admin":
-            filter_by = view_user_id_param if view_user_id_param is not None else None
-        else:
-            filter_by = user_id_param
-
-        items = list_assessments(filter_by_user_id=filter_by)
-        data = [
-            {
-                "id": a.id,
-                "company_name": a.company_name,
-                "assessed_by": a.assessed_by,
-                "readiness_score": a.readiness_score,
-                "phase": a.phase,
-                "status": a.status,
-                "next_milestone": a.next_milestone,
-                "risk": a.risk,
-                "created_at": a.created_at,
-            }
-            for a in items
-        ]
-        return jsonify({"assessments": data})
+
+@app.route("/api/dashboard/assessments/export", methods=["GET"])
+def dashboard_assessments_export():
+    """Export assessments ทั้งหมดตาม filter เดียวกับรายการ (?format=ndjson|csv&gzip=1) แบบ stream"""
+    try:
+        filter_by = _portfolio_owner_filter()
+        _, _, filters = _page_args("status", "risk", "phase", "company_name", *_DATE_FILTERS)
+        rows = iter_assessments(filter_by_user_id=filter_by, filters=filters)
+        return _export_response(rows, ASSESSMENT_EXPORT_COLUMNS, "assessments")
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 400
+    except Exception as exc:
+        return jsonify({"error": str(exc)}), 500
+
+
+@app.route("/api/dashboard/assessments/<int:assessment_id>", methods=["GET", "DELETE"])
+def dashboard_assessment_detail(assessment_id: int):
+    try:
+        filter_by = _portfolio_owner_filter()
+        if request.method == "GET":
+            assessment = get_assessment(assessment_id, filter_by_user_id=filter_by)
+            if assessment is None:
+                return jsonify({"error": "ไม่พบข้อมูล"}), 404
+            return jsonify({
+                "assessment": assessment.__dict__,
+                "metrics": get_assessment_metrics(assessment_id),
+            })
+
+        delete_assessment(assessment_id, filter_by_user_id=filter_by)
+        return jsonify({"status": "deleted"})
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 404
+    except Exception as exc:
+        return jsonify({"error": str(exc)}), 500
+
+
+@app.route("/api/dashboard/summary", methods=["GET"])
+def dashboard_summary():
+    """KPIs ของ Client Portfolio (นับตาม phase / status / risk, readiness เฉลี่ย, งานต่อคน) จากตาราง portfolio_summary"""
+    try:
+        summary = get_portfolio_summary(filter_by_user_id=_portfolio_owner_filter())
+        return jsonify({"summary": summary.__dict__})
+    except Exception as exc:
+        return jsonify({"error": str(exc)}), 500
+
+
+@app.route("/api/dashboard/bootstrap", methods=["GET"])
+def dashboard_bootstrap():
+    """Consultant Cockpit ในรอบเดียว: หน้าแรกของ Client Portfolio + KPI + Team Pulse + ผู้ใช้ปัจจุบัน
+    (portfolio และ KPI อ่านจาก connection / snapshot เดียวกัน; team และ user มาจาก cache)"""
+    try:
+        filter_by = _portfolio_owner_filter()
+        limit, _, filters = _page_args("status", "risk", "phase", *_DATE_FILTERS)
+        with read_snapshot() as conn:
+            items = list_assessments(filter_by_user_id=filter_by, filters=filters, limit=limit + 1, conn=conn)
+            summary = get_portfolio_summary(filter_by_user_id=filter_by, conn=conn)
+        assessments, next_cursor = _page(items, limit)
+        user = get_user(_acting_user_id(request.args.get("user_id", type=int)))
+        return jsonify({
+            "user": user.__dict__ if user else None,
+            "assessments": assessments,
+            "next_cursor": next_cursor,
+            "summary": summary.__dict__,
+            "members": [m.__dict__ for m in list_team_members()],
+        })
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 400
+    except Exception as exc:
+        return jsonify({"error": str(exc)}), 500
+
+
+@app.route("/api/companies/history", methods=["GET"])
+def company_history():
+    """ประวัติการประเมินของลูกค้ารายเดียว (?company_name=) เรียงจากใหม่ไปเก่า แบ่งหน้าด้วย cursor"""
+    try:
+        company_name = (request.args.get("company_name") or "").strip()
+        if not company_name:
+            return jsonify({"error": "กรุณาระบุชื่อบริษัท"}), 400
+        limit = clamp_page_size(request.args.get("limit", type=int))
+        items = list_company_history(
+            company_name,
+            filter_by_user_id=_portfolio_owner_filter(),
+            limit=limit + 1,
+            cursor=request.args.get("cursor") or None,
+        )
+        return _page_response("assessments", items, limit)
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 400
+    except Exception as exc:
+        return jsonify({"error": str(exc)}), 500
+
+
+@app.route("/api/companies/diff", methods=["GET"])
+def company_diff():
+    """เทียบผลประเมินสองครั้ง (?from=&to=) คืนเฉพาะค่าที่เปลี่ยน"""
+    try:
+        from_id = request.args.get("from", type=int)
+        to_id = request.args.get("to", type=int)
+        if from_id is None or to_id is None:
+            return jsonify({"error": "กรุณาระบุ from และ to"}), 400
+        return jsonify(diff_assessments(from_id, to_id, filter_by_user_id=_portfolio_owner_filter()))
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 404
+    except Exception as exc:
+        return jsonify({"error": str(exc)}), 500
+
+
+@app.route("/api/analytics/screen", methods=["GET"])
+def analytics_screen():
+    """คัดกรองลูกค้าทั้งพอร์ตจาก financial_facts เช่น ?metric=net_profit&year=2567&min=25000000 (หน่วยบาท)"""
+    try:
+        metric = (request.args.get("metric") or "").strip()
+        year = request.args.get("year", type=int)
+        if not metric or year is None:
+            return jsonify({"error": "กรุณาระบุ metric และ year"}), 400
+        facts = screen_facts(
+            metric=metric,
+            year=year,
+            min_value=request.args.get("min", type=float),
+            max_value=request.args.get("max", type=float),
+            latest_only=request.args.get("all_assessments", "").lower() not in ("1", "true"),
+            limit=clamp_page_size(request.args.get("limit", type=int)),
+        )
+        return jsonify({"results": [f.__dict__ for f in facts]})
     except Exception as exc:
         return jsonify({"error": str(exc)}), 500
 
@@ -253,6 +721,35 @@ def admin_users():
         return jsonify({"error": str(exc)}), 500
 
 
+@app.route("/api/admin/users/import", methods=["POST"])
+def admin_users_import():
+    """นำเข้าผู้ใช้หลายคนพร้อมกัน: ไฟล์ CSV/JSON (field "file") หรือ body JSON {"users": [...]} / text/csv
+    แถวไม่ถูกต้องแม้แถวเดียว = ไม่บันทึกเลย (400); อีเมลซ้ำจะถูกข้ามและรายงานเป็นรายแถว"""
+    try:
+        upload = request.files.get("file")
+        if upload is not None:
+            filename = (upload.filename or "").lower()
+            fmt = "json" if filename.endswith(".json") else "csv"
+            rows = parse_user_import(upload.read().decode("utf-8-sig"), fmt)
+        elif request.mimetype == "text/csv":
+            rows = parse_user_import(request.get_data(as_text=True), "csv")
+        else:
+            rows = parse_user_import(request.get_json(force=True), "json")
+        results = import_users(rows)
+        counts = {}
+        for r in results:
+            counts[r.status] = counts.get(r.status, 0) + 1
+        body = {"results": [r.__dict__ for r in results], "counts": counts}
+        if counts.get("invalid"):
+            body["error"] = "ข้อมูลไม่ถูกต้อง ยังไม่ได้บันทึกผู้ใช้ กรุณาแก้ไขแถวที่แจ้งแล้วนำเข้าใหม่"
+            return jsonify(body), 400
+        return jsonify(body), 201 if counts.get("created") else 200
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 400
+    except Exception as exc:
+        return jsonify({"error": str(exc)}), 500
+
+
 @app.route("/api/admin/users/<int:user_id>", methods=["PUT", "PATCH", "DELETE"])
 def admin_user_detail(user_id: int):
     try:
@@ -280,9 +777,12 @@ def auth_login():
         email = payload.get("email", "")
         password = payload.get("password", "")
         user = authenticate_user(email=email, password=password)
-        return jsonify({"user": user.__dict__})
+        token = issue_token(user.id, user.name, user.role)
+        return jsonify({"user": user.__dict__, "token": token, "expires_in": SESSION_TTL})
     except ValueError as err:
         return jsonify({"error": str(err)}), 401
+    except PasswordHasherBusy as err:
+        return jsonify({"error": str(err)}), 503, {"Retry-After": "1"}
     except Exception as exc:
         return jsonify({"error": str(exc)}), 500
 
@@ -322,15 +822,127 @@ def admin_audit_logs():
     try:
         if request.method == "POST":
             payload = request.get_json(force=True)
-            user_id = payload.get("user_id")
-            user_name = payload.get("user_name", "Unknown")
+            session = g.get("session")
+            user_id = _acting_user_id(payload.get("user_id"))
+            user_name = session.name if session is not None else payload.get("user_name", "Unknown")
             action = payload.get("action", "Unknown Action")
             details = payload.get("details", "")
-            log = log_action(user_id, user_name, action, details)
-            return jsonify({"log": log.__dict__}), 201
+            log = enqueue_action(user_id, user_name, action, details)
+            return jsonify({"log": log.__dict__}), 202
+
+        limit, cursor, filters = _page_args("user_id", "user_name", "action", *_DATE_FILTERS)
+        logs = list_logs(limit=limit + 1, filters=filters, cursor=cursor)
+        return _page_response("logs", logs, limit)
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 400
+    except Exception as exc:
+        return jsonify({"error": str(exc)}), 500
+
+
+@app.route("/api/admin/backfill/project-owners", methods=["POST"])
+def admin_backfill_project_owners():
+    """Re-run the project owner (user_id) backfill one batch at a time; send last_id back as after_id to continue."""
+    try:
+        payload = request.get_json(silent=True) or {}
+        result = backfill_project_owners(
+            after_id=int(payload.get("after_id") or 0),
+            batch_size=clamp_page_size(int(payload.get("batch_size") or 0), default=500),
+        )
+        return jsonify(result)
+    except Exception as exc:
+        return jsonify({"error": str(exc)}), 500
+
+
+@app.route("/api/admin/analysis-jobs/dead", methods=["GET"])
+def admin_dead_analysis_jobs():
+    """งานวิเคราะห์ในคิวที่ล้มเหลวครบจำนวนครั้ง (dead-letter) พร้อม error ล่าสุด"""
+    try:
+        return jsonify({"jobs": list_dead_jobs(limit=clamp_page_size(request.args.get("limit", type=int)))})
+    except Exception as exc:
+        return jsonify({"error": str(exc)}), 500
+
+
+@app.route("/api/admin/analysis-jobs/<job_id>/requeue", methods=["POST"])
+def admin_requeue_analysis_job(job_id):
+    """ส่งงานที่อยู่ใน dead-letter กลับเข้าคิวพร้อมจำนวนครั้งใหม่"""
+    try:
+        if not requeue_dead_job(job_id):
+            return jsonify({"error": "ไม่พบงานใน dead-letter"}), 404
+        return jsonify({"id": job_id, "status": "queued"})
+    except Exception as exc:
+        return jsonify({"error": str(exc)}), 500
 
-        logs = [l.__dict__ for l in list_logs(limit=200)]
-        return jsonify({"logs": logs})
+
+@app.route("/api/admin/audit-logs/search", methods=["GET"])
+def admin_audit_logs_search():
+    """ค้นหา audit log: ?q= (ข้อความใน details / action / ผู้ใช้) + user_id, user_name, action, date_from, date_to
+    พร้อม facet นับตาม action และผู้ใช้ (เฉพาะหน้าแรก)"""
+    try:
+        limit, cursor, filters = _page_args("user_id", "user_name", "action", *_DATE_FILTERS)
+        result = search_logs(
+            q=request.args.get("q") or "",
+            filters=filters,
+            limit=limit + 1,
+            cursor=cursor,
+            with_facets=cursor is None,
+        )
+        logs, next_cursor = _page(result.logs, limit)
+        return jsonify({"logs": logs, "next_cursor": next_cursor, "facets": result.facets, "total": result.total})
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 400
+    except Exception as exc:
+        return jsonify({"error": str(exc)}), 500
+
+
+@app.route("/api/admin/audit-logs/export", methods=["GET"])
+def admin_audit_logs_export():
+    """Export audit log ทั้งหมดตาม filter (?format=ndjson|csv&gzip=1) แบบ stream"""
+    try:
+        _, _, filters = _page_args("user_id", "user_name", "action", *_DATE_FILTERS)
+        return _export_response(iter_logs(filters), AUDIT_EXPORT_COLUMNS, "audit-logs")
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 400
+    except Exception as exc:
+        return jsonify({"error": str(exc)}), 500
+
+
+@app.route("/api/admin/audit-logs/archives", methods=["GET"])
+def admin_audit_archives():
+    """ดัชนีไฟล์ archive ของ audit log (เดือนที่ย้ายออกจากตารางหลักแล้ว)"""
+    try:
+        archives = list_archives(request.args.get("month") or None)
+        return jsonify({"archives": [a.__dict__ for a in archives]})
+    except Exception as exc:
+        return jsonify({"error": str(exc)}), 500
+
+
+@app.route("/api/admin/audit-logs/archives/<month>", methods=["GET"])
+def admin_audit_archive_month(month: str):
+    """อ่าน audit log ของเดือนที่ archive แล้ว (YYYY-MM) ตามต้องการ ใช้ตัวกรองและ cursor แบบเดียวกับ /api/admin/audit-logs"""
+    try:
+        if not re.fullmatch(r"\d{4}-\d{2}", month):
+            return jsonify({"error": "รูปแบบเดือนต้องเป็น YYYY-MM"}), 400
+        limit, cursor, filters = _page_args("user_id", "user_name", "action", *_DATE_FILTERS)
+        logs = read_archived_logs(month, limit=limit + 1, filters=filters, cursor=cursor)
+        return _page_response("logs", logs, limit)
+    except ArchiveMissing as missing:
+        return jsonify({"error": str(missing), "missing": missing.paths}), 410
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 400
+    except Exception as exc:
+        return jsonify({"error": str(exc)}), 500
+
+
+@app.route("/api/admin/audit-logs/retention", methods=["POST"])
+def admin_audit_retention():
+    """รัน retention ทันที: ย้ายเดือนที่เก่ากว่า retention_months ไปเป็นไฟล์ NDJSON บีบอัด"""
+    try:
+        payload = request.get_json(silent=True) or {}
+        kwargs = {}
+        if payload.get("retention_months") is not None:
+            kwargs["retention_months"] = int(payload["retention_months"])
+        archives = run_audit_retention(**kwargs)
+        return jsonify({"archived": [a.__dict__ for a in archives]})
     except Exception as exc:
         return jsonify({"error": str(exc)}), 500
 
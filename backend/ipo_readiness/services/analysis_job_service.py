@@ -0,0 +1,294 @@
+"""Asynchronous analysis jobs: POST returns a job id at once; progress via polling or server-sent events.
+
+A job takes one place on the analysis pool (analysis_service) for its whole life, parses its files one by
+one in the worker processes (so progress can be reported per file), merges them and computes metrics.
+Jobs and their results live in this process's memory for ANALYZE_JOB_TTL seconds after they finish;
+the deployment runs a single gunicorn worker process (with threads), so every request sees the same jobs.
+
+ANALYZE_JOB_BACKEND=db instead puts jobs in the analysis_jobs queue table (job_queue_service) and leaves
+the work to standalone workers (python worker.py --processes N); the API then only enqueues and reads
+job state, so it can scale independently of the analysis capacity.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+import uuid
+import zipfile
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+from openpyxl.utils.exceptions import InvalidFileException
+
+from ipo_readiness.services.analysis_service import read_uploads, analysis_pool, AnalysisQueueFull
+from ipo_readiness.services import job_queue_service as job_queue
+from ipo_readiness.services.metrics_engine import compute_metrics
+from ipo_readiness.services.parser_thai import parse_workbook_file, combine_parsed_files
+
+ANALYZE_JOB_TTL = int(os.environ.get("ANALYZE_JOB_TTL", "3600"))
+ANALYZE_JOB_BACKEND = (os.environ.get("ANALYZE_JOB_BACKEND") or "memory").strip().lower()
+_DB_POLL_SECONDS = 1.0  # SSE refresh interval for queue-table jobs
+_SSE_HEARTBEAT = 15.0  # seconds between keep-alive comments, below typical proxy idle timeouts
+
+_TERMINAL = ("done", "failed")
+# Shown to the user as-is (unreadable workbook, mismatched companies); other errors carry their type name
+_INPUT_ERRORS = (ValueError, zipfile.BadZipFile, InvalidFileException)
+
+
+@dataclass
+class AnalysisJob:
+    id: str
+    owner_id: Optional[int]
+    files: List[str]
+    status: str = "queued"  # queued | running | done | failed
+    stage: str = "received"  # received | parsing | computing | done | failed
+    message: str = "ได้รับไฟล์แล้ว รอคิวประมวลผล"
+    files_parsed: int = 0
+    company_name: Optional[str] = None
+    error: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    version: int = 0
+
+    @property
+    def progress(self) -> int:
+        """Percent: one step per file plus one for metrics."""
+        steps = len(self.files) + 1
+        done = self.files_parsed + (1 if self.status == "done" else 0)
+        return int(100 * done / steps)
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        body = {
+            "id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "message": self.message,
+            "progress": self.progress,
+            "files": self.files,
+            "files_parsed": self.files_parsed,
+            "company_name": self.company_name,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "finished_at": self.finished_at,
+            "expires_at": (self.finished_at + ANALYZE_JOB_TTL) if self.finished_at else None,
+        }
+        if include_result and self.status == "done":
+            body["result"] = self.result
+        return body
+
+
+class _JobStore:
+    def __init__(self, ttl: int) -> None:
+        self._ttl = ttl
+        self._jobs: Dict[str, AnalysisJob] = {}
+        self._changed = threading.Condition()
+
+    def add(self, job: AnalysisJob) -> None:
+        with self._changed:
+            self._purge()
+            self._jobs[job.id] = job
+
+    def get(self, job_id: str) -> Optional[AnalysisJob]:
+        with self._changed:
+            self._purge()
+            return self._jobs.get(job_id)
+
+    def update(self, job: AnalysisJob, **changes: Any) -> None:
+        with self._changed:
+            for name, value in changes.items():
+                setattr(job, name, value)
+            job.updated_at = time.time()
+            if job.status in _TERMINAL and job.finished_at is None:
+                job.finished_at = job.updated_at
+            job.version += 1
+            self._changed.notify_all()
+
+    def wait_for_change(self, job: AnalysisJob, seen_version: int, timeout: float) -> None:
+        with self._changed:
+            self._changed.wait_for(lambda: job.version != seen_version, timeout=timeout)
+
+    def _purge(self) -> None:
+        now = time.time()
+        expired = [k for k, j in self._jobs.items() if j.finished_at and now - j.finished_at > self._ttl]
+        for key in expired:
+            del self._jobs[key]
+
+
+_store = _JobStore(ANALYZE_JOB_TTL)
+
+
+def _timed_parse(upload, idx: int):
+    started = time.time()
+    parsed = parse_workbook_file(upload, idx)
+    return started, time.time(), parsed
+
+
+def _run_job(job: AnalysisJob, uploads) -> None:
+    submitted = time.time()
+    first_start = None
+    try:
+        parsed = []
+        for idx, upload in enumerate(uploads):
+            _store.update(job, status="running", stage="parsing", message=f"กำลังอ่านไฟล์ {upload.filename}")
+            started, _, item = analysis_pool.call(_timed_parse, upload, idx)
+            first_start = first_start or started
+            parsed.append(item)
+            _store.update(
+                job,
+                files_parsed=idx + 1,
+                message=f"อ่านไฟล์ {upload.filename} แล้ว ({idx + 1}/{len(uploads)})",
+            )
+        data = combine_parsed_files(parsed)
+        _store.update(job, stage="computing", company_name=data.get("company_name"), message="กำลังคำนวณตัวชี้วัด")
+        result = {"data": data, "metrics": compute_metrics(data)}
+    except Exception as exc:
+        analysis_pool.release(ok=False)
+        _store.update(job, status="failed", stage="failed", error=str(exc), message="ประมวลผลไม่สำเร็จ")
+        return
+    analysis_pool.release(ok=True, wait=(first_start or submitted) - submitted, run=time.time() - (first_start or submitted))
+    _store.update(job, status="done", stage="done", result=result, message="ประมวลผลเสร็จสิ้น")
+
+
+def _job_from_row(row: Dict[str, Any]) -> AnalysisJob:
+    dead = row["status"] == "dead"  # reported as failed; admins see dead letters via job_queue_service
+    return AnalysisJob(
+        id=row["id"],
+        owner_id=row["owner_id"],
+        files=row["filenames"],
+        status="failed" if dead else row["status"],
+        stage=row["stage"],
+        message=row["message"],
+        files_parsed=row["files_parsed"],
+        company_name=row["company_name"],
+        error=row["error"],
+        result=row["result"],
+        created_at=row["created_at"],
+        updated_at=row["updated_at"],
+        finished_at=row["finished_at"],
+    )
+
+
+def init_analysis_job_store() -> None:
+    """Create the queue tables when jobs go to standalone workers."""
+    if ANALYZE_JOB_BACKEND == "db":
+        job_queue.init_job_queue_store()
+
+
+def submit_analysis_job(files, owner_id: Optional[int] = None) -> AnalysisJob:
+    """Admit (AnalysisQueueFull when saturated), read the uploads and start the job in the background.
+    files may be a callable returning the uploads, called only after admission (see _AnalysisExecutor.run)."""
+    if ANALYZE_JOB_BACKEND == "db":
+        waiting = job_queue.queued_count()
+        if waiting >= job_queue.JOB_QUEUE_LIMIT:
+            raise AnalysisQueueFull(queue_length=waiting, retry_after=30)
+        job_id = job_queue.enqueue_job(read_uploads(files() if callable(files) else files), owner_id=owner_id)
+        return _job_from_row(job_queue.get_job_row(job_id))
+    analysis_pool.admit()
+    try:
+        uploads = read_uploads(files() if callable(files) else files)
+    except Exception:
+        analysis_pool.release(ok=False)
+        raise
+    job = AnalysisJob(id=uuid.uuid4().hex, owner_id=owner_id, files=[u.filename for u in uploads])
+    _store.add(job)
+    threading.Thread(target=_run_job, args=(job, uploads), name=f"analysis-job-{job.id[:8]}", daemon=True).start()
+    return job
+
+
+def get_analysis_job(job_id: str, owner_id: Optional[int] = None) -> AnalysisJob:
+    """Job by id; ValueError when unknown, expired or owned by another signed-in user."""
+    if ANALYZE_JOB_BACKEND == "db":
+        row = job_queue.get_job_row(job_id)
+        job = _job_from_row(row) if row else None
+    else:
+        job = _store.get(job_id)
+    if job is None or (owner_id is not None and job.owner_id is not None and job.owner_id != owner_id):
+        raise ValueError("ไม่พบงานวิเคราะห์ หรือหมดอายุแล้ว")
+    return job
+
+
+def stream_job_events(job: AnalysisJob) -> Iterator[str]:
+    """SSE: the current state first (so reconnects resume), then one event per change until done / failed."""
+    if ANALYZE_JOB_BACKEND == "db":
+        yield from _stream_queued_job_events(job)
+        return
+    seen = -1
+    while True:
+        if job.version != seen:
+            seen = job.version
+            event = "result" if job.status in _TERMINAL else "progress"
+            yield f"id: {seen}\nevent: {event}\ndata: {json.dumps(job.to_dict(), ensure_ascii=False)}\n\n"
+            if job.status in _TERMINAL:
+                return
+        else:
+            yield ": keep-alive\n\n"
+        _store.wait_for_change(job, seen, _SSE_HEARTBEAT)
+
+
+def _stream_queued_job_events(job: AnalysisJob) -> Iterator[str]:
+    """SSE for queue-table jobs: re-read the row every _DB_POLL_SECONDS, send an event when it changed."""
+    seen, sent_at = None, time.time()
+    while True:
+        if job.updated_at != seen:
+            seen, sent_at = job.updated_at, time.time()
+            event = "result" if job.status in _TERMINAL else "progress"
+            yield f"id: {seen}\nevent: {event}\ndata: {json.dumps(job.to_dict(), ensure_ascii=False)}\n\n"
+            if job.status in _TERMINAL:
+                return
+        elif time.time() - sent_at >= _SSE_HEARTBEAT:
+            sent_at = time.time()
+            yield ": keep-alive\n\n"
+        time.sleep(_DB_POLL_SECONDS)
+        row = job_queue.get_job_row(job.id)
+        if row is None:
+            return
+        job = _job_from_row(row)
+
+
+class _InputError(Exception):
+    """Parsing or scoring raised: the same files fail the same way on any worker, so the job is not retried."""
+
+
+def _on_input(fn, *args):
+    try:
+        return fn(*args)
+    except MemoryError:
+        raise  # may fit on another worker or later: retryable
+    except Exception as exc:
+        raise _InputError(str(exc) if isinstance(exc, _INPUT_ERRORS) else f"{type(exc).__name__}: {exc}") from exc
+
+
+def process_queued_job(claimed: "job_queue.ClaimedJob", worker_id: str) -> str:
+    """Run one claimed queue job in this process (worker.py), reporting progress to the queue table.
+    Returns the job's new status; '' when the lease was lost to another worker mid-way."""
+    files = claimed.files
+    try:
+        parsed = []
+        for idx, upload in enumerate(files):
+            if not job_queue.report_progress(
+                claimed.id, worker_id, stage="parsing", message=f"กำลังอ่านไฟล์ {upload.filename}"
+            ):
+                return ""
+            parsed.append(_on_input(parse_workbook_file, upload, idx))
+            job_queue.report_progress(
+                claimed.id, worker_id, files_parsed=idx + 1,
+                message=f"อ่านไฟล์ {upload.filename} แล้ว ({idx + 1}/{len(files)})",
+            )
+        data = _on_input(combine_parsed_files, parsed)
+        if not job_queue.report_progress(
+            claimed.id, worker_id, stage="computing", company_name=data.get("company_name"),
+            message="กำลังคำนวณตัวชี้วัด",
+        ):
+            return ""
+        result = {"data": data, "metrics": _on_input(compute_metrics, data)}
+    except _InputError as err:
+        return job_queue.fail_job(claimed.id, worker_id, str(err), retryable=False)
+    except Exception as exc:
+        # Database trouble, out of memory: another attempt may succeed
+        return job_queue.fail_job(claimed.id, worker_id, f"{type(exc).__name__}: {exc}")
+    return "done" if job_queue.complete_job(claimed.id, worker_id, result) else ""
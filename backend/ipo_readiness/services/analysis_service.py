@@ -0,0 +1,202 @@
+"""Parse + compute for /api/analyze on a bounded process pool, away from the request-serving threads.
+
+At most ANALYZE_WORKERS jobs run at once (separate processes, so the GIL-bound openpyxl parsing cannot
+stall other requests) and at most ANALYZE_QUEUE_DEPTH more wait. Beyond that run_analysis() raises
+AnalysisQueueFull immediately, carrying the queue length so the API can answer 503 instead of piling up
+uploads in memory. stats() reports queue length and recent wait / run times.
+"""
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple
+
+from ipo_readiness.services.parser_thai import parse_financial_files
+from ipo_readiness.services.metrics_engine import compute_metrics
+
+ANALYZE_WORKERS = int(os.environ.get("ANALYZE_WORKERS", str(min(2, os.cpu_count() or 1))))
+ANALYZE_QUEUE_DEPTH = int(os.environ.get("ANALYZE_QUEUE_DEPTH", "8"))
+ANALYZE_MAX_UPLOAD_BYTES = int(os.environ.get("ANALYZE_MAX_UPLOAD_MB", "100")) * 1024 * 1024
+_STATS_WINDOW = 200  # recent jobs kept for wait / run percentiles
+
+
+@dataclass
+class UploadedFile:
+    """An upload read into memory, so it can be sent to a worker process. Quacks like werkzeug's FileStorage
+    for parser_thai (filename + stream)."""
+    filename: str
+    data: bytes
+
+    @property
+    def stream(self) -> BytesIO:
+        return BytesIO(self.data)
+
+
+def read_uploads(files) -> List[UploadedFile]:
+    """FileStorage list → UploadedFile list (reads each upload once)."""
+    uploads = []
+    for idx, file in enumerate(files):
+        filename = getattr(file, "filename", "") or getattr(file, "name", f"file_{idx+1}")
+        stream = getattr(file, "stream", file)
+        if hasattr(stream, "seek"):
+            stream.seek(0)
+        uploads.append(UploadedFile(filename=filename, data=stream.read()))
+    return uploads
+
+
+def analyze_files(files) -> Dict[str, Any]:
+    """parse_financial_files + compute_metrics → {"data", "metrics"} (the /api/analyze response body)."""
+    data = parse_financial_files(files)
+    return {"data": data, "metrics": compute_metrics(data)}
+
+
+def _timed_analyze(files: List[UploadedFile]) -> Tuple[float, float, Dict[str, Any]]:
+    started = time.time()
+    result = analyze_files(files)
+    return started, time.time(), result
+
+
+class AnalysisQueueFull(RuntimeError):
+    """Every worker is busy and the wait queue is full. position = where this request would have queued."""
+
+    def __init__(self, queue_length: int, retry_after: int) -> None:
+        super().__init__("ระบบกำลังวิเคราะห์ไฟล์จำนวนมาก กรุณาลองใหม่อีกครั้ง")
+        self.queue_length = queue_length
+        self.position = queue_length + 1
+        self.retry_after = retry_after
+
+
+class _AnalysisExecutor:
+    def __init__(self, workers: int, queue_depth: int) -> None:
+        self._workers = max(1, workers)
+        self._capacity = self._workers + max(0, queue_depth)
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_system = 0  # running + waiting
+        self._waits: deque = deque(maxlen=_STATS_WINDOW)
+        self._runs: deque = deque(maxlen=_STATS_WINDOW)
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+
+    @property
+    def workers(self) -> int:
+        return self._workers
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            return self._ensure_pool()
+
+    def _ensure_pool(self) -> ProcessPoolExecutor:
+        # Created lazily so gunicorn forks before it exists; spawn avoids forking our background threads' locks
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _retry_after(self, waiting: int) -> int:
+        avg_run = (sum(self._runs) / len(self._runs)) if self._runs else 5.0
+        return max(1, int(avg_run * (waiting / self._workers + 1)))
+
+    def admit(self) -> None:
+        """Reserve a place (running or waiting) or raise AnalysisQueueFull. Pair with release()."""
+        with self._lock:
+            if self._in_system >= self._capacity:
+                self._rejected += 1
+                waiting = self._in_system - self._workers
+                raise AnalysisQueueFull(queue_length=waiting, retry_after=self._retry_after(waiting))
+            self._in_system += 1
+
+    def try_admit(self) -> bool:
+        """admit() for callers that wait for a place instead of failing (batches): False when full,
+        not counted as a rejection."""
+        with self._lock:
+            if self._in_system >= self._capacity:
+                return False
+            self._in_system += 1
+            return True
+
+    def release(self, ok: bool, wait: Optional[float] = None, run: Optional[float] = None) -> None:
+        with self._lock:
+            self._in_system -= 1
+            if not ok:
+                self._failed += 1
+                return
+            self._completed += 1
+            if wait is not None:
+                self._waits.append(max(0.0, wait))
+            if run is not None:
+                self._runs.append(run)
+
+    def call(self, fn, *args):
+        """Run fn(*args) in a worker process and wait. Returns (started, finished, result) for timed fns."""
+        pool = self._pool()
+        try:
+            return pool.submit(fn, *args).result()
+        except BrokenProcessPool:
+            with self._lock:
+                if self._executor is pool:
+                    self._executor = None  # a worker died (e.g. OOM on a huge file): start a fresh pool next time
+            raise RuntimeError("การวิเคราะห์ล้มเหลว (worker หยุดทำงาน) กรุณาลองใหม่อีกครั้ง")
+
+    def run(self, files) -> Dict[str, Any]:
+        """Admit, read the uploads, run one analysis and wait for it.
+        files: the uploads, or a callable returning them that is called only after admission (pass one to keep
+        a rejected request from parsing its body). Raises AnalysisQueueFull when saturated; parse errors propagate."""
+        self.admit()
+        try:
+            uploads = read_uploads(files() if callable(files) else files)
+            submitted = time.time()
+            started, finished, result = self.call(_timed_analyze, uploads)
+        except Exception:
+            self.release(ok=False)
+            raise
+        self.release(ok=True, wait=started - submitted, run=finished - started)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._waits)
+            runs = sorted(self._runs)
+            return {
+                "workers": self._workers,
+                "queue_capacity": self._capacity - self._workers,
+                "running": min(self._in_system, self._workers),
+                "queue_length": max(0, self._in_system - self._workers),
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "wait_seconds": _summary(waits),
+                "run_seconds": _summary(runs),
+            }
+
+
+def _summary(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"avg": None, "p95": None, "max": None}
+    return {
+        "avg": round(sum(values) / len(values), 3),
+        "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+        "max": round(values[-1], 3),
+    }
+
+
+analysis_pool = _AnalysisExecutor(ANALYZE_WORKERS, ANALYZE_QUEUE_DEPTH)
+
+
+def run_analysis(files) -> Dict[str, Any]:
+    """Analyze uploads on the bounded pool (see module docstring)."""
+    return analysis_pool.run(files)
+
+
+def analysis_stats() -> Dict[str, Any]:
+    """Queue length, running jobs and recent wait / run times for this worker process."""
+    return analysis_pool.stats()
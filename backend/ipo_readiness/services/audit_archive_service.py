@@ -0,0 +1,287 @@
+"""
+Audit log retention: months older than AUDIT_RETENTION_MONTHS are moved out of the hot audit_logs table
+into gzip-compressed NDJSON files on local disk, indexed in audit_log_archives so admins can still read them.
+
+PostgreSQL: the month's partition is dropped after archiving (any stray rows in audit_logs_default are deleted).
+SQLite: the month's rows are deleted by created_at range, so the table stays a rolling window.
+"""
+from __future__ import annotations
+
+import gzip
+import heapq
+import json
+import os
+import threading
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from ipo_readiness.services.audit_service import (
+    AuditLog,
+    ensure_month_partition,
+    month_start,
+    next_month,
+    partition_name,
+)
+from ipo_readiness.services.db_helper import (
+    get_connection,
+    use_postgres,
+    execute,
+    execute_fetchone,
+    execute_fetchall,
+    iter_rows,
+    decode_cursor,
+    exclusive_lock,
+    sqlite_path,
+)
+
+# Archived rows leave the database, so retention is off unless AUDIT_ARCHIVE_DIR points at storage that survives
+# deploys (a persistent disk, see DEPLOY.md); the default directory next to users.db is wiped on Render
+_ARCHIVE_DIR_SETTING = os.environ.get("AUDIT_ARCHIVE_DIR")
+AUDIT_RETENTION_MONTHS = int(os.environ.get("AUDIT_RETENTION_MONTHS", "12" if _ARCHIVE_DIR_SETTING else "0"))  # 0 = keep everything hot
+_ARCHIVE_DIR = Path(_ARCHIVE_DIR_SETTING or sqlite_path().parent / "audit_archive")
+_MAINTENANCE_INTERVAL = float(os.environ.get("AUDIT_MAINTENANCE_INTERVAL", str(24 * 3600)))
+
+
+class ArchiveMissing(RuntimeError):
+    """An indexed archive file is gone (e.g. not on a persistent disk): its rows cannot be read back."""
+
+    def __init__(self, paths: List[str]) -> None:
+        super().__init__(f"ไม่พบไฟล์ archive ของ audit log: {', '.join(paths)}")
+        self.paths = paths
+
+
+@dataclass
+class AuditArchive:
+    path: str
+    month: str
+    rows: int
+    bytes: int
+    first_created_at: Optional[str]
+    last_created_at: Optional[str]
+    archived_at: Optional[str] = None
+
+
+def init_audit_archive_store() -> None:
+    """Create the archive index table when it does not exist."""
+    with closing(get_connection()) as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS audit_log_archives (
+                path TEXT PRIMARY KEY,
+                month TEXT NOT NULL,
+                rows INTEGER NOT NULL,
+                bytes INTEGER NOT NULL,
+                first_created_at TEXT,
+                last_created_at TEXT,
+                archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_archives_month ON audit_log_archives (month)")
+        conn.commit()
+
+
+def _months_to_archive(conn, cutoff: datetime) -> List[datetime]:
+    row = execute_fetchone(conn, "SELECT MIN(created_at) AS oldest FROM audit_logs")
+    oldest = row["oldest"] if row else None
+    if not oldest:
+        return []
+    if not isinstance(oldest, datetime):
+        oldest = datetime.fromisoformat(str(oldest)[:19])
+    months = []
+    month = month_start(oldest)
+    while month < cutoff:
+        months.append(month)
+        month = next_month(month)
+    return months
+
+
+def _lock_for_archive(conn, month: datetime) -> bool:
+    """PostgreSQL: serialize retention across workers and block writers to the month being moved."""
+    if use_postgres():
+        row = execute_fetchone(conn, "SELECT pg_try_advisory_xact_lock(hashtext('audit_logs_retention')) AS ok")
+        if not row or not row["ok"]:
+            return False
+        exists = execute_fetchone(conn, "SELECT to_regclass(?) AS t", (partition_name(month),))
+        if exists and exists["t"]:
+            execute(conn, f"LOCK TABLE {partition_name(month)} IN SHARE ROW EXCLUSIVE MODE").close()
+        return True
+    # SQLite: archive_month holds exclusive_lock for the whole month; the audit writer keeps going meanwhile,
+    # and the DELETE is bounded by the last id read
+    return True
+
+
+def archive_month(month: datetime) -> Optional[AuditArchive]:
+    """Move one month of audit_logs into a compressed NDJSON file. None when the month is empty or locked.
+    One archive run at a time across processes: another process archiving at the same moment returns None."""
+    with exclusive_lock("audit_archive") as acquired:
+        if not acquired:
+            return None
+        return _archive_month(month)
+
+
+def _archive_month(month: datetime) -> Optional[AuditArchive]:
+    start, end = month_start(month), next_month(month)
+    label = f"{start:%Y-%m}"
+    _ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    path = _ARCHIVE_DIR / f"{partition_name(start)}.{stamp}.ndjson.gz"
+    tmp_path = path.with_suffix(".tmp")
+    with closing(get_connection()) as conn:
+        if not _lock_for_archive(conn, start):
+            conn.rollback()
+            return None
+        count, first, last, max_id = 0, None, None, 0
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as out:
+            for row in iter_rows(
+                conn,
+                """SELECT id, user_id, user_name, action, details, created_at FROM audit_logs
+                   WHERE created_at >= ? AND created_at < ? ORDER BY created_at, id""",
+                (f"{start:%Y-%m-%d %H:%M:%S}", f"{end:%Y-%m-%d %H:%M:%S}"),
+            ):
+                record = {key: row[key] for key in ("id", "user_id", "user_name", "action", "details")}
+                record["created_at"] = str(row["created_at"])
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                count += 1
+                max_id = max(max_id, record["id"])
+                first = first or record["created_at"]
+                last = record["created_at"]
+        if count == 0:
+            tmp_path.unlink(missing_ok=True)
+            conn.rollback()
+            return None
+        os.replace(tmp_path, path)
+        if use_postgres():
+            exists = execute_fetchone(conn, "SELECT to_regclass(?) AS t", (partition_name(start),))
+            if exists and exists["t"]:
+                execute(conn, f"DROP TABLE {partition_name(start)}").close()
+        execute(
+            conn,
+            "DELETE FROM audit_logs WHERE created_at >= ? AND created_at < ? AND id <= ?",
+            (f"{start:%Y-%m-%d %H:%M:%S}", f"{end:%Y-%m-%d %H:%M:%S}", max_id),
+        ).close()
+        archive = AuditArchive(
+            path=str(path), month=label, rows=count, bytes=path.stat().st_size,
+            first_created_at=first, last_created_at=last,
+        )
+        execute(
+            conn,
+            """INSERT INTO audit_log_archives (path, month, rows, bytes, first_created_at, last_created_at)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (archive.path, archive.month, archive.rows, archive.bytes, archive.first_created_at, archive.last_created_at),
+        ).close()
+        conn.commit()
+    return archive
+
+
+def run_audit_retention(retention_months: int = AUDIT_RETENTION_MONTHS) -> List[AuditArchive]:
+    """Archive every month that ended more than retention_months ago. Safe to re-run; a file per run and month."""
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    with closing(get_connection()) as conn:
+        # Keep a partition ready for next month so inserts never land in the default partition
+        ensure_month_partition(conn, now)
+        ensure_month_partition(conn, next_month(now))
+        conn.commit()
+        if retention_months <= 0:
+            return []
+        cutoff = month_start(now)
+        for _ in range(retention_months):
+            cutoff = datetime(cutoff.year - (cutoff.month == 1), (cutoff.month - 2) % 12 + 1, 1)
+        months = _months_to_archive(conn, cutoff)
+    archives = []
+    for month in months:
+        archive = archive_month(month)
+        if archive:
+            archives.append(archive)
+    return archives
+
+
+def start_audit_maintenance() -> None:
+    """Daemon thread: create upcoming partitions and apply retention every AUDIT_MAINTENANCE_INTERVAL seconds.
+    Every process starts the thread, but only the one holding the "audit_maintenance" lock does the work;
+    the others check again each interval and take over when that process goes away."""
+    def _run():
+        while True:
+            try:
+                with exclusive_lock("audit_maintenance") as leader:
+                    while leader:
+                        try:
+                            archived = run_audit_retention()
+                            if archived:
+                                print(f"[INFO] audit retention archived {sum(a.rows for a in archived)} rows: {[a.month for a in archived]}")
+                        except Exception as e:
+                            print(f"[WARN] audit retention failed: {e}")
+                        time.sleep(_MAINTENANCE_INTERVAL)
+            except Exception as e:
+                print(f"[WARN] audit maintenance lock: {e}")
+            time.sleep(_MAINTENANCE_INTERVAL)
+
+    threading.Thread(target=_run, name="audit-maintenance", daemon=True).start()
+
+
+def list_archives(month: Optional[str] = None) -> List[AuditArchive]:
+    """Archive index, newest month first (optionally one YYYY-MM)."""
+    sql = "SELECT path, month, rows, bytes, first_created_at, last_created_at, archived_at FROM audit_log_archives"
+    params: tuple = ()
+    if month:
+        sql += " WHERE month = ?"
+        params = (month,)
+    with closing(get_connection()) as conn:
+        rows = execute_fetchall(conn, sql + " ORDER BY month DESC, archived_at DESC", params)
+    return [
+        AuditArchive(
+            path=row["path"], month=row["month"], rows=row["rows"], bytes=row["bytes"],
+            first_created_at=row["first_created_at"], last_created_at=row["last_created_at"],
+            archived_at=str(row["archived_at"]) if row["archived_at"] else None,
+        )
+        for row in rows
+    ]
+
+
+def _matches(record: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+    for key in ("user_id", "user_name", "action"):
+        if filters.get(key) not in (None, "") and record.get(key) != filters[key]:
+            return False
+    created_at = record.get("created_at") or ""
+    if filters.get("date_from") and created_at < filters["date_from"]:
+        return False
+    date_to = filters.get("date_to")
+    if date_to:
+        if len(date_to) == 10:
+            date_to = f"{date_to} 23:59:59.999999"
+        if created_at > date_to:
+            return False
+    return True
+
+
+def read_archived_logs(
+    month: str,
+    limit: int = 100,
+    filters: Optional[Dict[str, Any]] = None,
+    cursor: Optional[str] = None,
+) -> List[AuditLog]:
+    """One archived month on demand, newest first, same filters and keyset cursor as list_logs.
+    Streams the gzip files, keeping only the best limit rows in memory. ArchiveMissing when a file is gone."""
+    filters = filters or {}
+    position = decode_cursor(cursor)
+
+    archives = list_archives(month)
+    missing = [archive.path for archive in archives if not os.path.exists(archive.path)]
+    if missing:
+        raise ArchiveMissing(missing)  # a short page would look like the whole month
+
+    def records():
+        for archive in archives:
+            with gzip.open(archive.path, "rt", encoding="utf-8") as src:
+                for line in src:
+                    record = json.loads(line)
+                    if position and (record["created_at"], record["id"]) >= position:
+                        continue
+                    if _matches(record, filters):
+                        yield record
+
+    top = heapq.nlargest(limit, records(), key=lambda r: (r["created_at"], r["id"]))
+    return [AuditLog(**record) for record in top]
@@ -1,16 +1,35 @@
 """Service for managing audit logs. Uses SQLite (local) or PostgreSQL (DATABASE_URL)."""
 from __future__ import annotations
 
+import atexit
+import os
+import queue
+import threading
+import time
 from contextlib import closing
 from dataclasses import dataclass
-from typing import List, Optional
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
-from ipo_readiness.services.db_helper import get_connection, use_postgres, execute_fetchone, execute_fetchall, execute_insert
+from ipo_readiness.services.db_helper import (
+    get_connection,
+    use_postgres,
+    execute_fetchone,
+    execute_fetchall,
+    execute_many,
+    keyset_where,
+    iter_newest_first,
+    row_to_dict,
+)
+
+_LOG_FILTERS = {"user_id": "user_id", "user_name": "user_name", "action": "action"}
+_SEARCH_COLUMNS = ("details", "action", "user_name")
+_TRIGRAM = 3  # shortest word the trigram indexes can answer; shorter words fall back to a scan
 
 
 @dataclass
 class AuditLog:
-    id: int
+    id: Optional[int]
     user_id: Optional[int]
     user_name: str
     action: str
@@ -31,54 +50,386 @@ def _row_to_log(row) -> AuditLog:
     )
 
 
+def month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def next_month(value: datetime) -> datetime:
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"audit_logs_{month.year:04d}_{month.month:02d}"
+
+
+def ensure_month_partition(conn, month: datetime) -> None:
+    """PostgreSQL: create the monthly partition for month if missing (no-op on SQLite). Caller commits."""
+    if not use_postgres():
+        return
+    start = month_start(month)
+    cur = conn.cursor()
+    try:
+        cur.execute("SAVEPOINT audit_partition")
+        cur.execute(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(start)} PARTITION OF audit_logs "
+            f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{next_month(start):%Y-%m-%d}')"
+        )
+        cur.execute("RELEASE SAVEPOINT audit_partition")
+    except Exception as e:
+        # e.g. rows for that month already sit in audit_logs_default; they stay there and are archived from it
+        cur.execute("ROLLBACK TO SAVEPOINT audit_partition")
+        print(f"[WARN] audit partition {partition_name(start)}: {e}")
+    finally:
+        cur.close()
+
+
+def _init_partitioned_postgres(cur) -> None:
+    """audit_logs PARTITION BY RANGE (created_at), monthly partitions + DEFAULT; migrates a plain table once."""
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext('audit_logs_init'))")  # one worker migrates, others wait
+    cur.execute("SELECT relkind FROM pg_class WHERE relname = 'audit_logs' AND relkind IN ('r', 'p')")
+    existing = cur.fetchone()
+    legacy = bool(existing) and existing["relkind"] == "r"
+    cur.execute("CREATE SEQUENCE IF NOT EXISTS audit_logs_id_seq")
+    if legacy:
+        cur.execute("ALTER SEQUENCE audit_logs_id_seq OWNED BY NONE")
+        cur.execute("DROP INDEX IF EXISTS idx_audit_logs_created")
+        cur.execute("ALTER TABLE audit_logs RENAME CONSTRAINT audit_logs_pkey TO audit_logs_unpartitioned_pkey")
+        cur.execute("ALTER TABLE audit_logs RENAME TO audit_logs_unpartitioned")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS audit_logs (
+            id INTEGER NOT NULL DEFAULT nextval('audit_logs_id_seq'),
+            user_id INTEGER,
+            user_name TEXT NOT NULL,
+            action TEXT NOT NULL,
+            details TEXT,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    cur.execute("ALTER SEQUENCE audit_logs_id_seq OWNED BY audit_logs.id")
+    cur.execute("CREATE TABLE IF NOT EXISTS audit_logs_default PARTITION OF audit_logs DEFAULT")
+    if legacy:
+        cur.execute(
+            "SELECT DISTINCT date_trunc('month', created_at) AS month FROM audit_logs_unpartitioned WHERE created_at IS NOT NULL"
+        )
+        for row in cur.fetchall():
+            ensure_month_partition(cur.connection, row["month"])
+        cur.execute("""
+            INSERT INTO audit_logs (id, user_id, user_name, action, details, created_at)
+            SELECT id, user_id, user_name, action, details, COALESCE(created_at, CURRENT_TIMESTAMP)
+            FROM audit_logs_unpartitioned
+        """)
+        cur.execute("DROP TABLE audit_logs_unpartitioned")
+
+
 def init_audit_store() -> None:
-    """Create the audit_logs table when it does not exist."""
+    """Create the audit_logs table when it does not exist.
+    PostgreSQL: native monthly partitions (current and next month are created ahead).
+    SQLite: one table kept to a rolling window by the retention job (audit_archive_service)."""
+    with closing(get_connection()) as conn:
+        cur = conn.cursor()
+        if use_postgres():
+            _init_partitioned_postgres(cur)
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            ensure_month_partition(conn, now)
+            ensure_month_partition(conn, next_month(now))
+        else:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS audit_logs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    user_name TEXT NOT NULL,
+                    action TEXT NOT NULL,
+                    details TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_audit_logs_created ON audit_logs (created_at DESC, id DESC)")
+        _init_search_index(cur)
+        conn.commit()
+
+
+def _init_search_index(cur) -> None:
+    """Substring index over details / action / user_name, maintained by the database on every insert/delete.
+    Trigrams on both databases, so a word matches anywhere inside a field (Thai has no spaces between words).
+    PostgreSQL: pg_trgm GIN index per column for ILIKE. SQLite: FTS5 trigram external-content table + triggers."""
     if use_postgres():
-        sql = """
-            CREATE TABLE IF NOT EXISTS audit_logs (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER,
-                user_name TEXT NOT NULL,
-                action TEXT NOT NULL,
-                details TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """
-    else:
-        sql = """
-            CREATE TABLE IF NOT EXISTS audit_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                user_name TEXT NOT NULL,
-                action TEXT NOT NULL,
-                details TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cur.execute("ALTER TABLE audit_logs DROP COLUMN IF EXISTS search_tsv")  # word-based index of older deploys
+        for column in _SEARCH_COLUMNS:
+            cur.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_audit_logs_{column}_trgm ON audit_logs USING GIN ({column} gin_trgm_ops)"
             )
-        """
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_audit_logs_action ON audit_logs (action)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_audit_logs_user_name ON audit_logs (user_name)")
+        return
+    cur.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'audit_logs_fts'")
+    existing = cur.fetchone()
+    if existing is not None and "trigram" not in existing[0]:
+        cur.execute("DROP TABLE audit_logs_fts")  # word tokenizer of older deploys: rebuilt below
+        existing = None
+    cur.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS audit_logs_fts USING fts5(
+            details, action, user_name, content='audit_logs', content_rowid='id', tokenize='trigram'
+        )
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS audit_logs_fts_insert AFTER INSERT ON audit_logs BEGIN
+            INSERT INTO audit_logs_fts (rowid, details, action, user_name)
+            VALUES (new.id, new.details, new.action, new.user_name);
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS audit_logs_fts_delete AFTER DELETE ON audit_logs BEGIN
+            INSERT INTO audit_logs_fts (audit_logs_fts, rowid, details, action, user_name)
+            VALUES ('delete', old.id, old.details, old.action, old.user_name);
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS audit_logs_fts_update AFTER UPDATE ON audit_logs BEGIN
+            INSERT INTO audit_logs_fts (audit_logs_fts, rowid, details, action, user_name)
+            VALUES ('delete', old.id, old.details, old.action, old.user_name);
+            INSERT INTO audit_logs_fts (rowid, details, action, user_name)
+            VALUES (new.id, new.details, new.action, new.user_name);
+        END
+    """)
+    if existing is None:
+        cur.execute("INSERT INTO audit_logs_fts (audit_logs_fts) VALUES ('rebuild')")  # index rows written before FTS
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_audit_logs_action ON audit_logs (action)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_audit_logs_user_name ON audit_logs (user_name)")
+
+
+# Buffered writer: events are queued in memory and flushed as one multi-row INSERT per batch.
+_AUDIT_QUEUE_SIZE = int(os.environ.get("AUDIT_QUEUE_SIZE", "10000"))
+_AUDIT_BATCH_SIZE = int(os.environ.get("AUDIT_BATCH_SIZE", "200"))
+_AUDIT_FLUSH_INTERVAL = float(os.environ.get("AUDIT_FLUSH_INTERVAL", "1.0"))
+# When the queue is full the request waits this long for space, then writes its own event synchronously.
+_AUDIT_ENQUEUE_TIMEOUT = float(os.environ.get("AUDIT_ENQUEUE_TIMEOUT", "0.5"))
+# A failed batch INSERT is retried this many times (0.5 s, 1 s, 2 s, ... capped at 30 s) before it is dropped.
+_AUDIT_WRITE_RETRIES = int(os.environ.get("AUDIT_WRITE_RETRIES", "5"))
+_AUDIT_RETRY_MAX_DELAY = 30.0
+
+_LogRow = Tuple[Optional[int], str, str, str, str]
+
+
+def _insert_logs(rows: List[_LogRow]) -> None:
+    """INSERT a batch of (user_id, user_name, action, details, created_at) in one transaction."""
+    if not rows:
+        return
     with closing(get_connection()) as conn:
-        cur = conn.cursor()
-        cur.execute(sql)
+        execute_many(
+            conn,
+            "INSERT INTO audit_logs (user_id, user_name, action, details, created_at) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
         conn.commit()
 
 
-def log_action(user_id: Optional[int], user_name: str, action: str, details: str = "") -> AuditLog:
-    """Record a new audit log entry."""
+class _AuditWriter:
+    """Background thread draining a bounded queue into batched INSERTs (size or time trigger)."""
+
+    def __init__(self, maxsize: int, batch_size: int, interval: float) -> None:
+        self._queue: "queue.Queue[_LogRow]" = queue.Queue(maxsize=maxsize)
+        self._batch_size = batch_size
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self.dropped = 0  # events given up on after _AUDIT_WRITE_RETRIES
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, row: _LogRow) -> None:
+        self._ensure_started()
+        try:
+            self._queue.put(row, timeout=_AUDIT_ENQUEUE_TIMEOUT)
+        except queue.Full:
+            _insert_logs([row])  # backpressure: the caller pays for its own write instead of dropping it
+
+    def _drain(self, batch: List[_LogRow]) -> List[_LogRow]:
+        while len(batch) < self._batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[_LogRow]) -> None:
+        """INSERT the batch, retrying with exponential backoff (e.g. database locked or restarting).
+        Events stay in the batch, in order, until written; only after the last retry are they counted as dropped."""
+        delay = 0.5
+        for attempt in range(_AUDIT_WRITE_RETRIES + 1):
+            try:
+                _insert_logs(batch)
+                return
+            except Exception as e:
+                if attempt == _AUDIT_WRITE_RETRIES:
+                    self.dropped += len(batch)
+                    print(
+                        f"[ERROR] audit writer: dropped {len(batch)} events after {attempt + 1} attempts "
+                        f"({self.dropped} dropped since start): {e}"
+                    )
+                    return
+                print(f"[WARN] audit writer: failed to write {len(batch)} events, retrying in {delay:g}s: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, _AUDIT_RETRY_MAX_DELAY)
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                first = self._queue.get(timeout=self._interval)
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self._interval
+            batch = self._drain([first])
+            # Size trigger: write now. Otherwise block on the queue until the interval ends or the batch fills.
+            while len(batch) < self._batch_size and not self._stopping.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                self._drain(batch)
+            self._write(batch)
+
+    def flush(self) -> None:
+        """Write everything queued so far from the calling thread (shutdown / tests)."""
+        while True:
+            batch = self._drain([])
+            if not batch:
+                return
+            self._write(batch)
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self._interval + 5)  # let an in-flight batch finish
+        self.flush()
+
+
+_writer = _AuditWriter(_AUDIT_QUEUE_SIZE, _AUDIT_BATCH_SIZE, _AUDIT_FLUSH_INTERVAL)
+atexit.register(_writer.stop)
+
+
+def enqueue_action(user_id: Optional[int], user_name: str, action: str, details: str = "") -> AuditLog:
+    """Queue an audit event for the background writer and return at once (id is assigned on flush)."""
+    created_at = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    _writer.submit((user_id, user_name, action, details, created_at))
+    return AuditLog(id=None, user_id=user_id, user_name=user_name, action=action, details=details, created_at=created_at)
+
+
+def flush_audit_queue() -> None:
+    """Write all queued audit events now."""
+    _writer.flush()
+
+
+@dataclass
+class AuditSearchResult:
+    logs: List[AuditLog]
+    facets: Dict[str, List[Dict[str, Any]]]
+    total: Optional[int] = None  # whole match set, computed with the facets
+
+
+_FACET_LIMIT = 20
+
+
+def _like_pattern(word: str) -> str:
+    return "%" + word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _search_where(q: str, filters: Optional[Dict[str, Any]], cursor: Optional[str]):
+    """Every word of q must occur, as a substring (case-insensitive), in details, action or user_name.
+    Same rule on both databases: ILIKE over the pg_trgm indexes, or one FTS5 trigram MATCH for the words
+    of 3+ characters on SQLite (shorter ones, which trigrams cannot index, use LIKE on the row)."""
+    where, params = keyset_where("l", filters, cursor, _LOG_FILTERS)
+    source = "FROM audit_logs l"
+    words = q.split()
+    if not words:
+        return source, where, params
+    conditions: List[str] = []
+    match_params: List[Any] = []
+    like = "ILIKE" if use_postgres() else "LIKE"
+    if not use_postgres():
+        indexed = [w for w in words if len(w) >= _TRIGRAM]
+        if indexed:
+            source = "FROM audit_logs l JOIN audit_logs_fts ON audit_logs_fts.rowid = l.id"
+            conditions.append("audit_logs_fts MATCH ?")
+            match_params.append(" ".join('"' + w.replace('"', '""') + '"' for w in indexed))  # quoted: no FTS syntax
+        words = [w for w in words if len(w) < _TRIGRAM]
+    for word in words:
+        conditions.append("(" + " OR ".join(f"l.{c} {like} ? ESCAPE '\\'" for c in _SEARCH_COLUMNS) + ")")
+        match_params.extend([_like_pattern(word)] * len(_SEARCH_COLUMNS))
+    match_sql = " AND ".join(conditions)
+    where = f"{where} AND {match_sql}" if where else f"WHERE {match_sql}"
+    return source, where, params + match_params
+
+
+def search_logs(
+    q: str = "",
+    filters: Optional[Dict[str, Any]] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    with_facets: bool = True,
+) -> AuditSearchResult:
+    """Free-text search in details/action/user plus the list_logs filters; keyset page (created_at, id) DESC.
+    Facets: counts per action and per user over the whole match set (first page only, top 20 each), plus total."""
+    source, where, params = _search_where(q, filters, cursor)
+    columns = "l.id, l.user_id, l.user_name, l.action, l.details, l.created_at"
+    facets: Dict[str, List[Dict[str, Any]]] = {}
+    total = None
     with closing(get_connection()) as conn:
-        log_id = execute_insert(
+        rows = execute_fetchall(
             conn,
-            "INSERT INTO audit_logs (user_id, user_name, action, details) VALUES (?, ?, ?, ?)",
-            (user_id, user_name, action, details),
+            f"SELECT {columns} {source} {where} ORDER BY l.created_at DESC, l.id DESC LIMIT ?",
+            tuple(params) + (limit,),
         )
-        row = execute_fetchone(conn, "SELECT * FROM audit_logs WHERE id = ?", (log_id,))
-    return _row_to_log(row)
+        if with_facets:
+            facet_source, facet_where, facet_params = _search_where(q, filters, None)
+            total = execute_fetchone(
+                conn, f"SELECT COUNT(*) AS n {facet_source} {facet_where}", tuple(facet_params)
+            )["n"]
+            for name, column in (("action", "l.action"), ("user", "l.user_name")):
+                facet_rows = execute_fetchall(
+                    conn,
+                    f"""SELECT {column} AS value, COUNT(*) AS count {facet_source} {facet_where}
+                        GROUP BY {column} ORDER BY count DESC LIMIT ?""",
+                    tuple(facet_params) + (_FACET_LIMIT,),
+                )
+                facets[name] = [{"value": r["value"], "count": r["count"]} for r in facet_rows]
+    return AuditSearchResult(logs=[_row_to_log(row) for row in rows], facets=facets, total=total)
 
 
-def list_logs(limit: int = 100) -> List[AuditLog]:
-    """List recent audit logs."""
+def list_logs(
+    limit: int = 100,
+    filters: Optional[Dict[str, Any]] = None,
+    cursor: Optional[str] = None,
+) -> List[AuditLog]:
+    """List recent audit logs (keyset on created_at, id). filters: user_id, user_name, action, date_from, date_to."""
+    where, params = keyset_where("", filters, cursor, _LOG_FILTERS)
+    params.append(limit)
     with closing(get_connection()) as conn:
         rows = execute_fetchall(
             conn,
-            "SELECT * FROM audit_logs ORDER BY created_at DESC LIMIT ?",
-            (limit,),
+            f"SELECT * FROM audit_logs {where} ORDER BY created_at DESC, id DESC LIMIT ?",
+            tuple(params),
         )
     return [_row_to_log(row) for row in rows]
+
+
+AUDIT_EXPORT_COLUMNS = ["id", "user_id", "user_name", "action", "details", "created_at"]
+
+
+def iter_logs(filters: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    """Export: every audit log matching list_logs' filters, newest first, streamed (iter_newest_first)."""
+    for row in iter_newest_first(
+        "SELECT id, user_id, user_name, action, details, created_at FROM audit_logs", filters, _LOG_FILTERS
+    ):
+        yield row_to_dict(row)
@@ -0,0 +1,231 @@
+"""Batch analysis (/api/analyze/batch): a zip with one folder per company, analyzed concurrently, one result each.
+
+Each folder is one company: its workbooks are parsed and merged like a single /api/analyze upload, so a file
+from another company fails that folder only. Workbooks at the top level of the zip are grouped by the company
+name in their header rows (sniff_company_name, no full load) and each group then runs like a folder.
+Every company takes its own place on the analysis pool (analysis_service), waiting while the pool is full, so a
+batch shares ANALYZE_WORKERS / ANALYZE_QUEUE_DEPTH with single uploads instead of going around them. At most
+ANALYZE_WORKERS companies are in flight and a company's files are read out of the zip only when it starts,
+so memory follows the concurrency rather than the size of the bundle.
+"""
+from __future__ import annotations
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import PurePosixPath
+from typing import Any, Dict, Iterator, List, Optional
+
+from ipo_readiness.services.analysis_service import UploadedFile, analysis_pool, analyze_files
+from ipo_readiness.services.parser_thai import sniff_company_name
+
+WORKBOOK_EXTENSIONS = (".xlsx", ".xlsm", ".xls")
+BATCH_MAX_FILES = int(os.environ.get("ANALYZE_BATCH_MAX_FILES", "1000"))
+BATCH_MAX_FILE_BYTES = int(os.environ.get("ANALYZE_BATCH_MAX_FILE_MB", "50")) * 1024 * 1024
+BATCH_MAX_MEMBERS = int(os.environ.get("ANALYZE_BATCH_MAX_MEMBERS", "5000"))  # every zip entry, not only workbooks
+BATCH_MAX_TOTAL_BYTES = int(os.environ.get("ANALYZE_BATCH_MAX_TOTAL_MB", "500")) * 1024 * 1024  # uncompressed
+_SPOOL_BYTES = 8 * 1024 * 1024  # bundles above this are kept in a temp file while the batch runs
+_ADMIT_POLL = 0.5  # seconds between tries for a place on a full analysis pool
+
+
+@dataclass
+class _Unit:
+    """One company to analyze: a folder's workbooks, or top-level workbooks with the same company name."""
+    index: int
+    folder: Optional[str]
+    members: List[zipfile.ZipInfo] = field(default_factory=list)
+
+    @property
+    def files(self) -> List[str]:
+        return [m.filename for m in self.members]
+
+
+def _is_workbook(member: zipfile.ZipInfo) -> bool:
+    path = PurePosixPath(member.filename)
+    if member.is_dir() or path.parts[0] == "__MACOSX":
+        return False
+    if path.name.startswith((".", "~$")):  # Finder metadata, Excel lock files
+        return False
+    return path.suffix.lower() in WORKBOOK_EXTENSIONS
+
+
+def _open_bundle(stream) -> tuple:
+    """zip → (archive, {folder: members}, top-level members). ValueError for a bad, empty or oversized bundle.
+    The limits are read from the central directory (declared sizes, which zipfile enforces while extracting),
+    so a zip bomb is turned away before any company is analyzed."""
+    try:
+        archive = zipfile.ZipFile(stream)
+    except zipfile.BadZipFile:
+        raise ValueError("ไฟล์ที่อัปโหลดไม่ใช่ zip ที่ถูกต้อง")
+    try:
+        entries = archive.infolist()
+        if len(entries) > BATCH_MAX_MEMBERS:
+            raise ValueError(f"zip มีไฟล์เกิน {BATCH_MAX_MEMBERS} ไฟล์")
+        members = [m for m in entries if _is_workbook(m)]
+        if not members:
+            raise ValueError("ไม่พบไฟล์ Excel (.xlsx / .xls) ใน zip")
+        if len(members) > BATCH_MAX_FILES:
+            raise ValueError(f"zip มีไฟล์ Excel เกิน {BATCH_MAX_FILES} ไฟล์")
+        too_big = [m.filename for m in members if m.file_size > BATCH_MAX_FILE_BYTES]
+        if too_big:
+            raise ValueError(f"ไฟล์ใหญ่เกิน {BATCH_MAX_FILE_BYTES // (1024 * 1024)} MB: {', '.join(too_big[:5])}")
+        if sum(m.file_size for m in members) > BATCH_MAX_TOTAL_BYTES:
+            raise ValueError(f"ไฟล์ Excel ใน zip รวมกันเกิน {BATCH_MAX_TOTAL_BYTES // (1024 * 1024)} MB เมื่อแตกไฟล์")
+    except Exception:
+        archive.close()
+        raise
+
+    parts = [PurePosixPath(m.filename).parts for m in members]
+    # Zipping the parent folder adds one common directory above the company folders: skip it
+    skip = 1 if len({p[0] for p in parts}) == 1 and all(len(p) > 2 for p in parts) else 0
+    folders: Dict[str, List[zipfile.ZipInfo]] = {}
+    loose: List[zipfile.ZipInfo] = []
+    for member, path in zip(members, parts):
+        if len(path) - skip > 1:
+            folders.setdefault(path[skip], []).append(member)  # CompanyA/2566/x.xlsx belongs to CompanyA
+        else:
+            loose.append(member)
+    return archive, folders, loose
+
+
+def _read_member(archive: zipfile.ZipFile, member: zipfile.ZipInfo) -> UploadedFile:
+    return UploadedFile(filename=PurePosixPath(member.filename).name, data=archive.read(member))
+
+
+class BatchRun:
+    """Iterate to run the batch: yields one result dict per company as it finishes, then a summary.
+    The place reserved on the analysis pool when the batch is accepted goes to the first company; the others
+    admit themselves. close() (client gone) cancels companies not started; the zip is closed once the ones
+    still running have finished, and those count as failed on the pool.
+    stream: the zip, or a callable returning it that is called only after admission (as analysis_pool.run)."""
+
+    def __init__(self, stream) -> None:
+        analysis_pool.admit()  # AnalysisQueueFull (503) when saturated right now, before the body is read
+        # Own copy of the upload: the request's file is closed once the view returns, before the body streams
+        self._bundle = tempfile.SpooledTemporaryFile(max_size=_SPOOL_BYTES)
+        try:
+            shutil.copyfileobj(stream() if callable(stream) else stream, self._bundle)
+            self._archive, folders, self._loose = _open_bundle(self._bundle)
+        except Exception:
+            self._bundle.close()
+            analysis_pool.release(ok=False)
+            raise
+        self._units = [_Unit(index=i, folder=name, members=members) for i, (name, members) in enumerate(folders.items())]
+        self._lock = threading.Lock()
+        self._reserved = True  # the place taken above, not yet handed to a company
+        self._aborted = threading.Event()
+        self._closed = False
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._in_flight: set = set()  # futures of companies submitted and not yet yielded
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        started = time.time()
+        succeeded = failed = 0
+        self._executor = ThreadPoolExecutor(max_workers=analysis_pool.workers, thread_name_prefix="analyze-batch")
+        try:
+            units = self._units + self._group_loose(first_index=len(self._units))
+            for result in self._run(units):
+                succeeded, failed = succeeded + (result["status"] == "ok"), failed + (result["status"] != "ok")
+                yield result
+            yield {
+                "status": "summary",
+                "companies": succeeded + failed,
+                "succeeded": succeeded,
+                "failed": failed,
+                "seconds": round(time.time() - started, 3),
+            }
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            reserved, self._reserved = self._reserved, False
+        self._aborted.set()  # companies finishing from now on were abandoned by the client
+        if reserved:
+            analysis_pool.release(ok=False)
+        if self._executor is None:
+            self._close_files()
+            return
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if all(future.done() for future in list(self._in_flight)):
+            self._close_files()
+        else:
+            # Running companies are reading the zip and hold pool places: close it after them, off the request thread
+            threading.Thread(target=self._close_after_running, name="analyze-batch-close", daemon=True).start()
+
+    def _close_after_running(self) -> None:
+        self._executor.shutdown(wait=True)
+        self._close_files()
+
+    def _close_files(self) -> None:
+        self._archive.close()
+        self._bundle.close()
+
+    def _admit(self) -> bool:
+        """A place on the analysis pool for one company, waiting while the pool is full. False once aborted."""
+        with self._lock:
+            if self._reserved:
+                self._reserved = False
+                return True
+        while not self._aborted.is_set():
+            if analysis_pool.try_admit():
+                return True
+            self._aborted.wait(_ADMIT_POLL)
+        return False
+
+    def _analyze(self, unit: _Unit) -> Dict[str, Any]:
+        base = {"index": unit.index, "folder": unit.folder, "files": unit.files}
+        if not self._admit():
+            return {**base, "status": "error", "error": "ยกเลิกแล้ว"}
+        started = time.time()
+        try:
+            uploads = [_read_member(self._archive, m) for m in unit.members]
+            result = analysis_pool.call(analyze_files, uploads)
+        except Exception as exc:
+            analysis_pool.release(ok=False)
+            return {**base, "status": "error", "error": str(exc)}
+        seconds = time.time() - started
+        analysis_pool.release(ok=not self._aborted.is_set(), run=seconds)
+        return {
+            **base,
+            "status": "ok",
+            "company_name": result["data"].get("company_name"),
+            "seconds": round(seconds, 3),
+            **result,
+        }
+
+    def _run(self, units: List[_Unit]) -> Iterator[Dict[str, Any]]:
+        """Keep at most `workers` companies in flight; yield each result as soon as it is ready."""
+        queue = iter(units)
+        while True:
+            for unit in queue:
+                self._in_flight.add(self._executor.submit(self._analyze, unit))
+                if len(self._in_flight) >= analysis_pool.workers:
+                    break
+            if not self._in_flight:
+                return
+            done, _ = wait(self._in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                self._in_flight.discard(future)
+                yield future.result()
+
+    def _group_loose(self, first_index: int) -> List[_Unit]:
+        """Top-level workbooks by the company name in their header rows, one file in memory at a time.
+        A file without a readable name is a company of its own (its analysis reports why)."""
+        groups: Dict[str, _Unit] = {}
+        for member in self._loose:
+            key = member.filename
+            try:
+                key = sniff_company_name(_read_member(self._archive, member)) or key
+            except Exception:
+                pass
+            groups.setdefault(key, _Unit(index=first_index + len(groups), folder=None)).members.append(member)
+        return list(groups.values())
@@ -0,0 +1,151 @@
+"""
+Cross-worker cache invalidation bus: table-level version counters shared by every gunicorn worker.
+
+Service writes call publish("users", ...) after commit; in-process caches remember version(table)
+when they load and reload lazily once it changes, so a write handled by one worker is seen by all.
+
+PostgreSQL: publish sends NOTIFY on one channel; each worker LISTENs on a daemon thread and bumps
+its local counters. If the listener connection drops, every table is treated as changed.
+SQLite: one 8-byte counter file per table next to users.db, incremented under a file lock so
+publishes from several processes on the same host are never lost; the version is its value.
+"""
+from __future__ import annotations
+
+import os
+import select
+import threading
+import time
+from contextlib import closing
+from typing import Dict, Tuple
+
+from ipo_readiness.services.db_helper import get_connection, use_postgres, execute, lock_file, sqlite_path
+
+_CHANNEL = "ipo_cache_invalidate"
+_VERSION_DIR = sqlite_path().parent / ".cache_versions"
+_LISTEN_TIMEOUT = 30.0
+_RECONNECT_DELAY = 5.0
+_COUNTER_BYTES = 8
+
+_lock = threading.Lock()
+_local_versions: Dict[str, int] = {}
+_epoch = 0  # bumped when notifications may have been missed (listener reconnect)
+_listener_started = False
+
+
+def _bump_local(table: str) -> None:
+    with _lock:
+        _local_versions[table] = _local_versions.get(table, 0) + 1
+
+
+def _bump_all() -> None:
+    global _epoch
+    with _lock:
+        _epoch += 1
+
+
+def _listen_forever() -> None:
+    while True:
+        try:
+            with closing(get_connection()) as conn:
+                conn.autocommit = True
+                cur = conn.cursor()
+                cur.execute(f"LISTEN {_CHANNEL}")
+                _bump_all()  # anything published before LISTEN took effect is unknown
+                while True:
+                    ready, _, _ = select.select([conn], [], [], _LISTEN_TIMEOUT)
+                    if not ready:
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        _bump_local(conn.notifies.pop(0).payload)
+        except Exception as e:
+            print(f"[WARN] cache bus listener: {e}")
+            _bump_all()
+            time.sleep(_RECONNECT_DELAY)
+
+
+def _ensure_listener() -> None:
+    global _listener_started
+    if _listener_started:
+        return
+    with _lock:
+        if _listener_started:
+            return
+        _listener_started = True
+    threading.Thread(target=_listen_forever, name="cache-bus-listener", daemon=True).start()
+
+
+def _version_file(table: str):
+    return _VERSION_DIR / table
+
+
+def publish(*tables: str) -> None:
+    """Announce that rows in these tables changed (call after commit)."""
+    if not tables:
+        return
+    if use_postgres():
+        for table in tables:
+            _bump_local(table)  # read-your-writes in this worker without waiting for the echo
+        try:
+            with closing(get_connection()) as conn:
+                for table in tables:
+                    execute(conn, "SELECT pg_notify(?, ?)", (_CHANNEL, table)).close()
+                conn.commit()
+        except Exception as e:
+            print(f"[WARN] cache bus publish {tables}: {e}")
+        return
+    _VERSION_DIR.mkdir(parents=True, exist_ok=True)
+    for table in tables:
+        fd = os.open(str(_version_file(table)), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            lock_file(fd)
+            value = (int.from_bytes(os.read(fd, _COUNTER_BYTES), "big") + 1) % (1 << 8 * _COUNTER_BYTES)
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.write(fd, value.to_bytes(_COUNTER_BYTES, "big"))
+        finally:
+            os.close(fd)  # releases the lock
+
+
+def version(table: str) -> Tuple[int, int]:
+    """Current version of a table as seen by this worker; compare for equality only."""
+    if use_postgres():
+        _ensure_listener()
+        with _lock:
+            return _epoch, _local_versions.get(table, 0)
+    try:
+        with open(_version_file(table), "rb") as f:
+            return 0, int.from_bytes(f.read(_COUNTER_BYTES), "big")
+    except FileNotFoundError:
+        return 0, 0
+
+
+def versions(*tables: str) -> Tuple[Tuple[int, int], ...]:
+    """Combined version stamp for a cache entry derived from several tables."""
+    return tuple(version(table) for table in tables)
+
+
+class VersionedValue:
+    """One cached value, reloaded when any of its source tables is published or after ttl seconds."""
+
+    def __init__(self, tables: Tuple[str, ...], ttl: float, loader) -> None:
+        self._tables = tables
+        self._ttl = ttl
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._entries: Dict[object, tuple] = {}
+
+    def get(self, key: object = None):
+        stamp = versions(*self._tables)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == stamp and now - entry[1] < self._ttl:
+                return entry[2]
+        value = self._loader() if key is None else self._loader(key)
+        with self._lock:
+            self._entries[key] = (stamp, now, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -2,19 +2,32 @@
 from __future__ import annotations
 
 import json
+import os
+import threading
+import zlib
 from contextlib import closing
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional
 
+from ipo_readiness.services import cache_bus
+from ipo_readiness.services.facts_service import write_facts, delete_facts
 from ipo_readiness.services.db_helper import (
     get_connection,
     use_postgres,
+    execute,
     execute_fetchone,
     execute_fetchall,
     execute_insert,
-    execute_commit,
+    execute_many,
+    exclusive_lock,
+    keyset_where,
+    borrow_connection,
+    insert_returning_id,
+    blob_bytes,
+    iter_newest_first,
+    row_to_dict,
 )
-from ipo_readiness.services.user_service import list_users
+from ipo_readiness.services.user_service import list_users, user_names
 
 
 @dataclass
@@ -28,6 +41,7 @@ class Project:
     risk: str
     user_id: Optional[int] = None
     assessed_by: Optional[str] = None
+    created_at: Optional[str] = None
 
 
 @dataclass
@@ -53,6 +67,7 @@ class AssessmentRow:
     next_milestone: str
     risk: str
     created_at: Optional[str] = None
+    user_id: Optional[int] = None
 
 
 def _row_get(row, key: str, default=None):
@@ -76,9 +91,70 @@ def _row_to_project(row) -> Project:
         risk=row["risk"],
         user_id=_row_get(row, "user_id"),
         assessed_by=_row_get(row, "assessed_by"),
+        created_at=str(_row_get(row, "created_at")) if _row_get(row, "created_at") else None,
+    )
+
+
+def _row_to_assessment(row) -> AssessmentRow:
+    return AssessmentRow(
+        id=_row_get(row, "id") or 0,
+        company_name=_row_get(row, "company_name") or "",
+        assessed_by=_row_get(row, "assessed_by"),
+        readiness_score=int(_row_get(row, "readiness_score") or 0),
+        phase=_row_get(row, "phase") or "",
+        status=_row_get(row, "status") or "",
+        next_milestone=_row_get(row, "next_milestone") or "",
+        risk=_row_get(row, "risk") or "Low",
+        created_at=str(_row_get(row, "created_at")) if _row_get(row, "created_at") else None,
+        user_id=_row_get(row, "user_id"),
+    )
+
+
+_PROJECT_COLUMNS = "id, client, phase, readiness, status, next_milestone, risk, user_id, created_at"
+_ASSESSMENT_COLUMNS = "id, company_name, user_id, readiness_score, phase, status, next_milestone, risk, created_at"
+
+
+def _insert_returning_with_assessor(conn, table: str, columns: str, insert_sql: str, params: tuple):
+    """INSERT one row and return it joined with users.name AS assessed_by (no commit).
+    PostgreSQL: single statement (INSERT ... RETURNING inside a CTE). SQLite: INSERT + lookup by primary key."""
+    if use_postgres():
+        return execute_fetchone(
+            conn,
+            f"""WITH ins AS ({insert_sql} RETURNING {columns})
+                SELECT ins.*, u.name AS assessed_by FROM ins LEFT JOIN users u ON ins.user_id = u.id""",
+            params,
+        )
+    cur = execute(conn, insert_sql, params)
+    new_id = cur.lastrowid
+    cur.close()
+    return _fetch_by_id_with_assessor(conn, table, columns, new_id)
+
+
+def _fetch_by_id_with_assessor(conn, table: str, columns: str, row_id: int):
+    cols = ", ".join(f"t.{c.strip()}" for c in columns.split(","))
+    return execute_fetchone(
+        conn,
+        f"SELECT {cols}, u.name AS assessed_by FROM {table} t LEFT JOIN users u ON t.user_id = u.id WHERE t.id = ?",
+        (row_id,),
     )
 
 
+def get_project(project_id: int) -> Optional[Project]:
+    """Fetch one project by id (with assessed_by)."""
+    with closing(get_connection()) as conn:
+        row = _fetch_by_id_with_assessor(conn, "projects", _PROJECT_COLUMNS, project_id)
+    return _row_to_project(row) if row else None
+
+
+def get_assessment(assessment_id: int, filter_by_user_id: Optional[int] = None) -> Optional[AssessmentRow]:
+    """Fetch one Client Portfolio row by id (with assessed_by). filter_by_user_id: another user's row is None."""
+    with closing(get_connection()) as conn:
+        row = _fetch_by_id_with_assessor(conn, "assessments", _ASSESSMENT_COLUMNS, assessment_id)
+    if row is None or (filter_by_user_id is not None and _row_get(row, "user_id") != filter_by_user_id):
+        return None
+    return _row_to_assessment(row)
+
+
 def init_dashboard_store() -> None:
     """Create the dashboard tables when they do not exist."""
     if use_postgres():
@@ -181,8 +257,48 @@ def init_dashboard_store() -> None:
         except Exception:
             pass  # column may already exist
         conn.commit()
+        # Full metrics document per assessment, zlib-compressed JSON, kept out of the rows that listings scan
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS assessment_metrics (
+                assessment_id INTEGER PRIMARY KEY,
+                encoding TEXT NOT NULL DEFAULT 'zlib+json',
+                raw_size INTEGER NOT NULL DEFAULT 0,
+                metrics {"BYTEA" if use_postgres() else "BLOB"} NOT NULL
+            )
+        """)
+        # Portfolio aggregates maintained by the assessment write paths (one row per user × phase × status × risk)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS portfolio_summary (
+                user_id INTEGER NOT NULL DEFAULT 0,
+                phase TEXT NOT NULL DEFAULT '',
+                status TEXT NOT NULL DEFAULT '',
+                risk TEXT NOT NULL DEFAULT '',
+                assessments INTEGER NOT NULL DEFAULT 0,
+                readiness_sum INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, phase, status, risk)
+            )
+        """)
+        # One row per one-time data migration that has completed (see start_project_owner_backfill)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS data_migrations (
+                name TEXT PRIMARY KEY,
+                completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.commit()
+        # Indexes for keyset pages ordered by (created_at, id) and the portfolio filters
+        for index_sql in (
+            "CREATE INDEX IF NOT EXISTS idx_assessments_created ON assessments (created_at DESC, id DESC)",
+            "CREATE INDEX IF NOT EXISTS idx_assessments_user_created ON assessments (user_id, created_at DESC, id DESC)",
+            "CREATE INDEX IF NOT EXISTS idx_assessments_company_created ON assessments (company_name, created_at DESC, id DESC)",
+            "CREATE INDEX IF NOT EXISTS idx_projects_created ON projects (created_at DESC, id DESC)",
+            "CREATE INDEX IF NOT EXISTS idx_projects_user_created ON projects (user_id, created_at DESC, id DESC)",
+        ):
+            cur.execute(index_sql)
+        conn.commit()
 
     _seed_team_if_empty()
+    _build_portfolio_summary_if_empty()
 
 
 def _seed_team_if_empty() -> None:
@@ -206,127 +322,440 @@ def _seed_team_if_empty() -> None:
                 )
 
 
-def _backfill_assessed_by(projects: List[Project]) -> List[Project]:
-    """Fill assessed_by from assessments table and persist user_id to projects for next load."""
-    need_fill = [p for p in projects if not p.assessed_by and p.client]
-    if not need_fill:
-        return projects
-    clients = list({p.client for p in need_fill})
-    user_id_to_name = {u.id: u.name for u in list_users()}
-    client_to_name = {}
-    client_to_user_id = {}
+def backfill_project_owners(after_id: int = 0, batch_size: int = 500) -> Dict[str, Any]:
+    """Set projects.user_id from the latest assessment of the same client for one batch of unowned projects.
+    Incremental: pass the returned last_id back as after_id to continue. done=True when no unowned projects remain past it."""
     with closing(get_connection()) as conn:
-        placeholders = ",".join("?" * len(clients))
-        if use_postgres():
-            sql = f"""
-                SELECT DISTINCT ON (company_name) company_name, user_id
-                FROM assessments
-                WHERE company_name IN ({placeholders}) AND user_id IS NOT NULL
-                ORDER BY company_name, created_at DESC
-            """
-        else:
-            sql = f"""
-                SELECT a.company_name, a.user_id
-                FROM assessments a
-                WHERE a.company_name IN ({placeholders}) AND a.user_id IS NOT NULL
-                AND a.created_at = (SELECT MAX(a2.created_at) FROM assessments a2 WHERE a2.company_name = a.company_name)
-            """
-        rows = execute_fetchall(conn, sql, tuple(clients))
-        for row in rows:
-            c = _row_get(row, "company_name")
-            uid = _row_get(row, "user_id")
-            if c and uid and uid in user_id_to_name:
-                client_to_name[c] = user_id_to_name[uid]
-                client_to_user_id[c] = uid
-        # Persist user_id to projects so next time the join returns assessed_by
-        for c, uid in client_to_user_id.items():
-            try:
-                execute_commit(conn, "UPDATE projects SET user_id = ? WHERE client = ? AND (user_id IS NULL OR user_id = 0)", (uid, c))
-            except Exception:
-                pass
-    if not client_to_name:
-        return projects
-    out = []
-    for p in projects:
-        if not p.assessed_by and p.client in client_to_name:
-            uid = client_to_user_id.get(p.client)
-            out.append(Project(
-                p.id, p.client, p.phase, p.readiness, p.status, p.next_milestone, p.risk,
-                user_id=uid or p.user_id, assessed_by=client_to_name[p.client],
-            ))
-        else:
-            out.append(p)
-    return out
-
-
-def list_projects() -> List[Project]:
+        rows = execute_fetchall(
+            conn,
+            "SELECT id, client FROM projects WHERE (user_id IS NULL OR user_id = 0) AND id > ? ORDER BY id LIMIT ?",
+            (after_id, batch_size),
+        )
+        if not rows:
+            return {"scanned": 0, "updated": 0, "last_id": after_id, "done": True}
+        clients = sorted({_row_get(row, "client") for row in rows if _row_get(row, "client")})
+        client_to_user_id = {}
+        if clients:
+            placeholders = ",".join("?" * len(clients))
+            owner_rows = execute_fetchall(
+                conn,
+                f"""SELECT company_name, user_id FROM (
+                        SELECT a.company_name, a.user_id,
+                               ROW_NUMBER() OVER (PARTITION BY a.company_name ORDER BY a.created_at DESC, a.id DESC) AS rn
+                        FROM assessments a JOIN users u ON a.user_id = u.id
+                        WHERE a.company_name IN ({placeholders})
+                    ) latest
+                    WHERE rn = 1""",
+                tuple(clients),
+            )
+            client_to_user_id = {_row_get(r, "company_name"): _row_get(r, "user_id") for r in owner_rows}
+        updates = [
+            (client_to_user_id[_row_get(row, "client")], _row_get(row, "id"))
+            for row in rows
+            if _row_get(row, "client") in client_to_user_id
+        ]
+        if updates:
+            execute_many(conn, "UPDATE projects SET user_id = ? WHERE id = ?", updates)
+            conn.commit()
+    if updates:
+        cache_bus.publish("projects")
+    return {
+        "scanned": len(rows),
+        "updated": len(updates),
+        "last_id": _row_get(rows[-1], "id"),
+        "done": len(rows) < batch_size,
+    }
+
+
+_OWNER_BACKFILL = "project_owner_backfill"
+
+
+def _migration_done(name: str) -> bool:
+    with closing(get_connection()) as conn:
+        return execute_fetchone(conn, "SELECT 1 AS done FROM data_migrations WHERE name = ?", (name,)) is not None
+
+
+def _mark_migration_done(name: str) -> None:
+    with closing(get_connection()) as conn:
+        execute(
+            conn,
+            "INSERT INTO data_migrations (name) VALUES (?) ON CONFLICT (name) DO NOTHING",
+            (name,),
+        ).close()
+        conn.commit()
+
+
+def start_project_owner_backfill(batch_size: int = 500) -> None:
+    """One-time migration for projects saved before user_id was set at write time; runs in a daemon thread.
+    Skipped once recorded in data_migrations; while it runs, other processes starting up leave it to the one
+    holding the lock. POST /api/admin/backfill/project-owners re-runs it by hand."""
+    if _migration_done(_OWNER_BACKFILL):
+        return
+
+    def _run():
+        after_id = 0
+        try:
+            with exclusive_lock(_OWNER_BACKFILL) as acquired:
+                if not acquired or _migration_done(_OWNER_BACKFILL):
+                    return
+                while True:
+                    result = backfill_project_owners(after_id=after_id, batch_size=batch_size)
+                    after_id = result["last_id"]
+                    if result["done"]:
+                        break
+                _mark_migration_done(_OWNER_BACKFILL)
+        except Exception as e:
+            print(f"[WARN] project owner backfill stopped at id {after_id}: {e}")
+
+    threading.Thread(target=_run, name="project-owner-backfill", daemon=True).start()
+
+
+_PROJECT_FILTERS = {"user_id": "user_id", "status": "status", "risk": "risk", "phase": "phase"}
+_ASSESSMENT_FILTERS = {
+    "user_id": "user_id",
+    "status": "status",
+    "risk": "risk",
+    "phase": "phase",
+    "company_name": "company_name",
+}
+
+
+def _resolve_assessed_by(items):
+    """Fill assessed_by from the cached user directory instead of joining users on every listing."""
+    names = user_names()
+    for item in items:
+        if item.user_id is not None:
+            item.assessed_by = names.get(item.user_id)
+    return items
+
+
+def list_projects(
+    filters: Optional[Dict[str, Any]] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+) -> List[Project]:
+    """Projects newest first (keyset on created_at, id). filters: user_id, status, risk, phase, date_from, date_to."""
+    where, params = keyset_where("", filters, cursor, _PROJECT_FILTERS)
+    limit_sql = ""
+    if limit:
+        limit_sql = "LIMIT ?"
+        params.append(limit)
     with closing(get_connection()) as conn:
         try:
             rows = execute_fetchall(
                 conn,
-                """SELECT p.id, p.client, p.phase, p.readiness, p.status, p.next_milestone, p.risk, p.user_id,
-                          u.name AS assessed_by
-                   FROM projects p LEFT JOIN users u ON p.user_id = u.id
-                   ORDER BY p.id DESC""",
+                f"""SELECT id, client, phase, readiness, status, next_milestone, risk, user_id, created_at
+                    FROM projects {where}
+                    ORDER BY created_at DESC, id DESC {limit_sql}""",
+                tuple(params),
             )
         except Exception:
-            # Fallback when user_id column or join not available (old DB)
+            # Fallback when user_id column not available (old DB)
+            conn.rollback()
+            where, params = keyset_where("", filters, cursor, {k: v for k, v in _PROJECT_FILTERS.items() if k != "user_id"})
+            if limit:
+                params.append(limit)
             rows = execute_fetchall(
                 conn,
-                "SELECT id, client, phase, readiness, status, next_milestone, risk FROM projects ORDER BY id DESC",
+                f"""SELECT id, client, phase, readiness, status, next_milestone, risk, created_at FROM projects
+                    {where} ORDER BY created_at DESC, id DESC {limit_sql}""",
+                tuple(params),
             )
-    projects = [_row_to_project(row) for row in rows]
-    return _backfill_assessed_by(projects)
+    return _resolve_assessed_by([_row_to_project(row) for row in rows])
+
+
+def list_assessments(
+    filter_by_user_id: Optional[int] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    conn=None,
+) -> List[AssessmentRow]:
+    """Client Portfolio: ข้อมูลจริงจาก assessments. filter_by_user_id=คนใดคนหนึ่ง จะแสดงเฉพาะของคนนั้น (ความเป็นส่วนตัว). None = ทั้งหมด (สำหรับ Admin).
+    filters: status, risk, phase, date_from, date_to. limit/cursor: keyset page on (created_at, id) DESC."""
+    filters = dict(filters or {})
+    filters["user_id"] = filter_by_user_id
+    where, params = keyset_where("", filters, cursor, _ASSESSMENT_FILTERS)
+    limit_sql = ""
+    if limit:
+        limit_sql = "LIMIT ?"
+        params.append(limit)
+    with borrow_connection(conn) as conn:
+        rows = execute_fetchall(
+            conn,
+            f"""SELECT id, company_name, user_id, readiness_score, phase, status, next_milestone, risk, created_at
+                FROM assessments {where}
+                ORDER BY created_at DESC, id DESC {limit_sql}""",
+            tuple(params),
+        )
+    return _resolve_assessed_by([_row_to_assessment(row) for row in rows])
+
+
+ASSESSMENT_EXPORT_COLUMNS = [
+    "id",
+    "company_name",
+    "user_id",
+    "assessed_by",
+    "readiness_score",
+    "phase",
+    "status",
+    "next_milestone",
+    "risk",
+    "created_at",
+]
+
+
+def iter_assessments(
+    filter_by_user_id: Optional[int] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Export: every assessment matching list_assessments' filters, newest first, streamed (iter_newest_first)."""
+    filters = dict(filters or {})
+    filters["user_id"] = filter_by_user_id
+    names = user_names()
+    for row in iter_newest_first(
+        """SELECT id, company_name, user_id, readiness_score, phase, status, next_milestone, risk, created_at
+           FROM assessments""",
+        filters,
+        _ASSESSMENT_FILTERS,
+    ):
+        item = row_to_dict(row)
+        item["assessed_by"] = names.get(item["user_id"]) if item["user_id"] is not None else None
+        yield item
 
 
-def list_assessments(filter_by_user_id: Optional[int] = None) -> List[AssessmentRow]:
-    """Client Portfolio: ข้อมูลจริงจาก assessments. filter_by_user_id=คนใดคนหนึ่ง จะแสดงเฉพาะของคนนั้น (ความเป็นส่วนตัว). None = ทั้งหมด (สำหรับ Admin)."""
+@dataclass
+class PortfolioSummary:
+    """Client Portfolio overview (KPIs) from portfolio_summary, independent of portfolio size."""
+    total: int
+    avg_readiness: int
+    by_phase: Dict[str, int]
+    by_status: Dict[str, int]
+    by_risk: Dict[str, int]
+    by_user: List[Dict[str, Any]]
+
+
+def _apply_summary_delta(conn, user_id, phase, status, risk, readiness_score, sign: int) -> None:
+    """Add (sign=1) or remove (sign=-1) one assessment from portfolio_summary on an open transaction."""
+    execute(
+        conn,
+        """INSERT INTO portfolio_summary (user_id, phase, status, risk, assessments, readiness_sum)
+           VALUES (?, ?, ?, ?, ?, ?)
+           ON CONFLICT (user_id, phase, status, risk) DO UPDATE SET
+               assessments = portfolio_summary.assessments + excluded.assessments,
+               readiness_sum = portfolio_summary.readiness_sum + excluded.readiness_sum""",
+        (user_id or 0, phase or "", status or "", risk or "", sign, sign * int(readiness_score or 0)),
+    ).close()
+
+
+def rebuild_portfolio_summary() -> None:
+    """Recompute portfolio_summary from assessments in one transaction (repair / first run on an existing DB)."""
     with closing(get_connection()) as conn:
-        try:
-            if filter_by_user_id is not None:
-                rows = execute_fetchall(
-                    conn,
-                    """SELECT a.id, a.company_name, a.readiness_score, a.phase, a.status, a.next_milestone, a.risk, a.created_at,
-                              u.name AS assessed_by
-                       FROM assessments a LEFT JOIN users u ON a.user_id = u.id
-                       WHERE a.user_id = ?
-                       ORDER BY a.created_at DESC, a.id DESC""",
-                    (filter_by_user_id,),
-                )
-            else:
-                rows = execute_fetchall(
-                    conn,
-                    """SELECT a.id, a.company_name, a.readiness_score, a.phase, a.status, a.next_milestone, a.risk, a.created_at,
-                              u.name AS assessed_by
-                       FROM assessments a LEFT JOIN users u ON a.user_id = u.id
-                       ORDER BY a.created_at DESC, a.id DESC""",
-                )
-        except Exception:
-            if filter_by_user_id is not None:
-                rows = execute_fetchall(
-                    conn,
-                    "SELECT id, company_name, readiness_score, phase, status, next_milestone, risk, created_at FROM assessments WHERE user_id = ? ORDER BY id DESC",
-                    (filter_by_user_id,),
-                )
-            else:
-                rows = execute_fetchall(
-                    conn,
-                    "SELECT id, company_name, readiness_score, phase, status, next_milestone, risk, created_at FROM assessments ORDER BY id DESC",
-                )
-    out = []
+        execute(conn, "DELETE FROM portfolio_summary").close()
+        execute(
+            conn,
+            """INSERT INTO portfolio_summary (user_id, phase, status, risk, assessments, readiness_sum)
+               SELECT COALESCE(user_id, 0), COALESCE(phase, ''), COALESCE(status, ''), COALESCE(risk, ''),
+                      COUNT(*), COALESCE(SUM(readiness_score), 0)
+               FROM assessments
+               GROUP BY COALESCE(user_id, 0), COALESCE(phase, ''), COALESCE(status, ''), COALESCE(risk, '')""",
+        ).close()
+        conn.commit()
+    cache_bus.publish("portfolio_summary")
+
+
+def _build_portfolio_summary_if_empty() -> None:
+    with closing(get_connection()) as conn:
+        has_summary = execute_fetchone(conn, "SELECT 1 AS x FROM portfolio_summary LIMIT 1")
+        has_assessments = execute_fetchone(conn, "SELECT 1 AS x FROM assessments LIMIT 1")
+    if has_assessments and not has_summary:
+        rebuild_portfolio_summary()
+
+
+def get_portfolio_summary(filter_by_user_id: Optional[int] = None, conn=None) -> PortfolioSummary:
+    """KPIs for the Client Portfolio. filter_by_user_id limits to one person (same privacy rule as list_assessments)."""
+    where, params = "WHERE assessments > 0", ()
+    if filter_by_user_id is not None:
+        where, params = "WHERE assessments > 0 AND user_id = ?", (filter_by_user_id,)
+    with borrow_connection(conn) as conn:
+        rows = execute_fetchall(
+            conn,
+            f"SELECT user_id, phase, status, risk, assessments, readiness_sum FROM portfolio_summary {where}",
+            params,
+        )
+    by_phase: Dict[str, int] = {}
+    by_status: Dict[str, int] = {}
+    by_risk: Dict[str, int] = {}
+    per_user: Dict[int, List[int]] = {}
+    total = readiness_sum = 0
     for row in rows:
-        out.append(AssessmentRow(
-            id=_row_get(row, "id") or 0,
-            company_name=_row_get(row, "company_name") or "",
-            assessed_by=_row_get(row, "assessed_by"),
-            readiness_score=int(_row_get(row, "readiness_score") or 0),
-            phase=_row_get(row, "phase") or "",
-            status=_row_get(row, "status") or "",
-            next_milestone=_row_get(row, "next_milestone") or "",
-            risk=_row_get(row, "risk") or "Low",
-            created_at=str(_row_get(row, "created_at")) if _row_get(row, "created_at") else None,
-        ))
-    return out
+        count = int(_row_get(row, "assessments") or 0)
+        score = int(_row_get(row, "readiness_sum") or 0)
+        total += count
+        readiness_sum += score
+        by_phase[_row_get(row, "phase")] = by_phase.get(_row_get(row, "phase"), 0) + count
+        by_status[_row_get(row, "status")] = by_status.get(_row_get(row, "status"), 0) + count
+        by_risk[_row_get(row, "risk")] = by_risk.get(_row_get(row, "risk"), 0) + count
+        user_totals = per_user.setdefault(_row_get(row, "user_id") or 0, [0, 0])
+        user_totals[0] += count
+        user_totals[1] += score
+    names = user_names()
+    by_user = [
+        {
+            "user_id": uid or None,
+            "name": names.get(uid),
+            "assessments": count,
+            "avg_readiness": round(score / count) if count else 0,
+        }
+        for uid, (count, score) in sorted(per_user.items(), key=lambda item: -item[1][0])
+    ]
+    return PortfolioSummary(
+        total=total,
+        avg_readiness=round(readiness_sum / total) if total else 0,
+        by_phase=by_phase,
+        by_status=by_status,
+        by_risk=by_risk,
+        by_user=by_user,
+    )
+
+
+def delete_assessment(assessment_id: int, filter_by_user_id: Optional[int] = None) -> None:
+    """Remove one Client Portfolio row and take it out of portfolio_summary in the same transaction.
+    filter_by_user_id: another user's row is "not found" (ValueError), like a missing one."""
+    with closing(get_connection()) as conn:
+        row = execute_fetchone(
+            conn,
+            "SELECT user_id, phase, status, risk, readiness_score FROM assessments WHERE id = ?",
+            (assessment_id,),
+        )
+        if row is None or (filter_by_user_id is not None and _row_get(row, "user_id") != filter_by_user_id):
+            raise ValueError("ไม่พบข้อมูล")
+        execute(conn, "DELETE FROM assessments WHERE id = ?", (assessment_id,)).close()
+        execute(conn, "DELETE FROM assessment_metrics WHERE assessment_id = ?", (assessment_id,)).close()
+        delete_facts(conn, assessment_id)
+        _apply_summary_delta(
+            conn, _row_get(row, "user_id"), _row_get(row, "phase"), _row_get(row, "status"),
+            _row_get(row, "risk"), _row_get(row, "readiness_score"), -1,
+        )
+        conn.commit()
+    cache_bus.publish("assessments", "portfolio_summary")
+
+
+def _store_metrics(conn, assessment_id: int, metrics: Dict[str, Any]) -> None:
+    """Write the full (untruncated) metrics document compressed into assessment_metrics (caller commits)."""
+    raw = json.dumps(metrics, ensure_ascii=False, default=str).encode("utf-8")
+    execute(
+        conn,
+        "INSERT INTO assessment_metrics (assessment_id, encoding, raw_size, metrics) VALUES (?, ?, ?, ?)",
+        (assessment_id, "zlib+json", len(raw), zlib.compress(raw, 6)),
+    ).close()
+
+
+def get_assessment_metrics(assessment_id: int) -> Optional[Dict[str, Any]]:
+    """Load and decompress one assessment's metrics on demand.
+    Falls back to the legacy assessments.metrics_json column (may be truncated: then returns None)."""
+    with closing(get_connection()) as conn:
+        row = execute_fetchone(
+            conn, "SELECT encoding, metrics FROM assessment_metrics WHERE assessment_id = ?", (assessment_id,)
+        )
+        if row is not None:
+            return json.loads(zlib.decompress(blob_bytes(row["metrics"])).decode("utf-8"))
+        legacy = execute_fetchone(conn, "SELECT metrics_json FROM assessments WHERE id = ?", (assessment_id,))
+    if legacy is None or not _row_get(legacy, "metrics_json"):
+        return None
+    try:
+        return json.loads(legacy["metrics_json"])
+    except ValueError:
+        return None  # saved before full storage: cut at 10,000 chars
+
+
+_SNAPSHOT_FIELDS = (
+    "company_name", "readiness_score", "readiness_level", "set_eligible", "mai_eligible",
+    "phase", "status", "risk", "next_milestone",
+)
+
+
+def list_company_history(
+    company_name: str,
+    filter_by_user_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+) -> List[AssessmentRow]:
+    """One client's assessments over time, newest first (idx_assessments_company_created)."""
+    return list_assessments(
+        filter_by_user_id=filter_by_user_id,
+        filters={"company_name": company_name},
+        limit=limit,
+        cursor=cursor,
+    )
+
+
+def _changed(before: Dict[Any, Any], after: Dict[Any, Any]) -> Dict[Any, Dict[str, Any]]:
+    return {
+        key: {"from": before.get(key), "to": after.get(key)}
+        for key in sorted(set(before) | set(after), key=str)
+        if before.get(key) != after.get(key)
+    }
+
+
+def _criteria_results(metrics: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    ipo = (metrics or {}).get("ipo_assessment") or {}
+    results: Dict[str, Any] = {}
+    for key in ("set_assessment", "mai_assessment"):
+        market = ipo.get(key) or {}
+        label = market.get("market") or key
+        for check in market.get("checks") or []:
+            results[f"{label}: {check.get('name')}"] = bool(check.get("passed"))
+        if market:
+            results[f"{label}: passed"] = bool(market.get("passed"))
+    return results
+
+
+def diff_assessments(from_id: int, to_id: int, filter_by_user_id: Optional[int] = None) -> Dict[str, Any]:
+    """Server-side diff of two snapshots: only fields, key figures, criteria results and facts that changed.
+    filter_by_user_id: same privacy rule as list_company_history; another user's assessment is "not found"."""
+    sql = f"SELECT id, {', '.join(_SNAPSHOT_FIELDS)} FROM assessments WHERE id IN (?, ?)"
+    params: tuple = (from_id, to_id)
+    if filter_by_user_id is not None:
+        sql += " AND user_id = ?"
+        params += (filter_by_user_id,)
+    with closing(get_connection()) as conn:
+        rows = execute_fetchall(conn, sql, params)
+        if len({_row_get(row, "id") for row in rows}) < len({from_id, to_id}):
+            raise ValueError("ไม่พบข้อมูล")
+        fact_rows = execute_fetchall(
+            conn,
+            "SELECT assessment_id, metric, year, value FROM financial_facts WHERE assessment_id IN (?, ?)",
+            (from_id, to_id),
+        )
+    by_id = {_row_get(row, "id"): row for row in rows}
+
+    def fields(row):
+        values = {name: _row_get(row, name) for name in _SNAPSHOT_FIELDS}
+        for flag in ("set_eligible", "mai_eligible"):
+            values[flag] = bool(values[flag]) if values[flag] is not None else None
+        return values
+
+    facts: Dict[int, Dict[str, float]] = {from_id: {}, to_id: {}}
+    for row in fact_rows:
+        facts[_row_get(row, "assessment_id")][f"{_row_get(row, 'metric')}.{_row_get(row, 'year')}"] = _row_get(row, "value")
+
+    before_metrics = get_assessment_metrics(from_id)
+    after_metrics = get_assessment_metrics(to_id)
+    changes = {
+        "fields": _changed(fields(by_id[from_id]), fields(by_id[to_id])),
+        "key_figures": _changed(
+            ((before_metrics or {}).get("ipo_assessment") or {}).get("key_figures") or {},
+            ((after_metrics or {}).get("ipo_assessment") or {}).get("key_figures") or {},
+        ),
+        "criteria": _changed(_criteria_results(before_metrics), _criteria_results(after_metrics)),
+        "facts": _changed(facts[from_id], facts[to_id]),
+    }
+    return {
+        "from_id": from_id,
+        "to_id": to_id,
+        "changes": {group: diff for group, diff in changes.items() if diff},
+    }
 
 
 def create_assessment_manual(
@@ -340,35 +769,79 @@ def create_assessment_manual(
 ) -> AssessmentRow:
     """เพิ่มรายการใน Client Portfolio จากปุ่ม + New Project (ข้อมูลจริง)."""
     with closing(get_connection()) as conn:
-        aid = execute_insert(
+        row = _insert_returning_with_assessor(
             conn,
+            "assessments",
+            _ASSESSMENT_COLUMNS,
             """INSERT INTO assessments (company_name, user_id, readiness_score, phase, status, risk, next_milestone)
                VALUES (?, ?, ?, ?, ?, ?, ?)""",
             (company_name, user_id, readiness_score, phase, status, risk, next_milestone or ""),
         )
-    for a in list_assessments():
-        if a.id == aid:
-            return a
-    return AssessmentRow(aid, company_name, None, readiness_score, phase, status, next_milestone, risk, None)
+        _apply_summary_delta(conn, user_id, phase, status, risk, readiness_score, 1)
+        conn.commit()
+    cache_bus.publish("assessments", "portfolio_summary")
+    return _row_to_assessment(row)
 
 
-def list_team_members() -> List[TeamMember]:
-    """Fetch all registered users and map them to TeamMember view."""
-    real_users = list_users()
+# Team Pulse: clients per analyst that count as 100% load, and statuses that count as pending work
+TEAM_CAPACITY = int(os.environ.get("TEAM_CAPACITY", "15"))
+_PENDING_STATUSES = ("At Risk", "Delayed", "Pending Review")
+
+
+def _load_team_members() -> List[TeamMember]:
+    placeholders = ",".join("?" * len(_PENDING_STATUSES))
+    with closing(get_connection()) as conn:
+        rows = execute_fetchall(
+            conn,
+            f"""SELECT user_id,
+                       COUNT(*) AS active_tasks,
+                       SUM(CASE WHEN status IN ({placeholders}) THEN 1 ELSE 0 END) AS pending
+                FROM (
+                    SELECT user_id, status,
+                           ROW_NUMBER() OVER (PARTITION BY user_id, client ORDER BY created_at DESC, id DESC) AS rn
+                    FROM (
+                        SELECT user_id, company_name AS client, status, created_at, id FROM assessments WHERE user_id IS NOT NULL
+                        UNION ALL
+                        SELECT user_id, client, status, created_at, id FROM projects WHERE user_id IS NOT NULL
+                    ) work
+                ) latest
+                WHERE rn = 1
+                GROUP BY user_id""",
+            _PENDING_STATUSES,
+        )
+    workload = {
+        _row_get(row, "user_id"): (int(_row_get(row, "active_tasks") or 0), int(_row_get(row, "pending") or 0))
+        for row in rows
+    }
     members = []
-    for u in real_users:
+    for u in list_users():
+        active_tasks, pending = workload.get(u.id, (0, 0))
         members.append(TeamMember(
             id=u.id,
             name=u.name,
             role=u.role.capitalize(),
-            active_tasks=0,
-            pending=0,
-            load=0,
+            active_tasks=active_tasks,
+            pending=pending,
+            load=round(100 * active_tasks / TEAM_CAPACITY) if TEAM_CAPACITY else 0,
             avatar=u.name[0].upper() if u.name else "?",
         ))
     return members
 
 
+_team_cache = cache_bus.VersionedValue(
+    ("assessments", "projects", "users"),
+    float(os.environ.get("TEAM_CACHE_TTL", "300")),
+    _load_team_members,
+)
+
+
+def list_team_members() -> List[TeamMember]:
+    """Registered users with their workload: one task per client, judged by its latest assessment or project
+    (pending = that row is At Risk / Delayed / Pending Review). One grouped query over assessments + projects,
+    cached until either table or users is written."""
+    return _team_cache.get()
+
+
 def save_assessment_and_create_project(
     company_name: str,
     user_id: Optional[int],
@@ -404,30 +877,22 @@ def save_assessment_and_create_project(
         recs = ipo.get("recommendations") or []
         next_milestone = recs[0].get("message", "พัฒนาเพิ่มเติม")[:50] if recs else "พัฒนาเพิ่มเติม"
 
-    metrics_json = json.dumps(metrics, ensure_ascii=False, default=str)[:10000]
     with closing(get_connection()) as conn:
-        execute_insert(
+        assessment_id = insert_returning_id(
             conn,
             """INSERT INTO assessments (company_name, user_id, readiness_score, readiness_level,
-               set_eligible, mai_eligible, phase, status, risk, next_milestone, metrics_json)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+               set_eligible, mai_eligible, phase, status, risk, next_milestone)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
             (company_name, user_id, readiness_score, readiness_level, set_eligible, mai_eligible,
-             phase, status, risk, next_milestone, metrics_json),
+             phase, status, risk, next_milestone),
         )
-        project = create_project(
-            client=company_name,
-            phase=phase,
-            readiness=readiness_score,
-            status=status,
-            next_milestone=next_milestone,
-            risk=risk,
-            user_id=user_id,
-        )
-    # Reload to get assessed_by from join
-    for p in list_projects():
-        if p.id == project.id:
-            return p
-    return project
+        _store_metrics(conn, assessment_id, metrics)
+        write_facts(conn, assessment_id, company_name, metrics)
+        _apply_summary_delta(conn, user_id, phase, status, risk, readiness_score, 1)
+        row = _insert_project(conn, company_name, phase, readiness_score, status, next_milestone, risk, user_id)
+        conn.commit()
+    cache_bus.publish("assessments", "projects", "portfolio_summary")
+    return _row_to_project(row)
 
 
 def create_project(
@@ -440,12 +905,18 @@ def create_project(
     user_id: Optional[int] = None,
 ) -> Project:
     with closing(get_connection()) as conn:
-        project_id = execute_insert(
-            conn,
-            "INSERT INTO projects (client, phase, readiness, status, next_milestone, risk, user_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (client, phase, readiness, status, next_milestone, risk, user_id),
-        )
-    return Project(
-        project_id, client, phase, readiness, status, next_milestone, risk,
-        user_id=user_id, assessed_by=None,
+        row = _insert_project(conn, client, phase, readiness, status, next_milestone, risk, user_id)
+        conn.commit()
+    cache_bus.publish("projects")
+    return _row_to_project(row)
+
+
+def _insert_project(conn, client, phase, readiness, status, next_milestone, risk, user_id):
+    """INSERT a project on an open connection and return the row with assessed_by (caller commits)."""
+    return _insert_returning_with_assessor(
+        conn,
+        "projects",
+        _PROJECT_COLUMNS,
+        "INSERT INTO projects (client, phase, readiness, status, next_milestone, risk, user_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (client, phase, readiness, status, next_milestone, risk, user_id),
     )
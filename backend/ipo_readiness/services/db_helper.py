@@ -5,19 +5,31 @@ Otherwise use SQLite (file users.db) for local development.
 """
 from __future__ import annotations
 
+import base64
+import itertools
 import os
 import sqlite3
-from contextlib import closing
+from contextlib import closing, contextmanager
 from pathlib import Path
 from typing import Any, List, Optional, Tuple
 
+try:
+    import fcntl
+except ImportError:  # Windows: lock_file falls back to msvcrt
+    fcntl = None
+    import msvcrt
+
 _DB_PATH = Path(__file__).resolve().parents[1] / "users.db"
 _DATABASE_URL = os.environ.get("DATABASE_URL")
 
+# Keyset pagination: page size used when the client does not send ?limit=, and the hard cap.
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
 # Optional: psycopg2 for PostgreSQL (install: pip install psycopg2-binary)
 try:
     import psycopg2
-    from psycopg2.extras import RealDictCursor
+    from psycopg2.extras import RealDictCursor, execute_batch
     _HAS_PSYCOPG2 = True
     _INTEGRITY_ERROR = (sqlite3.IntegrityError, psycopg2.IntegrityError)
 except ImportError:
@@ -35,6 +47,11 @@ def use_postgres() -> bool:
     return bool(_DATABASE_URL and _HAS_PSYCOPG2)
 
 
+def sqlite_path() -> Path:
+    """Location of the local SQLite database file (also used to place per-host state next to it)."""
+    return _DB_PATH
+
+
 def get_connection():
     """Return a database connection (SQLite or PostgreSQL)."""
     if use_postgres():
@@ -51,6 +68,62 @@ def get_connection():
     return conn
 
 
+@contextmanager
+def borrow_connection(conn=None):
+    """Yield conn when the caller already has one (shared snapshot), else open and close a new connection."""
+    if conn is not None:
+        yield conn
+        return
+    with closing(get_connection()) as own:
+        yield own
+
+
+def lock_file(fd: int, blocking: bool = True) -> bool:
+    """Exclusive lock on an open file descriptor, held until it is closed. False when not blocking and taken."""
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        else:
+            msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+    except OSError:
+        if blocking:
+            raise
+        return False
+    return True
+
+
+@contextmanager
+def exclusive_lock(name: str):
+    """Cross-process try-lock, never blocks: yields True in the one process that holds name, False elsewhere.
+    PostgreSQL: a session advisory lock on a connection of its own. SQLite: a lock file next to the database.
+    Either way the lock goes away with the holder, also when the process dies."""
+    if use_postgres():
+        with closing(get_connection()) as conn:
+            row = execute_fetchone(conn, "SELECT pg_try_advisory_lock(hashtext(?)) AS ok", (name,))
+            conn.commit()
+            yield bool(row and row["ok"])  # closing the session releases the advisory lock
+        return
+    _DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(_DB_PATH.parent / f".{_DB_PATH.name}.{name}.lock", "a+b") as handle:
+        yield lock_file(handle.fileno(), blocking=False)  # released when the file is closed
+
+
+@contextmanager
+def read_snapshot():
+    """One connection inside a read-only transaction, so several queries see the same snapshot."""
+    with closing(get_connection()) as conn:
+        if use_postgres():
+            cur = conn.cursor()
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            cur.close()
+        else:
+            conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+
+
 def _sql_for_conn(sql: str, conn) -> str:
     """Convert SQLite ? placeholders to %s for PostgreSQL."""
     if use_postgres():
@@ -83,6 +156,39 @@ def execute_fetchall(conn, sql: str, params: Optional[Tuple] = None):
     return rows
 
 
+def execute_many(conn, sql: str, seq_of_params) -> None:
+    """executemany with ? (SQLite) or %s (PostgreSQL) placeholders (no commit).
+    PostgreSQL sends the rows in pages of 500 statements per round trip instead of one each."""
+    cur = conn.cursor()
+    if use_postgres():
+        execute_batch(cur, _sql_for_conn(sql, conn), seq_of_params, page_size=500)
+    else:
+        cur.executemany(_sql_for_conn(sql, conn), seq_of_params)
+    cur.close()
+
+
+_stream_names = itertools.count(1)
+
+
+def iter_rows(conn, sql: str, params: Optional[Tuple] = None, batch_size: int = 1000):
+    """Stream rows in constant memory: server-side (named) cursor on PostgreSQL, fetchmany on SQLite.
+    On PostgreSQL the connection must stay in its transaction until iteration ends."""
+    if use_postgres():
+        cur = conn.cursor(name=f"stream_{next(_stream_names)}")
+        cur.itersize = batch_size
+    else:
+        cur = conn.cursor()
+    try:
+        cur.execute(_sql_for_conn(sql, conn), params or ())
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cur.close()
+
+
 def execute_commit(conn, sql: str, params: Optional[Tuple] = None):
     """Execute SQL (UPDATE/DELETE) and commit."""
     cur = execute(conn, sql, params)
@@ -107,6 +213,24 @@ def execute_insert(conn, sql: str, params: Optional[Tuple] = None) -> int:
     return last_id
 
 
+def insert_returning_id(conn, sql: str, params: Optional[Tuple] = None) -> int:
+    """Execute one INSERT and return its id without committing (RETURNING id on PostgreSQL, lastrowid on SQLite)."""
+    if use_postgres():
+        row = execute_fetchone(conn, sql + " RETURNING id", params)
+        return row["id"]
+    cur = execute(conn, sql, params)
+    last_id = cur.lastrowid
+    cur.close()
+    return last_id
+
+
+def blob_bytes(value) -> Optional[bytes]:
+    """BLOB (SQLite) / BYTEA (PostgreSQL memoryview) column value as bytes."""
+    if value is None:
+        return None
+    return bytes(value)
+
+
 def row_to_dict(row) -> dict:
     """Convert DB row to dict (works for sqlite3.Row and RealDictRow)."""
     if row is None:
@@ -114,3 +238,92 @@ def row_to_dict(row) -> dict:
     if hasattr(row, "keys"):
         return dict(row)
     return dict(zip([c[0] for c in row.__cursor__.description], row))
+
+
+def clamp_page_size(limit: Optional[int], default: int = DEFAULT_PAGE_SIZE) -> int:
+    """Bound a client-supplied page size to 1..MAX_PAGE_SIZE."""
+    if not limit or limit < 1:
+        return default
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def encode_cursor(created_at: Any, row_id: int) -> str:
+    """Opaque keyset cursor for (created_at, id) ordering."""
+    raw = f"{created_at}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[str, int]]:
+    """Decode a cursor from encode_cursor; raises ValueError when it is malformed."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded.encode()).decode().rsplit("|", 1)
+        return created_at, int(row_id)
+    except Exception as exc:
+        raise ValueError("cursor ไม่ถูกต้อง") from exc
+
+
+def keyset_where(
+    alias: str,
+    filters: Optional[dict] = None,
+    cursor: Optional[str] = None,
+    columns: Optional[dict] = None,
+) -> Tuple[str, List[Any]]:
+    """Build a WHERE clause for keyset pages ordered by (created_at DESC, id DESC).
+
+    filters keys: equality filters mapped through columns (filter name -> column name),
+    plus date_from / date_to (YYYY-MM-DD or full timestamp, both inclusive) on created_at.
+    Returns ("WHERE ..." or "", params)."""
+    prefix = f"{alias}." if alias else ""
+    clauses: List[str] = []
+    params: List[Any] = []
+    filters = filters or {}
+    for key, column in (columns or {}).items():
+        value = filters.get(key)
+        if value is None or value == "":
+            continue
+        clauses.append(f"{prefix}{column} = ?")
+        params.append(value)
+    date_from = filters.get("date_from")
+    if date_from:
+        clauses.append(f"{prefix}created_at >= ?")
+        params.append(date_from)
+    date_to = filters.get("date_to")
+    if date_to:
+        if len(date_to) == 10:
+            date_to = f"{date_to} 23:59:59.999999"
+        clauses.append(f"{prefix}created_at <= ?")
+        params.append(date_to)
+    position = decode_cursor(cursor)
+    if position:
+        clauses.append(f"({prefix}created_at, {prefix}id) < (?, ?)")
+        params.extend(position)
+    if not clauses:
+        return "", params
+    return "WHERE " + " AND ".join(clauses), params
+
+
+def iter_newest_first(select_sql: str, filters: Optional[dict] = None, columns: Optional[dict] = None, page_size: int = 1000):
+    """Export stream: every row of select_sql ("SELECT ... FROM table", needs id and created_at) matching filters,
+    ordered by (created_at DESC, id DESC).
+    PostgreSQL: one REPEATABLE READ snapshot read through a server-side cursor (MVCC, writers are not blocked).
+    SQLite: keyset pages of page_size, each on its own short read, since a read transaction held for the whole
+    download would lock writers out; a row written during the export may or may not be included."""
+    if use_postgres():
+        where, params = keyset_where("", filters, None, columns)
+        with read_snapshot() as conn:
+            yield from iter_rows(conn, f"{select_sql} {where} ORDER BY created_at DESC, id DESC", tuple(params))
+        return
+    cursor = None
+    while True:
+        where, params = keyset_where("", filters, cursor, columns)
+        with closing(get_connection()) as conn:
+            rows = execute_fetchall(
+                conn, f"{select_sql} {where} ORDER BY created_at DESC, id DESC LIMIT ?", tuple(params) + (page_size,)
+            )
+        yield from rows
+        if len(rows) < page_size:
+            return
+        cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
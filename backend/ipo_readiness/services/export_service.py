@@ -0,0 +1,63 @@
+"""Export encoders: row dicts (assessments, audit logs) streamed as NDJSON or CSV, optionally gzipped, in constant memory."""
+from __future__ import annotations
+
+import csv
+import io
+import json
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Sequence
+
+EXPORT_FORMATS = ("ndjson", "csv")
+_CHUNK_BYTES = 64 * 1024  # flush to the client in ~64 KB pieces, not per row
+
+
+def _batched(pieces: Iterable[str]) -> Iterator[bytes]:
+    buf: List[str] = []
+    size = 0
+    for piece in pieces:
+        buf.append(piece)
+        size += len(piece)
+        if size >= _CHUNK_BYTES:
+            yield "".join(buf).encode("utf-8")
+            buf, size = [], 0
+    if buf:
+        yield "".join(buf).encode("utf-8")
+
+
+def ndjson_chunks(rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """One JSON object per line."""
+    return _batched(json.dumps(row, ensure_ascii=False, default=str) + "\n" for row in rows)
+
+
+def csv_chunks(rows: Iterable[Dict[str, Any]], columns: Sequence[str]) -> Iterator[bytes]:
+    """CSV with a header row; UTF-8 BOM first so Excel opens Thai text correctly."""
+    def lines():
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=list(columns), extrasaction="ignore")
+        writer.writeheader()
+        yield "﻿" + out.getvalue()
+        for row in rows:
+            out.seek(0)
+            out.truncate()
+            writer.writerow(row)
+            yield out.getvalue()
+
+    return _batched(lines())
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Gzip a byte stream incrementally (one gzip member, no buffering of the whole body)."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 → gzip header/trailer
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def encode_export(rows: Iterable[Dict[str, Any]], columns: Sequence[str], fmt: str, gzip: bool = False) -> Iterator[bytes]:
+    """rows → byte chunks in the requested format. Raises ValueError for an unknown format."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format ต้องเป็นหนึ่งใน {', '.join(EXPORT_FORMATS)}")
+    chunks = ndjson_chunks(rows) if fmt == "ndjson" else csv_chunks(rows, columns)
+    return gzip_chunks(chunks) if gzip else chunks
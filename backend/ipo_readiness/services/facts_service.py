@@ -0,0 +1,144 @@
+"""Normalized financial facts (assessment_id, company, year, metric, value) for indexed cross-company screening."""
+from __future__ import annotations
+
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from ipo_readiness.services.db_helper import (
+    get_connection,
+    use_postgres,
+    execute,
+    execute_fetchall,
+    execute_many,
+)
+
+# Baht amounts: stored × unit_multiplier so every company is screened in baht. Ratios / margins are stored as-is.
+_MONEY_METRICS = {
+    "total_revenue",
+    "gross_profit",
+    "net_profit",
+    "total_assets",
+    "shareholders_equity",
+    "total_liabilities",
+}
+
+
+@dataclass
+class FinancialFact:
+    assessment_id: int
+    company_name: str
+    year: int
+    metric: str
+    value: float
+
+
+def init_facts_store() -> None:
+    """Create the financial_facts table and its covering indexes when they do not exist."""
+    value_type = "DOUBLE PRECISION" if use_postgres() else "REAL"
+    with closing(get_connection()) as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS financial_facts (
+                assessment_id INTEGER NOT NULL,
+                company_name TEXT NOT NULL,
+                year INTEGER NOT NULL,
+                metric TEXT NOT NULL,
+                value {value_type} NOT NULL,
+                PRIMARY KEY (assessment_id, metric, year)
+            )
+        """)
+        # Screening: metric + year + value range, answered from the index alone
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_facts_screen ON financial_facts (metric, year, value, company_name, assessment_id)"
+        )
+        # Latest assessment per company for a metric/year
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_facts_company ON financial_facts (company_name, metric, year, assessment_id)"
+        )
+        conn.commit()
+
+
+def facts_from_metrics(metrics: Dict[str, Any]) -> List[Tuple[str, int, float]]:
+    """(metric, year, value) for every year series in a compute_metrics() result."""
+    multiplier = metrics.get("unit_multiplier") or 1
+    out = []
+    for metric, series in metrics.items():
+        if not isinstance(series, dict) or metric in ("ipo_assessment", "heuristics"):
+            continue
+        for year, value in series.items():
+            try:
+                year_int = int(year)
+            except (TypeError, ValueError):
+                continue
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            if metric in _MONEY_METRICS:
+                value = value * multiplier
+            out.append((metric, year_int, float(value)))
+    return out
+
+
+def write_facts(conn, assessment_id: int, company_name: str, metrics: Dict[str, Any]) -> int:
+    """Bulk-insert the assessment's series on an open transaction (caller commits). Returns the number of facts."""
+    rows = [
+        (assessment_id, company_name, year, metric, value)
+        for metric, year, value in facts_from_metrics(metrics)
+    ]
+    if rows:
+        execute_many(
+            conn,
+            "INSERT INTO financial_facts (assessment_id, company_name, year, metric, value) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+    return len(rows)
+
+
+def delete_facts(conn, assessment_id: int) -> None:
+    execute(conn, "DELETE FROM financial_facts WHERE assessment_id = ?", (assessment_id,)).close()
+
+
+def screen_facts(
+    metric: str,
+    year: int,
+    min_value: Optional[float] = None,
+    max_value: Optional[float] = None,
+    latest_only: bool = True,
+    limit: int = 100,
+) -> List[FinancialFact]:
+    """Companies whose metric in year falls in [min_value, max_value], highest value first.
+    latest_only: consider only each company's most recent assessment that has this metric/year."""
+    clauses = ["f.metric = ?", "f.year = ?"]
+    params: List[Any] = [metric, year]
+    if min_value is not None:
+        clauses.append("f.value >= ?")
+        params.append(min_value)
+    if max_value is not None:
+        clauses.append("f.value <= ?")
+        params.append(max_value)
+    if latest_only:
+        clauses.append(
+            """f.assessment_id = (SELECT MAX(f2.assessment_id) FROM financial_facts f2
+                                  WHERE f2.company_name = f.company_name AND f2.metric = f.metric AND f2.year = f.year)"""
+        )
+    params.append(limit)
+    with closing(get_connection()) as conn:
+        rows = execute_fetchall(
+            conn,
+            f"""SELECT f.assessment_id, f.company_name, f.year, f.metric, f.value
+                FROM financial_facts f
+                WHERE {" AND ".join(clauses)}
+                ORDER BY f.value DESC, f.assessment_id DESC
+                LIMIT ?""",
+            tuple(params),
+        )
+    return [
+        FinancialFact(
+            assessment_id=row["assessment_id"],
+            company_name=row["company_name"],
+            year=row["year"],
+            metric=row["metric"],
+            value=row["value"],
+        )
+        for row in rows
+    ]
@@ -0,0 +1,292 @@
+"""DB-backed analysis job queue shared by the API and standalone workers (worker.py).
+
+Tables: analysis_jobs (state, lease, progress, compressed result) and analysis_job_files (uploaded bytes).
+
+Claiming is one UPDATE ... WHERE id = (SELECT ...) RETURNING statement: on PostgreSQL the subquery takes the
+row with FOR UPDATE SKIP LOCKED, so concurrent workers never wait on or double-claim a job; on SQLite the
+statement runs under the database write lock, which gives the same guarantee for processes sharing one file.
+A claim is a lease (lease_owner + lease_expires_at) that the worker extends with heartbeats; a job whose
+lease expires (worker crashed or lost) becomes claimable again. Failures are retried with exponential
+backoff up to max_attempts, then the job is dead-lettered (status 'dead') with its files kept for inspection.
+Input errors fail at once without retry: any exception raised while parsing, combining or scoring the files
+(analysis_job_service._on_input: unreadable file, mixed companies, KeyError / TypeError from a malformed sheet),
+since the same files fail the same way on every worker. Database errors and MemoryError are retried.
+"""
+from __future__ import annotations
+
+import json
+import os
+import time
+import uuid
+import zlib
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from ipo_readiness.services.db_helper import (
+    get_connection,
+    use_postgres,
+    execute,
+    execute_fetchone,
+    execute_fetchall,
+    execute_many,
+    blob_bytes,
+)
+from ipo_readiness.services.analysis_service import UploadedFile
+
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_SECONDS = float(os.environ.get("JOB_RETRY_BASE_SECONDS", "5"))
+JOB_QUEUE_LIMIT = int(os.environ.get("JOB_QUEUE_LIMIT", "200"))  # queued jobs before POST answers 503
+
+
+@dataclass
+class ClaimedJob:
+    id: str
+    attempts: int
+    max_attempts: int
+    files: List[UploadedFile]
+
+
+def init_job_queue_store() -> None:
+    """Create analysis_jobs / analysis_job_files and the claim index when they do not exist."""
+    real = "DOUBLE PRECISION" if use_postgres() else "REAL"
+    blob = "BYTEA" if use_postgres() else "BLOB"
+    with closing(get_connection()) as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS analysis_jobs (
+                id TEXT PRIMARY KEY,
+                owner_id INTEGER,
+                status TEXT NOT NULL DEFAULT 'queued',
+                stage TEXT NOT NULL DEFAULT 'received',
+                message TEXT,
+                filenames TEXT NOT NULL,
+                files_total INTEGER NOT NULL DEFAULT 0,
+                files_parsed INTEGER NOT NULL DEFAULT 0,
+                company_name TEXT,
+                error TEXT,
+                result {blob},
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                lease_owner TEXT,
+                lease_expires_at {real},
+                run_after {real} NOT NULL,
+                created_at {real} NOT NULL,
+                updated_at {real} NOT NULL,
+                finished_at {real}
+            )
+        """)
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS analysis_job_files (
+                job_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                filename TEXT NOT NULL,
+                data {blob} NOT NULL,
+                PRIMARY KEY (job_id, idx)
+            )
+        """)
+        # Claim scan: oldest runnable job first
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_analysis_jobs_claim ON analysis_jobs (status, run_after, created_at)")
+        conn.commit()
+
+
+def enqueue_job(uploads, owner_id: Optional[int] = None, max_attempts: Optional[int] = None) -> str:
+    """Insert a queued job with its files (one transaction). Returns the job id."""
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    with closing(get_connection()) as conn:
+        try:
+            execute(
+                conn,
+                """INSERT INTO analysis_jobs
+                       (id, owner_id, status, stage, message, filenames, files_total, max_attempts, run_after,
+                        created_at, updated_at)
+                   VALUES (?, ?, 'queued', 'received', ?, ?, ?, ?, ?, ?, ?)""",
+                (job_id, owner_id, "ได้รับไฟล์แล้ว รอคิวประมวลผล",
+                 json.dumps([u.filename for u in uploads], ensure_ascii=False), len(uploads),
+                 max_attempts or JOB_MAX_ATTEMPTS, now, now, now),
+            ).close()
+            execute_many(
+                conn,
+                "INSERT INTO analysis_job_files (job_id, idx, filename, data) VALUES (?, ?, ?, ?)",
+                [(job_id, idx, u.filename, u.data) for idx, u in enumerate(uploads)],
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return job_id
+
+
+def queued_count() -> int:
+    with closing(get_connection()) as conn:
+        row = execute_fetchone(conn, "SELECT COUNT(*) AS n FROM analysis_jobs WHERE status = 'queued'")
+    return int(row["n"])
+
+
+def claim_job(worker_id: str, lease_seconds: float = JOB_LEASE_SECONDS) -> Optional[ClaimedJob]:
+    """Lease the oldest runnable job (queued and due, or running with an expired lease) to worker_id."""
+    now = time.time()
+    lock = "FOR UPDATE SKIP LOCKED" if use_postgres() else ""
+    with closing(get_connection()) as conn:
+        row = execute_fetchone(
+            conn,
+            f"""UPDATE analysis_jobs
+                   SET status = 'running', lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1,
+                       updated_at = ?
+                 WHERE id = (
+                     SELECT id FROM analysis_jobs
+                      WHERE (status = 'queued' AND run_after <= ?)
+                         OR (status = 'running' AND lease_expires_at < ?)
+                      ORDER BY created_at
+                      LIMIT 1 {lock}
+                 )
+             RETURNING id, attempts, max_attempts""",
+            (worker_id, now + lease_seconds, now, now, now),
+        )
+        conn.commit()
+        if row is None:
+            return None
+        if row["attempts"] > row["max_attempts"]:
+            # Previous holder died on the last attempt: dead-letter instead of running it again
+            _finish(conn, row["id"], worker_id, "dead", error="worker หยุดทำงานระหว่างประมวลผลเกินจำนวนครั้งที่กำหนด")
+            return claim_job(worker_id, lease_seconds)
+        files = execute_fetchall(
+            conn, "SELECT filename, data FROM analysis_job_files WHERE job_id = ? ORDER BY idx", (row["id"],)
+        )
+    return ClaimedJob(
+        id=row["id"],
+        attempts=row["attempts"],
+        max_attempts=row["max_attempts"],
+        files=[UploadedFile(filename=f["filename"], data=blob_bytes(f["data"])) for f in files],
+    )
+
+
+def _update_leased(conn, job_id: str, worker_id: str, sql_set: str, params: tuple) -> bool:
+    cur = execute(
+        conn,
+        f"UPDATE analysis_jobs SET {sql_set}, updated_at = ? WHERE id = ? AND lease_owner = ? AND status = 'running'",
+        params + (time.time(), job_id, worker_id),
+    )
+    updated = cur.rowcount > 0
+    cur.close()
+    conn.commit()
+    return updated
+
+
+def heartbeat(job_id: str, worker_id: str, lease_seconds: float = JOB_LEASE_SECONDS) -> bool:
+    """Extend the lease. False = the lease was lost (expired and taken over): stop working on the job."""
+    with closing(get_connection()) as conn:
+        return _update_leased(conn, job_id, worker_id, "lease_expires_at = ?", (time.time() + lease_seconds,))
+
+
+def report_progress(job_id: str, worker_id: str, **fields: Any) -> bool:
+    """Update stage / message / files_parsed / company_name while holding the lease (also extends it)."""
+    allowed = {k: v for k, v in fields.items() if k in ("stage", "message", "files_parsed", "company_name")}
+    sets = "".join(f"{name} = ?, " for name in allowed)
+    params = tuple(allowed.values()) + (time.time() + JOB_LEASE_SECONDS,)
+    with closing(get_connection()) as conn:
+        return _update_leased(conn, job_id, worker_id, f"{sets}lease_expires_at = ?", params)
+
+
+def _finish(conn, job_id: str, worker_id: str, status: str, error: Optional[str] = None,
+            result: Optional[Dict[str, Any]] = None) -> bool:
+    blob = None
+    if result is not None:
+        blob = zlib.compress(json.dumps(result, ensure_ascii=False, default=str).encode("utf-8"), 6)
+    message = {"done": "ประมวลผลเสร็จสิ้น", "failed": "ประมวลผลไม่สำเร็จ", "dead": "ประมวลผลไม่สำเร็จ (ย้ายไป dead-letter)"}
+    ok = _update_leased(
+        conn, job_id, worker_id,
+        "status = ?, stage = ?, message = ?, error = ?, result = ?, finished_at = ?, lease_owner = NULL",
+        (status, "done" if status == "done" else "failed", message[status], error, blob, time.time()),
+    )
+    if ok and status == "done":
+        execute(conn, "DELETE FROM analysis_job_files WHERE job_id = ?", (job_id,)).close()  # inputs no longer needed
+        conn.commit()
+    return ok
+
+
+def complete_job(job_id: str, worker_id: str, result: Dict[str, Any]) -> bool:
+    with closing(get_connection()) as conn:
+        return _finish(conn, job_id, worker_id, "done", result=result)
+
+
+def fail_job(job_id: str, worker_id: str, error: str, retryable: bool = True) -> str:
+    """Record a failure: back to 'queued' with backoff while attempts remain, else 'dead' (or 'failed' for
+    input errors). Returns the new status ('' when the lease was already lost)."""
+    with closing(get_connection()) as conn:
+        row = execute_fetchone(conn, "SELECT attempts, max_attempts FROM analysis_jobs WHERE id = ?", (job_id,))
+        if row is None:
+            return ""
+        if not retryable:
+            return "failed" if _finish(conn, job_id, worker_id, "failed", error=error) else ""
+        if row["attempts"] >= row["max_attempts"]:
+            return "dead" if _finish(conn, job_id, worker_id, "dead", error=error) else ""
+        delay = JOB_RETRY_BASE_SECONDS * (2 ** (row["attempts"] - 1))
+        ok = _update_leased(
+            conn, job_id, worker_id,
+            "status = 'queued', stage = 'received', message = ?, error = ?, files_parsed = 0, "
+            "run_after = ?, lease_owner = NULL, lease_expires_at = NULL",
+            (f"จะลองใหม่อีกครั้ง (ครั้งที่ {row['attempts'] + 1}/{row['max_attempts']})", error, time.time() + delay),
+        )
+        return "queued" if ok else ""
+
+
+def get_job_row(job_id: str) -> Optional[Dict[str, Any]]:
+    """Job state as a dict (result decompressed when done); None when unknown."""
+    with closing(get_connection()) as conn:
+        row = execute_fetchone(conn, "SELECT * FROM analysis_jobs WHERE id = ?", (job_id,))
+    if row is None:
+        return None
+    job = {key: row[key] for key in row.keys()}
+    job["filenames"] = json.loads(job["filenames"])
+    if job.get("result") is not None:
+        job["result"] = json.loads(zlib.decompress(blob_bytes(job["result"])).decode("utf-8"))
+    return job
+
+
+def list_dead_jobs(limit: int = 100) -> List[Dict[str, Any]]:
+    with closing(get_connection()) as conn:
+        rows = execute_fetchall(
+            conn,
+            """SELECT id, owner_id, files_total, attempts, max_attempts, error, created_at, finished_at
+                 FROM analysis_jobs WHERE status = 'dead' ORDER BY finished_at DESC LIMIT ?""",
+            (limit,),
+        )
+    return [{key: row[key] for key in row.keys()} for row in rows]
+
+
+def requeue_dead_job(job_id: str) -> bool:
+    """Give a dead-lettered job a fresh set of attempts."""
+    now = time.time()
+    with closing(get_connection()) as conn:
+        cur = execute(
+            conn,
+            """UPDATE analysis_jobs SET status = 'queued', stage = 'received', attempts = 0, error = NULL,
+                      files_parsed = 0, finished_at = NULL, run_after = ?, updated_at = ?,
+                      message = 'ได้รับไฟล์แล้ว รอคิวประมวลผล'
+                WHERE id = ? AND status = 'dead'""",
+            (now, now, job_id),
+        )
+        ok = cur.rowcount > 0
+        cur.close()
+        conn.commit()
+    return ok
+
+
+def purge_finished_jobs(ttl_seconds: float) -> int:
+    """Delete jobs (and files) finished more than ttl_seconds ago, except dead letters."""
+    cutoff = time.time() - ttl_seconds
+    with closing(get_connection()) as conn:
+        execute(
+            conn,
+            """DELETE FROM analysis_job_files WHERE job_id IN (
+                   SELECT id FROM analysis_jobs WHERE status IN ('done', 'failed') AND finished_at < ?)""",
+            (cutoff,),
+        ).close()
+        cur = execute(conn, "DELETE FROM analysis_jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,))
+        removed = cur.rowcount
+        cur.close()
+        conn.commit()
+    return removed
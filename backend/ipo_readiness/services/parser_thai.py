@@ -1,8 +1,11 @@
 from __future__ import annotations
 
 import os
+import posixpath
+import zipfile
 from io import BytesIO
-from typing import Dict, List, Optional, Tuple
+from xml.etree import ElementTree
+from typing import Any, Dict, List, Optional, Tuple
 
 import xlrd
 from openpyxl import Workbook, load_workbook
@@ -73,9 +76,38 @@ LAYOUTS = {
     "legacy": LEGACY_LAYOUT,
 }
 
+# Header block read for sheet type detection (rows 1-8, A-D) and the company name (rows 1-3, A-G)
+_HEADER_ROWS = 8
+_HEADER_COLUMNS = "ABCDEFG"
+
 
 def parse_financial_files(workbooks):
     files = workbooks if isinstance(workbooks, list) else [workbooks]
+    print("\n" + "="*80)
+    print("📊 เริ่มการประมวลผลไฟล์ทางการเงิน")
+    print("="*80)
+    parsed = [parse_workbook_file(file, idx) for idx, file in enumerate(files)]
+    return combine_parsed_files(parsed)
+
+
+def parse_workbook_file(file, idx: int = 0) -> Dict[str, Any]:
+    """Open one upload once: company name + extracted sections. Independent per file, so callers may run
+    files in parallel / report progress, then combine_parsed_files() the results in upload order."""
+    filename = getattr(file, "filename", "") or getattr(file, "name", f"file_{idx+1}")
+    print(f"\n📁 ไฟล์ที่ {idx+1}: {filename}")
+    workbook, layout_key = _load_workbook_from_upload(file)
+    print(f"   Layout: {layout_key}")
+    print(f"   Sheets: {[sheet.title for sheet in workbook.worksheets]}")
+    company_name = _extract_company_name(workbook)
+    return {
+        "file": filename,
+        "company": company_name or "(ไม่พบชื่อบริษัท)",
+        "sections": _extract_from_workbook(workbook, layout_key),
+    }
+
+
+def combine_parsed_files(parsed: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Check that every file is the same company, then merge sections in file order."""
     aggregated = {
         "years": YEARS,
         "balance_sheet": {},
@@ -83,51 +115,28 @@ def parse_financial_files(workbooks):
         "ratios": {},
         "company_name": None,
     }
-    
-    print("\n" + "="*80)
-    print("📊 เริ่มการประมวลผลไฟล์ทางการเงิน")
-    print("="*80)
-    
-    # ตรวจสอบชื่อบริษัทจากทุกไฟล์ก่อน (ป้องกันการอัปโหลดไฟล์ผิด)
-    company_names_found = []
-    for idx, file in enumerate(files):
-        filename = getattr(file, "filename", "") or getattr(file, "name", f"file_{idx+1}")
-        workbook, _ = _load_workbook_from_upload(file)
-        company_name = _extract_company_name(workbook)
-        company_names_found.append({
-            "file": filename,
-            "company": company_name or "(ไม่พบชื่อบริษัท)"
-        })
-    
-    # ตรวจสอบว่าชื่อบริษัทตรงกันหรือไม่ (ถ้ามีหลายไฟล์)
-    if len(files) > 1:
-        unique_companies = set([c["company"] for c in company_names_found if c["company"] and c["company"] != "(ไม่พบชื่อบริษัท)"])
+
+    # ตรวจสอบว่าชื่อบริษัทตรงกันหรือไม่ (ถ้ามีหลายไฟล์) ป้องกันการอัปโหลดไฟล์ผิด
+    if len(parsed) > 1:
+        unique_companies = set([c["company"] for c in parsed if c["company"] and c["company"] != "(ไม่พบชื่อบริษัท)"])
         if len(unique_companies) > 1:
             error_msg = "⚠️ พบชื่อบริษัทไม่ตรงกันในไฟล์ที่อัปโหลด:\n"
-            for item in company_names_found:
+            for item in parsed:
                 error_msg += f"   - {item['file']}: {item['company']}\n"
             error_msg += "\nกรุณาตรวจสอบและอัปโหลดเฉพาะไฟล์ของบริษัทเดียวกัน"
             print(error_msg)
             raise ValueError(error_msg)
-    
-    # ประมวลผลไฟล์ (ชื่อบริษัทตรงกันแล้ว หรือมีไฟล์เดียว)
-    for idx, file in enumerate(files):
-        filename = getattr(file, "filename", "") or getattr(file, "name", f"file_{idx+1}")
-        print(f"\n📁 ไฟล์ที่ {idx+1}: {filename}")
-        
-        workbook, layout_key = _load_workbook_from_upload(file)
-        print(f"   Layout: {layout_key}")
-        print(f"   Sheets: {[sheet.title for sheet in workbook.worksheets]}")
-        
-        # Extract company name from first file if not already set
+
+    for item in parsed:
+        # Company name from the first file
         if aggregated["company_name"] is None:
-            aggregated["company_name"] = company_names_found[idx]["company"]
+            aggregated["company_name"] = item["company"]
             if aggregated["company_name"] and aggregated["company_name"] != "(ไม่พบชื่อบริษัท)":
                 print(f"   🏢 ชื่อบริษัท: {aggregated['company_name']}")
             else:
                 print(f"   ⚠️  ไม่พบชื่อบริษัท")
-        
-        extracted = _extract_from_workbook(workbook, layout_key)
+
+        extracted = item["sections"]
         _merge_sections(aggregated["balance_sheet"], extracted["balance_sheet"])
         _merge_sections(aggregated["income_statement"], extracted["income_statement"])
         _merge_sections(aggregated["ratios"], extracted["ratios"])
@@ -162,23 +171,29 @@ def _extract_company_name(workbook) -> Optional[str]:
     Extract company name from Excel workbook.
     Typically found in row 1, columns A-G of the first or ratio sheet.
     """
+    return _company_name_from_headers([(sheet.title, _sheet_header(sheet)) for sheet in workbook.worksheets])
+
+
+def _company_name_from_headers(sheets: List[Tuple[str, Dict[str, Any]]]) -> Optional[str]:
+    """Company name from (sheet title, header cells) pairs in workbook order — shared by the full load and
+    the header-only sniffers, so both give the same answer."""
     # Try ratio sheet first, then first sheet
     sheets_to_check = []
-    for sheet in workbook.worksheets:
-        sheet_type = _detect_sheet_type(sheet)
+    for title, header in sheets:
+        sheet_type = _sheet_type_from_header(title, header)
         if sheet_type == "ratio":
-            sheets_to_check.insert(0, sheet)  # Prioritize ratio sheet
+            sheets_to_check.insert(0, header)  # Prioritize ratio sheet
         elif not sheets_to_check:
-            sheets_to_check.append(sheet)  # Fallback to first sheet
+            sheets_to_check.append(header)  # Fallback to first sheet
     
     if not sheets_to_check:
         return None
     
     # Check first few rows for company name, prioritizing row 1
-    for sheet in sheets_to_check[:2]:  # Check max 2 sheets
+    for header in sheets_to_check[:2]:  # Check max 2 sheets
         for row_num in [1, 2, 3]:  # Check rows 1-3, prioritize 1
             for col_letter in ["C", "B", "A", "D", "E", "F", "G"]:  # Prioritize C, B, A
-                cell_value = sheet[f"{col_letter}{row_num}"].value
+                cell_value = header.get(f"{col_letter}{row_num}")
                 if cell_value and isinstance(cell_value, str):
                     # Clean up the value
                     cleaned = str(cell_value).strip()
@@ -246,11 +261,26 @@ def _merge_sections(target: Dict[str, Dict[int, float]], source: Dict[str, Dict[
 
 
 def _detect_sheet_type(sheet) -> Optional[str]:
-    keywords = []
-    for row in sheet.iter_rows(min_row=1, max_row=8, max_col=4):
+    return _sheet_type_from_header(sheet.title, _sheet_header(sheet))
+
+
+def _sheet_header(sheet) -> Dict[str, Any]:
+    """Non-empty cells of the header block (A1:G8) by reference, e.g. {"C1": "..."}."""
+    header = {}
+    for row in sheet.iter_rows(min_row=1, max_row=_HEADER_ROWS, max_col=len(_HEADER_COLUMNS)):
         for cell in row:
-            if cell.value:
-                keywords.append(str(cell.value).lower())
+            if cell.value is not None:
+                header[f"{cell.column_letter}{cell.row}"] = cell.value
+    return header
+
+
+def _sheet_type_from_header(title: str, header: Dict[str, Any]) -> Optional[str]:
+    keywords = []
+    for row in range(1, _HEADER_ROWS + 1):
+        for col in "ABCD":
+            value = header.get(f"{col}{row}")
+            if value:
+                keywords.append(str(value).lower())
     text = " ".join(keywords)
     if "อัตราส่วน" in text or "ratio" in text:
         return "ratio"
@@ -259,7 +289,7 @@ def _detect_sheet_type(sheet) -> Optional[str]:
     if "ฐานะ" in text or "balance" in text or "สินทรัพย์รวม" in text:
         return "balance"
     # fallback based on sheet name
-    name = sheet.title.lower()
+    name = title.lower()
     if any(word in name for word in ["ratio", "อัตราส่วน"]):
         return "ratio"
     if any(word in name for word in ["income", "profit", "กำไร"]):
@@ -340,6 +370,170 @@ def _load_workbook_from_upload(file_obj) -> Tuple[Workbook, str]:
     return load_workbook(BytesIO(raw_bytes), data_only=True), "standard"
 
 
+def sniff_company_name(file_obj) -> Optional[str]:
+    """Company name from the header rows only, without loading the workbook (for /api/analyze/preview).
+    xlsx: reads the workbook's sheet list, the first rows of each sheet XML and only the shared strings those rows
+    use; xls: xlrd on_demand, one sheet in memory at a time and no openpyxl copy. Same answer as
+    _extract_company_name; files the sniffer cannot read go through the full load (and its errors)."""
+    filename = getattr(file_obj, "filename", "") or getattr(file_obj, "name", "")
+    raw = _read_upload_bytes(file_obj)
+    try:
+        if os.path.splitext(filename.lower())[1] == ".xls":
+            headers = _sniff_xls_headers(raw)
+        else:
+            headers = _sniff_xlsx_headers(raw)
+    except Exception:
+        workbook, _ = _load_workbook_from_upload(file_obj)
+        return _extract_company_name(workbook)
+    return _company_name_from_headers(headers)
+
+
+class _SharedString(int):
+    """Header cell holding an index into sharedStrings.xml, resolved once the needed indices are known."""
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _part_rels(archive: zipfile.ZipFile, part: str) -> Dict[str, Tuple[str, str]]:
+    """Relationship id → (type, part path) for a package part, e.g. xl/workbook.xml."""
+    folder, name = posixpath.split(part)
+    rels_path = posixpath.join(folder, "_rels", f"{name}.rels")
+    if rels_path not in archive.namelist():
+        return {}
+    rels = {}
+    for rel in ElementTree.fromstring(archive.read(rels_path)):
+        target = rel.get("Target", "")
+        path = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join(folder, target))
+        rels[rel.get("Id")] = (rel.get("Type", ""), path)
+    return rels
+
+
+def _sniff_xlsx_headers(raw: bytes) -> List[Tuple[str, Dict[str, Any]]]:
+    with zipfile.ZipFile(BytesIO(raw)) as archive:
+        book_path = next(
+            (path for kind, path in _part_rels(archive, "").values() if kind.endswith("/officeDocument")),
+            "xl/workbook.xml",
+        )
+        rels = _part_rels(archive, book_path)
+        headers = []
+        for element in ElementTree.fromstring(archive.read(book_path)).iter():
+            if _local_name(element.tag) != "sheet":
+                continue
+            rel_id = next((v for k, v in element.attrib.items() if _local_name(k) == "id"), None)
+            kind, path = rels.get(rel_id, ("", ""))
+            if kind.endswith("/worksheet"):  # chartsheets are not in workbook.worksheets either
+                headers.append((element.get("name", ""), _sniff_sheet_header(archive, path)))
+
+        needed = {value for _, header in headers for value in header.values() if isinstance(value, _SharedString)}
+        if needed:
+            strings_path = next((path for kind, path in rels.values() if kind.endswith("/sharedStrings")), None)
+            strings = _read_shared_strings(archive, strings_path, max(needed)) if strings_path else {}
+            for _, header in headers:
+                for ref, value in list(header.items()):
+                    if isinstance(value, _SharedString):
+                        header[ref] = strings.get(int(value))
+    return headers
+
+
+def _column_index(ref: str) -> int:
+    index = 0
+    for char in ref:
+        if not char.isalpha():
+            break
+        index = index * 26 + ord(char.upper()) - 64
+    return index
+
+
+def _sniff_sheet_header(archive: zipfile.ZipFile, path: str) -> Dict[str, Any]:
+    """Cached values of A1:G8, stopping at the first row below the header block (the rest is never inflated)."""
+    header: Dict[str, Any] = {}
+    row_num = col_num = 0
+    with archive.open(path) as stream:
+        for event, element in ElementTree.iterparse(stream, events=("start", "end")):
+            name = _local_name(element.tag)
+            if event == "start":
+                if name == "row":
+                    row_num = int(element.get("r") or row_num + 1)
+                    col_num = 0
+                    if row_num > _HEADER_ROWS:
+                        break
+                elif name == "c":
+                    ref = element.get("r")
+                    col_num = _column_index(ref) if ref else col_num + 1
+                continue
+            if name == "c":
+                if col_num <= len(_HEADER_COLUMNS):
+                    value = _sniffed_cell_value(element)
+                    if value is not None:
+                        header[f"{_HEADER_COLUMNS[col_num - 1]}{row_num}"] = value
+                element.clear()
+            elif name == "row":
+                element.clear()
+    return header
+
+
+def _sniffed_cell_value(cell) -> Any:
+    kind = cell.get("t", "n")
+    if kind == "inlineStr":
+        return "".join(t.text or "" for t in cell.iter() if _local_name(t.tag) == "t") or None
+    raw = next((child.text for child in cell if _local_name(child.tag) == "v"), None)
+    if raw is None:
+        return None
+    if kind == "s":
+        return _SharedString(int(raw))
+    if kind in ("str", "e"):
+        return raw
+    if kind == "b":
+        return raw == "1"
+    try:
+        return int(raw)
+    except ValueError:
+        return float(raw)
+
+
+def _read_shared_strings(archive: zipfile.ZipFile, path: str, last_index: int) -> Dict[int, str]:
+    """Shared strings 0..last_index (the header cells' indices); stops reading after the last one needed."""
+    strings: Dict[int, str] = {}
+    with archive.open(path) as stream:
+        for _, element in ElementTree.iterparse(stream, events=("end",)):
+            if _local_name(element.tag) != "si":
+                continue
+            # Plain <t> or rich-text runs <r><t>; phonetic hints (<rPh>) are not part of the value
+            parts = []
+            for child in element:
+                child_name = _local_name(child.tag)
+                if child_name == "t":
+                    parts.append(child.text or "")
+                elif child_name == "r":
+                    parts.extend(t.text or "" for t in child if _local_name(t.tag) == "t")
+            strings[len(strings)] = "".join(parts)
+            element.clear()
+            if len(strings) > last_index:
+                break
+    return strings
+
+
+def _sniff_xls_headers(raw: bytes) -> List[Tuple[str, Dict[str, Any]]]:
+    book = xlrd.open_workbook(file_contents=raw, on_demand=True)
+    try:
+        headers = []
+        for index in range(book.nsheets):
+            sheet = book.sheet_by_index(index)
+            header = {}
+            for row in range(min(sheet.nrows, _HEADER_ROWS)):
+                for col in range(min(sheet.ncols, len(_HEADER_COLUMNS))):
+                    value = sheet.cell_value(row, col)
+                    if value != "":
+                        header[f"{_HEADER_COLUMNS[col]}{row + 1}"] = value
+            headers.append((_safe_sheet_title(sheet.name), header))
+            book.unload_sheet(index)
+    finally:
+        book.release_resources()
+    return headers
+
+
 def _read_upload_bytes(file_obj) -> bytes:
     stream = getattr(file_obj, "stream", file_obj)
     if hasattr(stream, "seek"):
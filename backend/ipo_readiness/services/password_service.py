@@ -0,0 +1,175 @@
+"""Password hashing: versioned scrypt / PBKDF2 hashes with configurable cost, run on a bounded thread pool.
+
+Stored formats:
+    scrypt$<n>$<r>$<p>$<salt hex>$<hash hex>
+    pbkdf2_sha256$<iterations>$<salt hex>$<hash hex>
+    <salt hex>$<sha256 hex>                      (legacy single round, verified and upgraded on login)
+
+The cost is read from the environment, so raising it only needs a restart: needs_rehash() reports hashes
+made with another scheme or cost, and authenticate_user re-hashes those after a successful login.
+
+Benchmark logins/second per cost setting:  python -m ipo_readiness.services.password_service
+"""
+from __future__ import annotations
+
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+PASSWORD_HASH_SCHEME = (os.environ.get("PASSWORD_HASH_SCHEME") or "scrypt").strip().lower()
+SCRYPT_N = int(os.environ.get("PASSWORD_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.environ.get("PASSWORD_SCRYPT_R", "8"))
+SCRYPT_P = int(os.environ.get("PASSWORD_SCRYPT_P", "1"))
+PBKDF2_ITERATIONS = int(os.environ.get("PASSWORD_PBKDF2_ITERATIONS", "600000"))
+# Concurrent hashes (each scrypt call holds ~128·n·r bytes) and how many more may wait before logins get 503
+_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", "2"))
+_HASH_QUEUE = int(os.environ.get("PASSWORD_HASH_QUEUE", "32"))
+
+_SCHEMES = ("scrypt", "pbkdf2_sha256")
+_KEY_LEN = 32
+
+
+class PasswordHasherBusy(RuntimeError):
+    """Too many hashes are already running or queued; the caller should retry later."""
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode("utf-8"), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + (1 << 20), dklen=_KEY_LEN
+    )
+
+
+def _pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations, dklen=_KEY_LEN)
+
+
+def _hash_now(password: str, scheme: str, cost: Dict[str, int]) -> str:
+    salt = secrets.token_bytes(16)
+    if scheme == "scrypt":
+        n, r, p = cost["n"], cost["r"], cost["p"]
+        return f"scrypt${n}${r}${p}${salt.hex()}${_scrypt(password, salt, n, r, p).hex()}"
+    if scheme == "pbkdf2_sha256":
+        iterations = cost["iterations"]
+        return f"pbkdf2_sha256${iterations}${salt.hex()}${_pbkdf2(password, salt, iterations).hex()}"
+    raise ValueError(f"PASSWORD_HASH_SCHEME ไม่รองรับ: {scheme}")
+
+
+def _current_cost(scheme: str) -> Dict[str, int]:
+    if scheme == "scrypt":
+        return {"n": SCRYPT_N, "r": SCRYPT_R, "p": SCRYPT_P}
+    return {"iterations": PBKDF2_ITERATIONS}
+
+
+def _verify_now(stored: str, password: str) -> bool:
+    parts = stored.split("$")
+    if parts[0] == "scrypt" and len(parts) == 6:
+        n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+        candidate = _scrypt(password, bytes.fromhex(parts[4]), n, r, p)
+        return hmac.compare_digest(candidate, bytes.fromhex(parts[5]))
+    if parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+        candidate = _pbkdf2(password, bytes.fromhex(parts[2]), int(parts[1]))
+        return hmac.compare_digest(candidate, bytes.fromhex(parts[3]))
+    if len(parts) == 2:  # legacy salt$sha256
+        salt, digest = parts
+        return hmac.compare_digest(hashlib.sha256((salt + password).encode()).hexdigest(), digest)
+    return False
+
+
+class _HashPool:
+    """Fixed worker threads for hashing (hashlib releases the GIL) plus a cap on waiting jobs."""
+
+    def __init__(self, workers: int, queue_size: int) -> None:
+        self._workers = max(1, workers)
+        self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="password-hash")
+        self._slots = threading.BoundedSemaphore(self._workers + max(0, queue_size))
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy("ระบบกำลังประมวลผลการเข้าสู่ระบบจำนวนมาก กรุณาลองใหม่อีกครั้ง")
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def map(self, fn, items: List) -> List:
+        """Bulk work (imports): same workers, at most `workers` jobs in flight so queue slots stay free for logins.
+        Waits for slots in the calling thread (never inside a worker, which could deadlock the pool)."""
+        in_flight = threading.BoundedSemaphore(self._workers)
+        futures = []
+
+        def release(_future):
+            self._slots.release()
+            in_flight.release()
+
+        for item in items:
+            in_flight.acquire()
+            self._slots.acquire()
+            future = self._executor.submit(fn, item)
+            future.add_done_callback(release)
+            futures.append(future)
+        return [future.result() for future in futures]
+
+
+_pool = _HashPool(_HASH_WORKERS, _HASH_QUEUE)
+
+
+def hash_password(password: str) -> str:
+    """Hash with the configured scheme and cost. Raises PasswordHasherBusy when the pool is saturated."""
+    return _pool.run(_hash_now, password, PASSWORD_HASH_SCHEME, _current_cost(PASSWORD_HASH_SCHEME))
+
+
+def hash_passwords(passwords: List[str]) -> List[str]:
+    """Hash many passwords in parallel on the shared pool (bulk import); waits for capacity instead of failing."""
+    scheme, cost = PASSWORD_HASH_SCHEME, _current_cost(PASSWORD_HASH_SCHEME)
+    return _pool.map(lambda password: _hash_now(password, scheme, cost), passwords)
+
+
+def verify_password(stored: str, password: str) -> bool:
+    """Constant-time check against any supported format; False for malformed hashes."""
+    try:
+        return _pool.run(_verify_now, stored, password)
+    except PasswordHasherBusy:
+        raise
+    except Exception:
+        return False
+
+
+def needs_rehash(stored: str) -> bool:
+    """True when stored was made with a different scheme or cost than the current configuration."""
+    parts = stored.split("$")
+    if parts[0] != PASSWORD_HASH_SCHEME or PASSWORD_HASH_SCHEME not in _SCHEMES:
+        return True
+    cost = _current_cost(PASSWORD_HASH_SCHEME)
+    if PASSWORD_HASH_SCHEME == "scrypt":
+        return parts[1:4] != [str(cost["n"]), str(cost["r"]), str(cost["p"])]
+    return parts[1] != str(cost["iterations"])
+
+
+def _benchmark(seconds: float = 2.0) -> None:
+    import time
+
+    settings = [("scrypt", {"n": 2 ** k, "r": 8, "p": 1}) for k in (12, 13, 14, 15, 16)]
+    settings += [("pbkdf2_sha256", {"iterations": i}) for i in (100_000, 310_000, 600_000, 1_200_000)]
+    print(f"{'scheme':<15}{'cost':<28}{'ms/login':>10}{'logins/s (1 thread)':>22}{f'logins/s ({_HASH_WORKERS} workers)':>24}")
+    for scheme, cost in settings:
+        stored = _hash_now("benchmark-password", scheme, cost)
+        runs, started = 0, time.perf_counter()
+        while time.perf_counter() - started < seconds:
+            _verify_now(stored, "benchmark-password")
+            runs += 1
+        per_login = (time.perf_counter() - started) / runs
+        with ThreadPoolExecutor(max_workers=_HASH_WORKERS) as executor:
+            jobs = max(_HASH_WORKERS * 4, runs)
+            started = time.perf_counter()
+            list(executor.map(lambda _: _verify_now(stored, "benchmark-password"), range(jobs)))
+            parallel = jobs / (time.perf_counter() - started)
+        label = ",".join(f"{k}={v}" for k, v in cost.items())
+        print(f"{scheme:<15}{label:<28}{per_login * 1000:>10.1f}{1 / per_login:>22.1f}{parallel:>24.1f}")
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,143 @@
+"""Token-bucket admission control per route and client (user id from the session token, else client IP).
+
+Limits come from the environment as "<requests>/<seconds>", e.g. RATE_LIMIT_ANALYZE="10/60": a bucket holds
+at most 10 tokens and refills 10 every 60 seconds. RATE_LIMIT_<ROUTE>_GLOBAL optionally caps the route for
+all clients together on this store. Unset or "0" disables the limit.
+
+RATE_LIMIT_STORE=memory (default) keeps buckets per worker process; RATE_LIMIT_STORE=db keeps them in the
+rate_limit_buckets table so every gunicorn worker / instance shares one budget (one UPSERT per request).
+"""
+from __future__ import annotations
+
+import math
+import os
+import threading
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from ipo_readiness.services.db_helper import get_connection, use_postgres, execute_fetchone
+
+RATE_LIMIT_STORE = (os.environ.get("RATE_LIMIT_STORE") or "memory").strip().lower()
+
+# Defaults per route: generous for a person clicking, tight for a retry loop
+_DEFAULT_LIMITS = {
+    "analyze": "10/60",
+    "analyze_preview": "30/60",
+    "analyze_batch": "2/60",
+}
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    capacity: float
+    per_seconds: float
+
+    @property
+    def refill_rate(self) -> float:
+        return self.capacity / self.per_seconds
+
+
+def _parse_limit(spec: Optional[str]) -> Optional[RateLimit]:
+    spec = (spec or "").strip()
+    if not spec or spec == "0":
+        return None
+    count, _, seconds = spec.partition("/")
+    limit = RateLimit(capacity=float(count), per_seconds=float(seconds or 1))
+    if limit.capacity <= 0 or limit.per_seconds <= 0:
+        return None
+    return limit
+
+
+def route_limits(route: str) -> Tuple[Optional[RateLimit], Optional[RateLimit]]:
+    """(per-client, global) limits for a route name, read from RATE_LIMIT_<ROUTE>[_GLOBAL]."""
+    env = f"RATE_LIMIT_{route.upper()}"
+    return _parse_limit(os.environ.get(env, _DEFAULT_LIMITS.get(route))), _parse_limit(os.environ.get(f"{env}_GLOBAL"))
+
+
+class _MemoryBuckets:
+    """Buckets for this process: key → (tokens, last refill). Idle full buckets are dropped periodically."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._last_prune = time.monotonic()
+
+    def take(self, key: str, limit: RateLimit) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (limit.capacity, now))
+            tokens = min(limit.capacity, tokens + (now - updated) * limit.refill_rate)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+            if now - self._last_prune > 60:
+                self._prune(now)
+        return 0.0 if allowed else (1 - tokens) / limit.refill_rate
+
+    def _prune(self, now: float) -> None:
+        self._last_prune = now
+        # A bucket untouched for an hour is full again for any sensible limit; forgetting it is equivalent
+        self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < 3600}
+
+
+class _DatabaseBuckets:
+    """Buckets in rate_limit_buckets, refilled and decremented atomically in one UPSERT ... RETURNING."""
+
+    def take(self, key: str, limit: RateLimit) -> float:
+        least = "LEAST" if use_postgres() else "MIN"
+        refilled = (
+            f"{least}(?, rate_limit_buckets.tokens + (excluded.updated_at - rate_limit_buckets.updated_at) * ?)"
+        )
+        sql = f"""
+            INSERT INTO rate_limit_buckets (bucket, tokens, updated_at, allowed) VALUES (?, ?, ?, 1)
+            ON CONFLICT (bucket) DO UPDATE SET
+                tokens = CASE WHEN {refilled} >= 1 THEN {refilled} - 1 ELSE {refilled} END,
+                allowed = CASE WHEN {refilled} >= 1 THEN 1 ELSE 0 END,
+                updated_at = excluded.updated_at
+            RETURNING tokens, allowed
+        """
+        cap, rate = limit.capacity, limit.refill_rate
+        params = (key, cap - 1, time.time()) + (cap, rate) * 4
+        with closing(get_connection()) as conn:
+            row = execute_fetchone(conn, sql, params)
+            conn.commit()
+        if row["allowed"]:
+            return 0.0
+        return (1 - float(row["tokens"])) / rate
+
+
+_memory = _MemoryBuckets()
+_database = _DatabaseBuckets()
+
+
+def init_rate_limit_store() -> None:
+    """Create rate_limit_buckets when the shared store is enabled."""
+    if RATE_LIMIT_STORE != "db":
+        return
+    real = "DOUBLE PRECISION" if use_postgres() else "REAL"
+    with closing(get_connection()) as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                bucket TEXT PRIMARY KEY,
+                tokens {real} NOT NULL,
+                updated_at {real} NOT NULL,
+                allowed INTEGER NOT NULL
+            )
+        """)
+        conn.commit()
+
+
+def check_rate_limit(route: str, client: str) -> Optional[int]:
+    """Take one token for (route, client) and for the route's global bucket.
+    None = allowed; otherwise the whole seconds to wait (for Retry-After)."""
+    store = _database if RATE_LIMIT_STORE == "db" else _memory
+    per_client, overall = route_limits(route)
+    waits = []
+    if per_client is not None:
+        waits.append(store.take(f"{route}:{client}", per_client))
+    if overall is not None and not any(waits):
+        waits.append(store.take(f"{route}:*", overall))
+    wait = max(waits, default=0.0)
+    return max(1, math.ceil(wait)) if wait > 0 else None
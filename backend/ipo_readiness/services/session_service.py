@@ -0,0 +1,148 @@
+"""Signed, expiring session tokens (HMAC-SHA256), verified in memory without touching the users table.
+
+Token = base64url(JSON claims) + "." + base64url(HMAC). Claims carry user id, name, role, issued-at and expiry
+(milliseconds). A token is revoked when its user has a session_revocations row newer than the token's
+issued-at; update_user / delete_user write that row and publish "session_revocations" through cache_bus,
+so every worker reloads the (small) revocation map on its next verification.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from ipo_readiness.services import cache_bus
+from ipo_readiness.services.db_helper import (
+    get_connection,
+    execute,
+    execute_fetchall,
+)
+
+SESSION_TTL = int(os.environ.get("SESSION_TTL", str(8 * 3600)))  # seconds
+_REVOCATION_CACHE_TTL = float(os.environ.get("SESSION_REVOCATION_TTL", "30"))
+
+
+def _load_secret() -> bytes:
+    secret = (os.environ.get("SESSION_SECRET") or "").strip()
+    if secret:
+        return secret.encode()
+    print("[WARN] SESSION_SECRET is not set: using a random per-process key (tokens do not survive restarts or span workers)")
+    return secrets.token_bytes(32)
+
+
+_SECRET = _load_secret()
+
+
+@dataclass
+class SessionClaims:
+    user_id: int
+    name: str
+    role: str
+    issued_at: int  # epoch ms
+    expires_at: int  # epoch ms
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role.strip().lower() == "admin"
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(_SECRET, payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def init_session_store() -> None:
+    """Create the session_revocations table when it does not exist."""
+    with closing(get_connection()) as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS session_revocations (
+                user_id INTEGER PRIMARY KEY,
+                revoked_at BIGINT NOT NULL
+            )
+        """)
+        conn.commit()
+
+
+def issue_token(user_id: int, name: str, role: str, ttl: Optional[int] = None) -> str:
+    """Signed token for a freshly authenticated user."""
+    now = _now_ms()
+    claims = {
+        "uid": user_id,
+        "name": name,
+        "role": role,
+        "iat": now,
+        "exp": now + (ttl or SESSION_TTL) * 1000,
+    }
+    payload = _b64encode(json.dumps(claims, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+    return f"{payload}.{_sign(payload)}"
+
+
+def _load_revocations() -> Dict[int, int]:
+    cutoff = _now_ms() - SESSION_TTL * 1000  # older revocations cannot match a live token
+    with closing(get_connection()) as conn:
+        rows = execute_fetchall(
+            conn,
+            "SELECT user_id, revoked_at FROM session_revocations WHERE revoked_at > ?",
+            (cutoff,),
+        )
+    return {row["user_id"]: row["revoked_at"] for row in rows}
+
+
+_revocations = cache_bus.VersionedValue(("session_revocations",), _REVOCATION_CACHE_TTL, _load_revocations)
+
+
+def verify_token(token: str) -> SessionClaims:
+    """Check signature, expiry and revocation. Raises ValueError when the token is not valid."""
+    try:
+        payload, signature = token.strip().split(".", 1)
+        if not hmac.compare_digest(signature.encode("ascii"), _sign(payload).encode("ascii")):
+            raise ValueError("bad signature")
+        raw = json.loads(_b64decode(payload))
+        claims = SessionClaims(
+            user_id=int(raw["uid"]),
+            name=raw["name"],
+            role=raw["role"],
+            issued_at=int(raw["iat"]),
+            expires_at=int(raw["exp"]),
+        )
+    except (ValueError, KeyError, TypeError):  # includes malformed base64 / JSON / non-ASCII input
+        raise ValueError("session token ไม่ถูกต้อง") from None
+    if claims.expires_at <= _now_ms():
+        raise ValueError("session หมดอายุ กรุณาเข้าสู่ระบบใหม่")
+    revoked_at = _revocations.get().get(claims.user_id)
+    if revoked_at is not None and claims.issued_at <= revoked_at:
+        raise ValueError("session ถูกยกเลิก กรุณาเข้าสู่ระบบใหม่")
+    return claims
+
+
+def revoke_user_sessions(user_id: int) -> None:
+    """Invalidate every token issued to user_id so far (role / password change, deletion)."""
+    now = _now_ms()
+    with closing(get_connection()) as conn:
+        execute(
+            conn,
+            """INSERT INTO session_revocations (user_id, revoked_at) VALUES (?, ?)
+               ON CONFLICT (user_id) DO UPDATE SET revoked_at = excluded.revoked_at""",
+            (user_id, now),
+        )
+        conn.commit()
+    cache_bus.publish("session_revocations")
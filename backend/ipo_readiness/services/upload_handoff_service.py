@@ -0,0 +1,98 @@
+"""Preview → analyze handoff: /api/analyze/preview keeps the uploaded files and returns a token, so
+/api/analyze and /api/analyze/jobs can take the token instead of the same files uploaded a second time.
+
+Handoffs live in this process's memory (the deployment runs a single gunicorn worker, like analysis_job_service)
+for ANALYZE_HANDOFF_TTL seconds, and ANALYZE_HANDOFF_MAX_MB bounds their total size: the oldest are dropped
+first. A token the process does not know (expired, evicted, other instance) raises HandoffExpired, and the
+client simply uploads the files again.
+"""
+from __future__ import annotations
+
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional
+
+from ipo_readiness.services.analysis_service import UploadedFile
+
+ANALYZE_HANDOFF_TTL = int(os.environ.get("ANALYZE_HANDOFF_TTL", "900"))
+ANALYZE_HANDOFF_MAX_BYTES = int(os.environ.get("ANALYZE_HANDOFF_MAX_MB", "200")) * 1024 * 1024
+
+
+class HandoffExpired(ValueError):
+    """Unknown, expired or evicted handoff token (or one issued to another user)."""
+
+    def __init__(self) -> None:
+        super().__init__("ไฟล์ที่ตรวจสอบไว้หมดอายุแล้ว กรุณาอัปโหลดไฟล์อีกครั้ง")
+
+
+@dataclass
+class _Handoff:
+    owner_id: Optional[int]
+    uploads: List[UploadedFile]
+    size: int
+    expires_at: float
+
+
+class _HandoffStore:
+    def __init__(self, ttl: int, max_bytes: int) -> None:
+        self._ttl = ttl
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, _Handoff]" = OrderedDict()  # oldest first
+        self._bytes = 0
+
+    def put(self, uploads: List[UploadedFile], owner_id: Optional[int]) -> Optional[str]:
+        size = sum(len(u.data) for u in uploads)
+        if size > self._max_bytes:
+            return None
+        token = secrets.token_urlsafe(24)
+        with self._lock:
+            self._purge(time.time())
+            while self._items and self._bytes + size > self._max_bytes:
+                self._drop(next(iter(self._items)))
+            self._items[token] = _Handoff(owner_id, uploads, size, time.time() + self._ttl)
+            self._bytes += size
+        return token
+
+    def get(self, token: str, owner_id: Optional[int]) -> List[UploadedFile]:
+        with self._lock:
+            self._purge(time.time())
+            item = self._items.get(token)
+        if item is None or (item.owner_id is not None and item.owner_id != owner_id):
+            raise HandoffExpired()
+        return item.uploads
+
+    def discard(self, token: str) -> None:
+        with self._lock:
+            if token in self._items:
+                self._drop(token)
+
+    def _purge(self, now: float) -> None:
+        for token in [t for t, item in self._items.items() if item.expires_at <= now]:
+            self._drop(token)
+
+    def _drop(self, token: str) -> None:
+        self._bytes -= self._items.pop(token).size
+
+
+_store = _HandoffStore(ANALYZE_HANDOFF_TTL, ANALYZE_HANDOFF_MAX_BYTES)
+
+
+def store_handoff(uploads: List[UploadedFile], owner_id: Optional[int] = None) -> Optional[str]:
+    """Keep uploads for a later analyze call; returns the token (None when the files alone exceed the cap)."""
+    return _store.put(uploads, owner_id)
+
+
+def take_handoff(token: str, owner_id: Optional[int] = None) -> List[UploadedFile]:
+    """Files kept under token. The handoff stays until discard_handoff() or expiry, so a rejected analyze
+    (queue full, rate limit) can be retried with the same token. Raises HandoffExpired."""
+    return _store.get(token, owner_id)
+
+
+def discard_handoff(token: Optional[str]) -> None:
+    if token:
+        _store.discard(token)
@@ -1,15 +1,19 @@
 """User repository: SQLite (local) or PostgreSQL (production via DATABASE_URL)."""
 from __future__ import annotations
 
+import csv
+import io
+import json
 import os
+import re
 import sqlite3
 from contextlib import closing
 from dataclasses import dataclass
-from typing import List, Optional
-
-import hashlib
-import secrets
+from typing import Any, Dict, List, Optional
 
+from ipo_readiness.services import cache_bus
+from ipo_readiness.services.session_service import revoke_user_sessions
+from ipo_readiness.services.password_service import hash_password, hash_passwords, verify_password, needs_rehash
 from ipo_readiness.services.db_helper import (
     get_connection,
     use_postgres,
@@ -17,27 +21,11 @@ from ipo_readiness.services.db_helper import (
     execute_fetchall,
     execute_insert,
     execute_commit,
+    execute_many,
     integrity_error,
 )
 
 
-def _hash_password(password: str) -> str:
-    """Hash password using SHA256 with salt."""
-    salt = secrets.token_hex(16)
-    hash_obj = hashlib.sha256((salt + password).encode())
-    return f"{salt}${hash_obj.hexdigest()}"
-
-
-def _verify_password(password_hash: str, password: str) -> bool:
-    """Verify password against hash."""
-    try:
-        salt, stored_hash = password_hash.split('$')
-        hash_obj = hashlib.sha256((salt + password).encode())
-        return hash_obj.hexdigest() == stored_hash
-    except Exception:
-        return False
-
-
 @dataclass
 class User:
     id: int
@@ -57,6 +45,45 @@ def _row_to_user(row) -> User:
     )
 
 
+# Safety net for writes that bypass this module (e.g. manual SQL); create/update/delete invalidate immediately.
+_USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", "300"))
+
+
+def _load_directory() -> Dict[str, Any]:
+    """The users table as served from the cache: list (newest first), id→User and email→User."""
+    with closing(get_connection()) as conn:
+        rows = execute_fetchall(conn, "SELECT id, name, email, role FROM users ORDER BY created_at DESC")
+    users = [_row_to_user(row) for row in rows]
+    return {"users": users, "by_id": {u.id: u for u in users}, "by_email": {u.email: u for u in users}}
+
+
+# In-process read-through cache of the users table, reloaded when any worker publishes "users"
+_directory = cache_bus.VersionedValue(("users",), _USER_CACHE_TTL, _load_directory)
+
+
+def invalidate_user_cache() -> None:
+    """Drop the cached user directory here and in every other worker (called by every users write)."""
+    _directory.clear()
+    cache_bus.publish("users")
+
+
+def get_user(user_id: Optional[int]) -> Optional[User]:
+    """Cached lookup by id (None when unknown)."""
+    if user_id is None:
+        return None
+    return _directory.get()["by_id"].get(user_id)
+
+
+def get_user_by_email(email: str) -> Optional[User]:
+    """Cached lookup by (normalized) email."""
+    return _directory.get()["by_email"].get(email.strip().lower())
+
+
+def user_names() -> Dict[int, str]:
+    """Cached id→name map for resolving assessed_by without joining users."""
+    return {uid: u.name for uid, u in _directory.get()["by_id"].items()}
+
+
 def init_user_store() -> None:
     """Create the users table when it does not exist."""
     if use_postgres():
@@ -106,9 +133,19 @@ def _seed_admin_if_empty() -> None:
 
 
 def list_users() -> List[User]:
-    with closing(get_connection()) as conn:
-        rows = execute_fetchall(conn, "SELECT id, name, email, role FROM users ORDER BY created_at DESC")
-    return [_row_to_user(row) for row in rows]
+    """All users, newest first (served from the in-process directory cache)."""
+    return list(_directory.get()["users"])
+
+
+ROLES = ("admin", "manager", "analyst", "user")  # the roles the UI offers; "user" is the default
+
+
+def _checked_role(role: str) -> str:
+    """Normalized role, "user" when blank; ValueError for a role the app does not know."""
+    normalized = (role or "").strip().lower() or "user"
+    if normalized not in ROLES:
+        raise ValueError(f"บทบาทไม่ถูกต้อง (ใช้ได้: {', '.join(ROLES)})")
+    return normalized
 
 
 def create_user(name: str, email: str, role: str, password: str) -> User:
@@ -119,26 +156,144 @@ def create_user(name: str, email: str, role: str, password: str) -> User:
         raise ValueError("กรุณาระบุชื่อ")
     if not password:
         raise ValueError("กรุณาระบุรหัสผ่าน")
+    role = _checked_role(role)
 
-    password_hash = _hash_password(password)
+    password_hash = hash_password(password)
     with closing(get_connection()) as conn:
         try:
             user_id = execute_insert(
                 conn,
                 "INSERT INTO users (name, email, role, password_hash) VALUES (?, ?, ?, ?)",
-                (name.strip(), email_normalized, role.strip() or "user", password_hash),
+                (name.strip(), email_normalized, role, password_hash),
             )
         except integrity_error() as exc:
             raise ValueError("อีเมลนี้ถูกใช้งานแล้ว") from exc
+    invalidate_user_cache()
 
     return User(
         id=user_id,
         name=name.strip(),
         email=email_normalized,
-        role=role.strip() or "user",
+        role=role,
     )
 
 
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+$")
+_IMPORT_FIELDS = ("name", "email", "role", "password")
+MAX_IMPORT_ROWS = int(os.environ.get("USER_IMPORT_MAX_ROWS", "2000"))
+
+
+@dataclass
+class ImportRowResult:
+    row: int  # 1-based, as in the uploaded file (CSV header not counted)
+    email: str
+    status: str  # created | duplicate | invalid | valid (file rejected because of other invalid rows)
+    error: Optional[str] = None
+    id: Optional[int] = None
+
+
+def parse_user_import(data: str, fmt: str) -> List[Dict[str, Any]]:
+    """CSV (header: name,email,role,password) or JSON ([{...}] or {"users": [...]}) → list of row dicts."""
+    if fmt == "json":
+        payload = json.loads(data) if isinstance(data, str) else data
+        rows = payload.get("users") if isinstance(payload, dict) else payload
+        if not isinstance(rows, list):
+            raise ValueError("JSON ต้องเป็นรายการผู้ใช้ หรือ {\"users\": [...]}")
+        return [row if isinstance(row, dict) else {} for row in rows]
+    if fmt == "csv":
+        reader = csv.DictReader(io.StringIO(data.lstrip("\ufeff")))
+        missing = [f for f in ("name", "email", "password") if f not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"CSV ไม่มีคอลัมน์: {', '.join(missing)}")
+        return [dict(row) for row in reader]
+    raise ValueError("รองรับเฉพาะไฟล์ CSV หรือ JSON")
+
+
+def import_users(rows: List[Dict[str, Any]]) -> List[ImportRowResult]:
+    """Bulk create: validate every row first (any invalid row → nothing is written), skip e-mails that
+    already exist or repeat within the file, hash the rest in parallel and insert them in one transaction."""
+    if not rows:
+        raise ValueError("ไม่พบข้อมูลผู้ใช้")
+    if len(rows) > MAX_IMPORT_ROWS:
+        raise ValueError(f"นำเข้าได้ครั้งละไม่เกิน {MAX_IMPORT_ROWS} รายการ")
+
+    results: List[ImportRowResult] = []
+    valid: List[tuple] = []
+    for index, raw in enumerate(rows, start=1):
+        values = {f: str(raw.get(f) or "").strip() for f in _IMPORT_FIELDS}
+        email = values["email"].lower()
+        error = None
+        if not values["name"]:
+            error = "กรุณาระบุชื่อ"
+        elif not _EMAIL_RE.match(email):
+            error = "อีเมลไม่ถูกต้อง"
+        elif not values["password"]:
+            error = "กรุณาระบุรหัสผ่าน"
+        else:
+            try:
+                values["role"] = _checked_role(values["role"])
+            except ValueError as err:
+                error = str(err)
+        results.append(ImportRowResult(row=index, email=email, status="invalid" if error else "valid", error=error))
+        if not error:
+            valid.append((results[-1], values["name"], email, values["role"], values["password"]))
+    if any(r.status == "invalid" for r in results):
+        return results  # all-or-nothing: fix the file and upload again
+
+    existing = set()
+    emails = [item[2] for item in valid]
+    with closing(get_connection()) as conn:
+        for start in range(0, len(emails), 500):
+            chunk = emails[start:start + 500]
+            placeholders = ", ".join("?" for _ in chunk)
+            found = execute_fetchall(conn, f"SELECT email FROM users WHERE email IN ({placeholders})", tuple(chunk))
+            existing.update(row["email"] for row in found)
+
+    to_insert = []
+    seen = set()
+    for result, name, email, role, password in valid:
+        if email in existing:
+            result.status, result.error = "duplicate", "อีเมลนี้ถูกใช้งานแล้ว"
+        elif email in seen:
+            result.status, result.error = "duplicate", "อีเมลซ้ำในไฟล์"
+        else:
+            seen.add(email)
+            to_insert.append((result, name, email, role, password))
+
+    # Hash with no connection open: the transaction below covers only the INSERT and the id lookup
+    hashes = hash_passwords([item[4] for item in to_insert])
+    with closing(get_connection()) as conn:
+        try:
+            # ON CONFLICT: an e-mail registered by someone else since the check above is skipped, not fatal
+            execute_many(
+                conn,
+                "INSERT INTO users (name, email, role, password_hash) VALUES (?, ?, ?, ?) ON CONFLICT (email) DO NOTHING",
+                [(name, email, role, h) for (_, name, email, role, _), h in zip(to_insert, hashes)],
+            )
+            ids = {}
+            inserted = [item[2] for item in to_insert]
+            for start in range(0, len(inserted), 500):
+                chunk = inserted[start:start + 500]
+                placeholders = ", ".join("?" for _ in chunk)
+                found = execute_fetchall(
+                    conn, f"SELECT id, email, password_hash FROM users WHERE email IN ({placeholders})", tuple(chunk)
+                )
+                ids.update({row["email"]: (row["id"], row["password_hash"]) for row in found})
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    for (result, _, email, _, _), h in zip(to_insert, hashes):
+        user_id, stored_hash = ids.get(email, (None, None))
+        if stored_hash == h:
+            result.status, result.id = "created", user_id
+        else:
+            result.status, result.error = "duplicate", "อีเมลนี้ถูกใช้งานแล้ว"
+    if to_insert:
+        invalidate_user_cache()
+    return results
+
+
 def authenticate_user(email: str, password: str) -> User:
     if not email.strip() or not password:
         raise ValueError("กรุณาระบุอีเมลและรหัสผ่าน")
@@ -147,11 +302,27 @@ def authenticate_user(email: str, password: str) -> User:
         row = execute_fetchone(conn, "SELECT * FROM users WHERE email = ?", (email_normalized,))
     if row is None:
         raise ValueError("ไม่พบบัญชีผู้ใช้")
-    if not _verify_password(row["password_hash"], password):
+    if not verify_password(row["password_hash"], password):
         raise ValueError("อีเมลหรือรหัสผ่านไม่ถูกต้อง")
+    if needs_rehash(row["password_hash"]):
+        _upgrade_password_hash(row["id"], row["password_hash"], password)
     return _row_to_user(row)
 
 
+def _upgrade_password_hash(user_id: int, old_hash: str, password: str) -> None:
+    """Re-hash with the current scheme/cost after a successful login (only if nobody changed it meanwhile)."""
+    try:
+        new_hash = hash_password(password)
+        with closing(get_connection()) as conn:
+            execute_commit(
+                conn,
+                "UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?",
+                (new_hash, user_id, old_hash),
+            )
+    except Exception as e:
+        print(f"[WARN] password rehash for user {user_id} failed: {e}")  # login still succeeds; retried next time
+
+
 def update_user(user_id: int, name: str, email: str, role: str, password: Optional[str] = None) -> User:
     if not name.strip():
         raise ValueError("กรุณาระบุชื่อ")
@@ -160,29 +331,34 @@ def update_user(user_id: int, name: str, email: str, role: str, password: Option
         raise ValueError("กรุณาระบุอีเมล")
     if not role.strip():
         raise ValueError("กรุณาระบุบทบาท")
+    role = _checked_role(role)
 
     with closing(get_connection()) as conn:
-        row = execute_fetchone(conn, "SELECT id FROM users WHERE id = ?", (user_id,))
+        row = execute_fetchone(conn, "SELECT id, role FROM users WHERE id = ?", (user_id,))
         if row is None:
             raise ValueError("ไม่พบบัญชีผู้ใช้")
+        role_changed = row["role"] != role
         conflict = execute_fetchone(conn, "SELECT id FROM users WHERE email = ? AND id != ?", (email_normalized, user_id))
         if conflict:
             raise ValueError("อีเมลนี้ถูกใช้งานแล้ว")
 
         if password:
-            password_hash = _hash_password(password)
+            password_hash = hash_password(password)
             execute_commit(
                 conn,
                 "UPDATE users SET name = ?, email = ?, role = ?, password_hash = ? WHERE id = ?",
-                (name.strip(), email_normalized, role.strip(), password_hash, user_id),
+                (name.strip(), email_normalized, role, password_hash, user_id),
             )
         else:
             execute_commit(
                 conn,
                 "UPDATE users SET name = ?, email = ?, role = ? WHERE id = ?",
-                (name.strip(), email_normalized, role.strip(), user_id),
+                (name.strip(), email_normalized, role, user_id),
             )
         row = execute_fetchone(conn, "SELECT id, name, email, role FROM users WHERE id = ?", (user_id,))
+    invalidate_user_cache()
+    if password or role_changed:
+        revoke_user_sessions(user_id)  # tokens carry the role; a new password must also end old sessions
 
     return _row_to_user(row)
 
@@ -193,3 +369,5 @@ def delete_user(user_id: int) -> None:
         if existing is None:
             raise ValueError("ไม่พบบัญชีผู้ใช้")
         execute_commit(conn, "DELETE FROM users WHERE id = ?", (user_id,))
+    invalidate_user_cache()
+    revoke_user_sessions(user_id)
@@ -0,0 +1,136 @@
+"""Standalone analysis worker: pulls jobs from the analysis_jobs queue table (ANALYZE_JOB_BACKEND=db).
+
+    python worker.py                      # one worker process, polls until stopped
+    python worker.py --processes 4        # four worker processes sharing the same database
+    python worker.py --exit-when-idle     # drain the queue and exit (batch runs, local testing)
+
+Works on PostgreSQL (DATABASE_URL) and on the local SQLite file; any number of workers, on one host or many,
+can point at the same database. A worker that dies mid-job loses its lease after JOB_LEASE_SECONDS and the
+job is picked up again by another worker (up to JOB_MAX_ATTEMPTS, then dead-lettered); so is a job whose
+result could not be written (database error), while the worker itself keeps going.
+SIGTERM / Ctrl+C: finish the current job, then exit.
+"""
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+
+from ipo_readiness.services import job_queue_service as job_queue
+from ipo_readiness.services.analysis_job_service import ANALYZE_JOB_TTL, process_queued_job
+
+_PURGE_EVERY = 300.0  # seconds between clean-ups of finished jobs older than ANALYZE_JOB_TTL
+
+
+class _Heartbeat:
+    """Background thread extending the current job's lease every third of the lease period."""
+
+    def __init__(self, job_id: str, worker_id: str) -> None:
+        self._job_id = job_id
+        self._worker_id = worker_id
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{job_id[:8]}", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(job_queue.JOB_LEASE_SECONDS / 3):
+            try:
+                if not job_queue.heartbeat(self._job_id, self._worker_id):
+                    return  # lease lost; the job's next write will notice and abandon it
+            except Exception as exc:
+                print(f"[WARN] heartbeat {self._job_id}: {exc}")
+
+
+def run_worker(poll_seconds: float = 1.0, exit_when_idle: bool = False, max_jobs: int = 0) -> int:
+    """Claim and process jobs until stopped (or idle / max_jobs reached). Returns the number of jobs run."""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+    job_queue.init_job_queue_store()
+    print(f"[worker {worker_id}] started")
+    processed, last_purge = 0, 0.0
+    while not stopping.is_set():
+        try:
+            claimed = job_queue.claim_job(worker_id)
+        except Exception as exc:
+            # e.g. database restarting / locked: back off and keep the worker alive
+            print(f"[WARN] worker {worker_id} claim failed: {exc}")
+            stopping.wait(poll_seconds * 5)
+            continue
+        if claimed is None:
+            if exit_when_idle:
+                break
+            if time.time() - last_purge > _PURGE_EVERY:
+                last_purge = time.time()
+                try:
+                    job_queue.purge_finished_jobs(ANALYZE_JOB_TTL)
+                except Exception as exc:
+                    print(f"[WARN] worker {worker_id} purge failed: {exc}")  # retried after _PURGE_EVERY
+            stopping.wait(poll_seconds)
+            continue
+        started = time.time()
+        try:
+            with _Heartbeat(claimed.id, worker_id):
+                status = process_queued_job(claimed, worker_id)
+        except Exception as exc:
+            # Recording the outcome failed (database locked / connection dropped): the heartbeat has stopped,
+            # so the lease expires and the job is claimed again (attempt counted); keep this worker running
+            print(f"[WARN] worker {worker_id} job {claimed.id}: {type(exc).__name__}: {exc}")
+            stopping.wait(poll_seconds * 5)
+            continue
+        processed += 1
+        print(
+            f"[worker {worker_id}] job {claimed.id} attempt {claimed.attempts}/{claimed.max_attempts}: "
+            f"{status or 'lease lost'} in {time.time() - started:.2f}s"
+        )
+        if max_jobs and processed >= max_jobs:
+            break
+    print(f"[worker {worker_id}] stopped after {processed} job(s)")
+    return processed
+
+
+def _worker_process(poll_seconds: float, exit_when_idle: bool, max_jobs: int) -> None:
+    run_worker(poll_seconds, exit_when_idle, max_jobs)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="IPO readiness analysis worker (ANALYZE_JOB_BACKEND=db)")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes to run (default 1)")
+    parser.add_argument("--poll", type=float, default=1.0, help="seconds between polls when the queue is empty")
+    parser.add_argument("--exit-when-idle", action="store_true", help="exit once the queue is empty")
+    parser.add_argument("--max-jobs", type=int, default=0, help="exit after this many jobs per process (0 = no limit)")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        run_worker(args.poll, args.exit_when_idle, args.max_jobs)
+        return
+    ctx = multiprocessing.get_context("spawn")
+    children = [
+        ctx.Process(target=_worker_process, args=(args.poll, args.exit_when_idle, args.max_jobs), name=f"worker-{i}")
+        for i in range(args.processes)
+    ]
+    for child in children:
+        child.start()
+    # Forward SIGTERM so each child finishes its current job; Ctrl+C already reaches the whole process group
+    signal.signal(signal.SIGTERM, lambda *_: [child.terminate() for child in children if child.is_alive()])
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for child in children:
+        child.join()
+
+
+if __name__ == "__main__":
+    main()
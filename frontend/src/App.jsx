@@ -7,9 +7,9 @@ import AssessmentReport from "./components/AssessmentReport";
 import ProgressReport from "./components/ProgressReport";
 import AuditLogs from "./components/AuditLogs";
 import DocumentChecklist from "./components/DocumentChecklist";
+import { apiFetch, SESSION_EXPIRED_EVENT, USER_STORAGE_KEY } from "./api";
 
 function App() {
-  const USER_STORAGE_KEY = "ipo-readiness-user";
   const API_BASE = import.meta.env.VITE_API_BASE || "http://localhost:5001";
   const [email, setEmail] = useState("");
   const [password, setPassword] = useState("");
@@ -53,7 +53,7 @@ function App() {
   const logAction = async (action, details = "") => {
     if (!currentUser) return;
     try {
-      await fetch(`${API_BASE}/api/admin/audit-logs`, {
+      await apiFetch(`${API_BASE}/api/admin/audit-logs`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
@@ -75,7 +75,7 @@ function App() {
     setStatus("");
     const slowTimer = setTimeout(() => setLoginSlowHint(true), 5000);
     try {
-      const response = await fetch(`${API_BASE}/api/auth/login`, {
+      const response = await apiFetch(`${API_BASE}/api/auth/login`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ email, password }),
@@ -88,13 +88,13 @@ function App() {
       // บันทึกทุกครั้งที่ล็อกอิน เพื่อให้รีเฟรชแล้วไม่ต้องล็อกอินใหม่
       window.localStorage.setItem(
         USER_STORAGE_KEY,
-        JSON.stringify({ user: data.user, remember })
+        JSON.stringify({ user: data.user, token: data.token, remember })
       );
       setView("home");
       setStatus(`ยินดีต้อนรับ ${data.user.name}`);
 
       // Log login event
-      await fetch(`${API_BASE}/api/admin/audit-logs`, {
+      await apiFetch(`${API_BASE}/api/admin/audit-logs`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
@@ -115,7 +115,7 @@ function App() {
 
   const fetchUsers = async () => {
     try {
-      const response = await fetch(`${API_BASE}/api/admin/users`);
+      const response = await apiFetch(`${API_BASE}/api/admin/users`);
       if (!response.ok) throw new Error("ไม่สามารถดึงรายชื่อผู้ใช้ได้");
       const data = await response.json();
       setUsers(data.users || []);
@@ -145,7 +145,7 @@ function App() {
         ? `${API_BASE}/api/admin/users/${editingUserId}`
         : `${API_BASE}/api/admin/users`;
       const method = editingUserId ? "PUT" : "POST";
-      const response = await fetch(url, {
+      const response = await apiFetch(url, {
         method,
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify(payload),
@@ -195,7 +195,7 @@ function App() {
   const handleDeleteUser = async (userId) => {
     if (!window.confirm("ยืนยันการลบผู้ใช้?")) return;
     try {
-      const response = await fetch(`${API_BASE}/api/admin/users/${userId}`, {
+      const response = await apiFetch(`${API_BASE}/api/admin/users/${userId}`, {
         method: "DELETE",
       });
       if (!response.ok) throw new Error("ลบผู้ใช้ไม่สำเร็จ");
@@ -231,6 +231,15 @@ function App() {
     setView("login");
   };
 
+  useEffect(() => {
+    const handleSessionExpired = () => {
+      handleLogout();
+      setStatus("เซสชันหมดอายุ กรุณาเข้าสู่ระบบอีกครั้ง");
+    };
+    window.addEventListener(SESSION_EXPIRED_EVENT, handleSessionExpired);
+    return () => window.removeEventListener(SESSION_EXPIRED_EVENT, handleSessionExpired);
+  }, []);
+
   const goHome = () => setView("home");
 
   if (safeView === "login") {
@@ -373,7 +382,7 @@ function App() {
                 setLoading(true);
                 setStatus("");
                 try {
-                  const response = await fetch(`${API_BASE}/api/auth/forgot-password`, {
+                  const response = await apiFetch(`${API_BASE}/api/auth/forgot-password`, {
                     method: "POST",
                     headers: { "Content-Type": "application/json" },
                     body: JSON.stringify({ email }),
@@ -485,7 +494,7 @@ function App() {
                 setLoading(true);
                 setStatus("");
                 try {
-                  const response = await fetch(`${API_BASE}/api/auth/reset-password`, {
+                  const response = await apiFetch(`${API_BASE}/api/auth/reset-password`, {
                     method: "POST",
                     headers: { "Content-Type": "application/json" },
                     body: JSON.stringify({ password }),
@@ -684,7 +693,7 @@ function App() {
 
               // บันทึกผลประเมินและสร้างโปรเจกต์ใน Client Portfolio (ข้อมูลจริง)
               try {
-                await fetch(`${API_BASE}/api/assessments/save`, {
+                await apiFetch(`${API_BASE}/api/assessments/save`, {
                   method: "POST",
                   headers: { "Content-Type": "application/json" },
                   body: JSON.stringify({
@@ -0,0 +1,26 @@
+// Shared fetch for the backend API: sends the signed-in user's session token as Authorization: Bearer,
+// so the server takes the identity from the token instead of user_id / role in the request.
+export const USER_STORAGE_KEY = "ipo-readiness-user";
+export const SESSION_EXPIRED_EVENT = "ipo-readiness-session-expired";
+
+export function storedToken() {
+  try {
+    return JSON.parse(window.localStorage.getItem(USER_STORAGE_KEY) || "null")?.token || null;
+  } catch {
+    return null;
+  }
+}
+
+export async function apiFetch(url, options = {}) {
+  const token = storedToken();
+  const headers = new Headers(options.headers || {});
+  if (token && !headers.has("Authorization")) {
+    headers.set("Authorization", `Bearer ${token}`);
+  }
+  const response = await fetch(url, { ...options, headers });
+  if (response.status === 401 && token) {
+    // Token expired or revoked (password / role changed): App signs the user out
+    window.dispatchEvent(new Event(SESSION_EXPIRED_EVENT));
+  }
+  return response;
+}
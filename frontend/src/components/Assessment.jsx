@@ -1,6 +1,9 @@
-import { useRef, useState } from "react";
+import { useEffect, useRef, useState } from "react";
+import { apiFetch } from "../api";
 
 const initialState = [];
+const JOB_STORAGE_KEY = "ipo_analysis_job";
+const POLL_INTERVAL_MS = 1500;
 
 function AssessmentUpload({ apiBase, onBack, onComplete }) {
   const [files, setFiles] = useState(initialState);
@@ -8,8 +11,76 @@ function AssessmentUpload({ apiBase, onBack, onComplete }) {
   const [loading, setLoading] = useState(false);
   const [previewData, setPreviewData] = useState(null);
   const [checkingFiles, setCheckingFiles] = useState(false);
+  const [progress, setProgress] = useState(null);
   const formRef = useRef(null);
 
+  // ติดตามงานวิเคราะห์ผ่าน SSE (fallback เป็น polling) จนเสร็จ: resolve ด้วย result หรือ reject เมื่อล้มเหลว/หมดอายุ
+  const followJob = (jobId) =>
+    new Promise((resolve, reject) => {
+      const handleJob = (job) => {
+        setProgress(job);
+        if (job.status === "done") resolve(job.result);
+        if (job.status === "failed") reject(new Error(job.error || "เกิดข้อผิดพลาดในการประเมิน"));
+        return job.status === "done" || job.status === "failed";
+      };
+
+      const poll = async () => {
+        try {
+          const response = await apiFetch(`${apiBase}/api/analyze/jobs/${jobId}`);
+          const data = await response.json();
+          if (!response.ok) throw new Error(data.error || "ไม่พบงานวิเคราะห์");
+          if (!handleJob(data.job)) setTimeout(poll, POLL_INTERVAL_MS);
+        } catch (error) {
+          reject(error);
+        }
+      };
+
+      if (!window.EventSource) {
+        poll();
+        return;
+      }
+      const source = new EventSource(`${apiBase}/api/analyze/jobs/${jobId}/events`);
+      source.addEventListener("progress", (event) => handleJob(JSON.parse(event.data)));
+      source.addEventListener("result", (event) => {
+        source.close();
+        handleJob(JSON.parse(event.data));
+      });
+      source.onerror = () => {
+        // เบราว์เซอร์จะเชื่อมต่อ SSE ใหม่เอง ถ้าปิดถาวร (เช่น 404 หรือ proxy ไม่รองรับ) ให้ใช้ polling แทน
+        if (source.readyState === EventSource.CLOSED) poll();
+      };
+    });
+
+  const runJob = async (jobId) => {
+    window.sessionStorage.setItem(JOB_STORAGE_KEY, jobId);
+    try {
+      const result = await followJob(jobId);
+      setStatus("รอแป๊บนะครับ กำลังจัดทำรายงาน...");
+      setTimeout(() => {
+        setLoading(false);
+        setProgress(null);
+        onComplete?.(result);
+        resetForm();
+      }, 3000);
+    } catch (error) {
+      setStatus(error.message);
+      setLoading(false);
+      setProgress(null);
+    } finally {
+      window.sessionStorage.removeItem(JOB_STORAGE_KEY);
+    }
+  };
+
+  // กลับมาที่หน้านี้ (รีเฟรช/เน็ตหลุด) ระหว่างประมวลผล: ติดตามงานเดิมต่อ
+  useEffect(() => {
+    const pendingJobId = window.sessionStorage.getItem(JOB_STORAGE_KEY);
+    if (pendingJobId) {
+      setLoading(true);
+      setStatus("กำลังติดตามงานประเมินที่ค้างอยู่...");
+      runJob(pendingJobId);
+    }
+  }, []);
+
   const handleFileChange = async (event) => {
     const { files: selected } = event.target;
     const fileList = Array.from(selected);
@@ -23,7 +94,7 @@ function AssessmentUpload({ apiBase, onBack, onComplete }) {
       try {
         const formData = new FormData();
         fileList.forEach((file) => formData.append("workbooks", file));
-        const response = await fetch(`${apiBase}/api/analyze/preview`, {
+        const response = await apiFetch(`${apiBase}/api/analyze/preview`, {
           method: "POST",
           body: formData,
         });
@@ -64,22 +135,25 @@ function AssessmentUpload({ apiBase, onBack, onComplete }) {
     setLoading(true);
     setStatus("กำลังประมวลผล...");
     try {
-      const formData = new FormData();
-      files.forEach((file) => formData.append("workbooks", file));
-      const response = await fetch(`${apiBase}/api/analyze`, {
-        method: "POST",
-        body: formData,
-      });
+      const upload = () => {
+        const formData = new FormData();
+        files.forEach((file) => formData.append("workbooks", file));
+        return apiFetch(`${apiBase}/api/analyze/jobs`, { method: "POST", body: formData });
+      };
+      // ไฟล์ผ่านการตรวจสอบ (preview) แล้ว: ส่ง token แทนการอัปโหลดซ้ำ ถ้าหมดอายุ (410) ค่อยอัปโหลดใหม่
+      let response = previewData?.handoff_token
+        ? await apiFetch(`${apiBase}/api/analyze/jobs`, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ handoff_token: previewData.handoff_token }),
+          })
+        : await upload();
+      if (response.status === 410) response = await upload();
       const data = await response.json();
       if (!response.ok) {
         throw new Error(data.error || "เกิดข้อผิดพลาดในการประเมิน");
       }
-      setStatus("รอแป๊บนะครับ กำลังจัดทำรายงาน...");
-      setTimeout(() => {
-        setLoading(false);
-        onComplete?.(data);
-        resetForm();
-      }, 3000);
+      await runJob(data.job.id);
     } catch (error) {
       setStatus(error.message);
       setLoading(false);
@@ -100,7 +174,8 @@ function AssessmentUpload({ apiBase, onBack, onComplete }) {
               🚗
             </span>
           </div>
-          <p>รอแป๊บนะครับ ระบบกำลังประเมินข้อมูลให้...</p>
+          <p>{progress?.message || "รอแป๊บนะครับ ระบบกำลังประเมินข้อมูลให้..."}</p>
+          {progress && <progress max="100" value={progress.progress} />}
         </div>
       )}
       <header className="assessment-header">
@@ -1,4 +1,7 @@
-import { useState, useEffect, useMemo } from "react";
+import { useState, useEffect, useMemo, useRef } from "react";
+import { apiFetch } from "../api";
+
+const SEARCH_DEBOUNCE_MS = 300;
 
 export default function AuditLogs({ onBack }) {
     const [logs, setLogs] = useState([]);
@@ -7,55 +10,64 @@ export default function AuditLogs({ onBack }) {
     const [searchTerm, setSearchTerm] = useState("");
     const [actionFilter, setActionFilter] = useState("all");
     const [userFilter, setUserFilter] = useState("all");
+    const [nextCursor, setNextCursor] = useState(null);
+    const [total, setTotal] = useState(null);
+    const [facets, setFacets] = useState({ action: [], user: [] });
+    const latestRequest = useRef(0);
     const API_BASE = import.meta.env.VITE_API_BASE || "http://localhost:5001";
 
+    // ตัวกรองส่งไปที่ server (ค้นหาทั้งฐานข้อมูล ไม่ใช่เฉพาะหน้าที่โหลดแล้ว) จำนวนรวมมาจาก server
     useEffect(() => {
-        fetchLogs();
-    }, []);
+        const timer = setTimeout(() => fetchLogs(), searchTerm ? SEARCH_DEBOUNCE_MS : 0);
+        return () => clearTimeout(timer);
+    }, [searchTerm, actionFilter, userFilter]);
 
-    const fetchLogs = async () => {
+    const fetchLogs = async (cursor = null) => {
+        const requestId = ++latestRequest.current;
+        setLoading(!cursor);
         try {
-            const response = await fetch(`${API_BASE}/api/admin/audit-logs`);
+            const params = new URLSearchParams();
+            if (searchTerm) params.set("q", searchTerm);
+            if (actionFilter !== "all") params.set("action", actionFilter);
+            if (userFilter !== "all") params.set("user_name", userFilter);
+            if (cursor) params.set("cursor", cursor);
+            const response = await apiFetch(`${API_BASE}/api/admin/audit-logs/search?${params}`);
             const data = await response.json();
             if (!response.ok) throw new Error(data.error || "Failed to fetch logs");
-            setLogs(data.logs || []);
+            if (requestId !== latestRequest.current) return; // ตัวกรองเปลี่ยนระหว่างรอ: ทิ้งผลเก่า
+            setError("");
+            setLogs(prev => (cursor ? [...prev, ...(data.logs || [])] : data.logs || []));
+            setNextCursor(data.next_cursor || null);
+            if (!cursor) {
+                setTotal(data.total ?? null);
+                setFacets(data.facets || { action: [], user: [] });
+            }
         } catch (err) {
-            setError(err.message);
+            if (requestId === latestRequest.current) setError(err.message);
         } finally {
-            setLoading(false);
+            if (requestId === latestRequest.current) setLoading(false);
         }
     };
 
+    // ตัวเลือกจาก facet ของ server + ค่าที่เลือกอยู่ (facet ถูกกรองแล้วจึงอาจไม่มีค่านั้น)
     const uniqueActions = useMemo(() => {
-        const actions = new Set(logs.map(log => log.action));
+        const actions = new Set(facets.action.map(f => f.value));
+        if (actionFilter !== "all") actions.add(actionFilter);
         return Array.from(actions).sort();
-    }, [logs]);
+    }, [facets, actionFilter]);
 
     const uniqueUsers = useMemo(() => {
-        const users = new Set(logs.map(log => log.user_name));
+        const users = new Set(facets.user.map(f => f.value));
+        if (userFilter !== "all") users.add(userFilter);
         return Array.from(users).sort();
-    }, [logs]);
-
-    const filteredLogs = useMemo(() => {
-        return logs.filter(log => {
-            const matchesSearch = searchTerm === "" ||
-                log.user_name.toLowerCase().includes(searchTerm.toLowerCase()) ||
-                log.action.toLowerCase().includes(searchTerm.toLowerCase()) ||
-                (log.details && log.details.toLowerCase().includes(searchTerm.toLowerCase()));
-
-            const matchesAction = actionFilter === "all" || log.action === actionFilter;
-            const matchesUser = userFilter === "all" || log.user_name === userFilter;
-
-            return matchesSearch && matchesAction && matchesUser;
-        });
-    }, [logs, searchTerm, actionFilter, userFilter]);
+    }, [facets, userFilter]);
 
     const handleExport = () => {
-        if (!filteredLogs.length) return;
+        if (!logs.length) return;
         const headers = ["ID", "Timestamp", "User", "Action", "Details"];
         const csvContent = [
             headers.join(","),
-            ...filteredLogs.map((log) =>
+            ...logs.map((log) =>
                 [
                     log.id,
                     `"${log.created_at}"`,
@@ -100,9 +112,9 @@ export default function AuditLogs({ onBack }) {
                     type="button"
                     onClick={handleExport}
                     className="primary-btn"
-                    disabled={!filteredLogs.length}
+                    disabled={!logs.length}
                 >
-                    📥 Export CSV
+                    📥 Export CSV ({logs.length} รายการที่แสดง)
                 </button>
             </div>
 
@@ -142,7 +154,7 @@ export default function AuditLogs({ onBack }) {
                     </button>
                 )}
                 <span className="filter-count">
-                    แสดง {filteredLogs.length} จาก {logs.length} รายการ
+                    แสดง {logs.length} จาก {total ?? logs.length} รายการ
                 </span>
             </div>
 
@@ -160,7 +172,7 @@ export default function AuditLogs({ onBack }) {
                             </tr>
                         </thead>
                         <tbody>
-                            {filteredLogs.map((log) => (
+                            {logs.map((log) => (
                                 <tr key={log.id}>
                                     <td className="timestamp">
                                         {new Date(log.created_at).toLocaleString("th-TH", {
@@ -180,16 +192,21 @@ export default function AuditLogs({ onBack }) {
                                     <td className="details-cell">{log.details || "-"}</td>
                                 </tr>
                             ))}
-                            {filteredLogs.length === 0 && (
+                            {logs.length === 0 && (
                                 <tr>
                                     <td colSpan="4" className="empty-cell">
-                                        {logs.length === 0 ? "ไม่พบข้อมูลบันทึก" : "ไม่พบผลลัพธ์ที่ตรงกับตัวกรอง"}
+                                        {searchTerm || actionFilter !== "all" || userFilter !== "all" ? "ไม่พบผลลัพธ์ที่ตรงกับตัวกรอง" : "ไม่พบข้อมูลบันทึก"}
                                     </td>
                                 </tr>
                             )}
                         </tbody>
                     </table>
                 )}
+                {!loading && nextCursor && (
+                    <button type="button" className="ghost-btn small" onClick={() => fetchLogs(nextCursor)}>
+                        โหลดเพิ่ม
+                    </button>
+                )}
             </div>
         </section>
     );
@@ -1,14 +1,19 @@
 import React, { useState, useEffect } from "react";
 import "./ProgressReport.css";
+import { apiFetch } from "../api";
 
 const ProgressReport = ({ onBack, apiBase = "http://localhost:5001", currentUser = null }) => {
     const [filter, setFilter] = useState("All");
     const [assessments, setAssessments] = useState([]);
     const [teamMembers, setTeamMembers] = useState([]);
+    const [summary, setSummary] = useState(null);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState(null);
     /** Admin เลือกคนใน Team Pulse เพื่อดู Client Portfolio ของคนนั้น (ความเป็นส่วนตัว) */
     const [selectedUserId, setSelectedUserId] = useState(null);
+    /** Keyset pagination: cursor ของหน้าถัดไปจาก /api/dashboard/assessments (null = หมดแล้ว) */
+    const [nextCursor, setNextCursor] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
 
     // Modal State
     const [showModal, setShowModal] = useState(false);
@@ -23,29 +28,31 @@ const ProgressReport = ({ onBack, apiBase = "http://localhost:5001", currentUser
 
     const isAdmin = currentUser?.role === "admin";
 
+    const buildAssessmentParams = () => {
+        const params = new URLSearchParams();
+        if (currentUser?.id) params.set("user_id", currentUser.id);
+        if (currentUser?.role) params.set("role", currentUser.role);
+        if (isAdmin && selectedUserId != null) params.set("view_user_id", selectedUserId);
+        return params;
+    };
+
     useEffect(() => {
         const fetchData = async () => {
             try {
                 setLoading(true);
-                const params = new URLSearchParams();
-                if (currentUser?.id) params.set("user_id", currentUser.id);
-                if (currentUser?.role) params.set("role", currentUser.role);
-                if (isAdmin && selectedUserId != null) params.set("view_user_id", selectedUserId);
+                const params = buildAssessmentParams();
 
-                const [assessmentsRes, teamRes] = await Promise.all([
-                    fetch(`${apiBase}/api/dashboard/assessments?${params.toString()}`),
-                    fetch(`${apiBase}/api/dashboard/team`)
-                ]);
-
-                if (!assessmentsRes.ok || !teamRes.ok) {
+                // หนึ่ง round trip: portfolio หน้าแรก + KPI + Team Pulse
+                const res = await apiFetch(`${apiBase}/api/dashboard/bootstrap?${params.toString()}`);
+                if (!res.ok) {
                     throw new Error("Failed to fetch dashboard data");
                 }
 
-                const assessmentsData = await assessmentsRes.json();
-                const teamData = await teamRes.json();
-
+                const assessmentsData = await res.json();
+                setSummary(assessmentsData.summary || null);
                 setAssessments(assessmentsData.assessments || []);
-                setTeamMembers(teamData.members || []);
+                setNextCursor(assessmentsData.next_cursor || null);
+                setTeamMembers(assessmentsData.members || []);
             } catch (err) {
                 console.error("Dashboard error:", err);
                 setError(err.message);
@@ -57,6 +64,24 @@ const ProgressReport = ({ onBack, apiBase = "http://localhost:5001", currentUser
         fetchData();
     }, [apiBase, currentUser?.id, currentUser?.role, isAdmin, selectedUserId]);
 
+    const loadMore = async () => {
+        if (!nextCursor) return;
+        try {
+            setLoadingMore(true);
+            const params = buildAssessmentParams();
+            params.set("cursor", nextCursor);
+            const res = await apiFetch(`${apiBase}/api/dashboard/assessments?${params.toString()}`);
+            if (!res.ok) throw new Error("Failed to fetch dashboard data");
+            const data = await res.json();
+            setAssessments(prev => [...prev, ...(data.assessments || [])]);
+            setNextCursor(data.next_cursor || null);
+        } catch (err) {
+            alert(err.message);
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     if (loading) {
         return (
             <div className="progress-report-container cockpit-theme loading-view">
@@ -75,11 +100,14 @@ const ProgressReport = ({ onBack, apiBase = "http://localhost:5001", currentUser
         );
     }
 
-    const totalProjects = assessments.length;
-    const highRiskProjects = assessments.filter(a => a.risk === "High").length;
-    const avgReadiness = totalProjects > 0
-        ? Math.round(assessments.reduce((acc, a) => acc + (a.readiness_score ?? a.readiness ?? 0), 0) / totalProjects)
-        : 0;
+    // KPI จาก /api/dashboard/summary (ทั้งพอร์ต) — ตารางด้านล่างโหลดทีละหน้า
+    const totalProjects = summary?.total ?? assessments.length;
+    const highRiskProjects = summary?.by_risk?.High ?? assessments.filter(a => a.risk === "High").length;
+    const avgReadiness = summary
+        ? summary.avg_readiness
+        : totalProjects > 0
+            ? Math.round(assessments.reduce((acc, a) => acc + (a.readiness_score ?? a.readiness ?? 0), 0) / totalProjects)
+            : 0;
     const avgTeamLoad = teamMembers.length > 0
         ? Math.round(teamMembers.reduce((m, t) => m + t.load, 0) / teamMembers.length)
         : 0;
@@ -97,7 +125,7 @@ const ProgressReport = ({ onBack, apiBase = "http://localhost:5001", currentUser
     const handleCreateProject = async (e) => {
         e.preventDefault();
         try {
-            const res = await fetch(`${apiBase}/api/dashboard/assessments`, {
+            const res = await apiFetch(`${apiBase}/api/dashboard/assessments`, {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
                 body: JSON.stringify({
@@ -114,6 +142,12 @@ const ProgressReport = ({ onBack, apiBase = "http://localhost:5001", currentUser
 
             const data = await res.json();
             setAssessments(prev => [data.assessment, ...prev]);
+            setSummary(prev => prev && {
+                ...prev,
+                total: prev.total + 1,
+                avg_readiness: Math.round((prev.avg_readiness * prev.total + Number(data.assessment.readiness_score || 0)) / (prev.total + 1)),
+                by_risk: { ...prev.by_risk, [data.assessment.risk]: (prev.by_risk?.[data.assessment.risk] || 0) + 1 },
+            });
             setShowModal(false);
             setNewProject({
                 client: "",
@@ -280,6 +314,11 @@ const ProgressReport = ({ onBack, apiBase = "http://localhost:5001", currentUser
                                 );})}
                             </tbody>
                         </table>
+                        {nextCursor && (
+                            <button className="primary-btn sm" onClick={loadMore} disabled={loadingMore}>
+                                {loadingMore ? "กำลังโหลด..." : "โหลดเพิ่ม"}
+                            </button>
+                        )}
                     </div>
                 </section>
 